@@ -0,0 +1,345 @@
+"""
+日記フォルダの増分バックアップ（スナップショット）
+
+バックアップ先のフォルダに、ファイルの内容のハッシュ（SHA-256）を名前にしたオブジェクトと、
+各時点のファイルの一覧（スナップショット）を保存する。内容が同じファイルは1回しか保存しないため、
+2回目以降のバックアップでは変わったファイルの分だけが増える。前回のスナップショットと
+更新日時・サイズが同じファイルはハッシュも計算し直さない。
+
+バックアップ先の構成:
+    objects/ab/abcdef...       ファイルの内容（ハッシュの先頭2文字ごとのフォルダに置く）
+    snapshots/<ID>.json        スナップショット（相対パス -> [ハッシュ, サイズ, 更新日時]）
+
+日記フォルダのうち、日記ファイル・メタデータ・画像を対象にする（索引キャッシュなどの内部ファイルは除く）。
+"""
+import os
+import re
+import json
+import hashlib
+import datetime
+
+from diary_core import INTERNAL_DIR_NAME, write_json_atomic
+
+# スナップショットの形式のバージョン
+SNAPSHOT_VERSION = 1
+
+# スナップショットIDの日時の形式
+SNAPSHOT_ID_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def _file_digest(file_path):
+    """
+    ファイルの内容のSHA-256を返す
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _object_path(backup_dir, digest):
+    """
+    ハッシュに対応するオブジェクトのパスを返す
+    """
+    return os.path.join(backup_dir, "objects", digest[:2], digest)
+
+
+def _iter_backup_files(diary_folder):
+    """
+    バックアップの対象になるファイルを (日記フォルダからの相対パス, os.DirEntry) で返す
+    相対パスの区切りは、OSによらず "/" にする
+    """
+    stack = [("", diary_folder)]
+    while stack:
+        prefix, folder = stack.pop()
+        with os.scandir(folder) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+                # 内部フォルダ（索引キャッシュ・ロック・変更履歴）と書き込み途中の一時ファイルは除く
+                if (not prefix and name == INTERNAL_DIR_NAME) or name.endswith(".tmp"):
+                    continue
+                if dir_entry.is_dir(follow_symlinks=False):
+                    stack.append((prefix + name + "/", dir_entry.path))
+                elif dir_entry.is_file():
+                    yield prefix + name, dir_entry
+
+
+def list_snapshots(backup_dir):
+    """
+    スナップショットのIDを古い順に返す
+    """
+    folder = os.path.join(backup_dir, "snapshots")
+    if not os.path.isdir(folder):
+        return []
+    return sorted(file_name[:-5] for file_name in os.listdir(folder) if file_name.endswith(".json"))
+
+
+def load_snapshot(backup_dir, snapshot_id):
+    """
+    スナップショットを読み込む
+
+    Raises:
+        ValueError: スナップショットがないか、形式が正しくない場合
+    """
+    path = os.path.join(backup_dir, "snapshots", f"{snapshot_id}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except OSError:
+        raise ValueError(f"スナップショットが見つかりません: {snapshot_id}")
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"対応していない形式のスナップショットです: {snapshot_id}")
+    return snapshot
+
+
+def create_snapshot(diary_folder, backup_dir, progress_callback=None):
+    """
+    日記フォルダのスナップショットを作る
+
+    前回のスナップショットと更新日時・サイズが同じファイルは前回のハッシュを使い、
+    バックアップ先にまだないオブジェクトだけを書き込む。
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        backup_dir (str): バックアップ先のフォルダ
+        progress_callback (callable, optional): progress_callback(処理済み数, 総数) の形で呼ばれる
+
+    Returns:
+        dict: スナップショットID ("snapshot")、ファイル数 ("files")、新しく保存したオブジェクトの数
+              ("new_objects") とバイト数 ("new_bytes")、ハッシュを計算したファイルの数 ("hashed")
+    """
+    snapshots = list_snapshots(backup_dir)
+    previous = {}
+    if snapshots:
+        try:
+            previous = load_snapshot(backup_dir, snapshots[-1])["files"]
+        except ValueError:
+            previous = {}
+
+    files = list(_iter_backup_files(diary_folder))
+    result = {"snapshot": None, "files": len(files), "new_objects": 0, "new_bytes": 0, "hashed": 0}
+    manifest = {}
+    for done, (rel_path, dir_entry) in enumerate(files, 1):
+        stat = dir_entry.stat()
+        known = previous.get(rel_path)
+        if known and known[1] == stat.st_size and known[2] == stat.st_mtime_ns and \
+                os.path.exists(_object_path(backup_dir, known[0])):
+            digest = known[0]
+        else:
+            digest = _file_digest(dir_entry.path)
+            result["hashed"] += 1
+            object_path = _object_path(backup_dir, digest)
+            if not os.path.exists(object_path):
+                _store_object(dir_entry.path, object_path, digest)
+                result["new_objects"] += 1
+                result["new_bytes"] += stat.st_size
+        manifest[rel_path] = [digest, stat.st_size, stat.st_mtime_ns]
+
+        if progress_callback:
+            progress_callback(done, len(files))
+
+    now = datetime.datetime.now()
+    snapshot_id = now.strftime(SNAPSHOT_ID_FORMAT)
+    counter = 1
+    while snapshot_id in snapshots or os.path.exists(os.path.join(backup_dir, "snapshots", f"{snapshot_id}.json")):
+        snapshot_id = f"{now.strftime(SNAPSHOT_ID_FORMAT)}-{counter}"
+        counter += 1
+
+    snapshot_folder = os.path.join(backup_dir, "snapshots")
+    if not os.path.exists(snapshot_folder):
+        os.makedirs(snapshot_folder)
+    write_json_atomic(os.path.join(snapshot_folder, f"{snapshot_id}.json"), {
+        "version": SNAPSHOT_VERSION,
+        "created": now.isoformat(timespec="seconds"),
+        "source": os.path.abspath(diary_folder),
+        "files": manifest
+    }, indent=None)
+    result["snapshot"] = snapshot_id
+    return result
+
+
+def _store_object(source_path, object_path, digest):
+    """
+    ファイルをオブジェクトとして保存する（コピー中に変わった場合は ValueError）
+    """
+    folder = os.path.dirname(object_path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    temp_path = f"{object_path}.{os.getpid()}.tmp"
+    hasher = hashlib.sha256()
+    with open(source_path, 'rb') as source, open(temp_path, 'wb') as dest:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            hasher.update(chunk)
+            dest.write(chunk)
+    if hasher.hexdigest() != digest:
+        os.remove(temp_path)
+        raise ValueError(f"バックアップ中にファイルが変更されました: {source_path}")
+    os.replace(temp_path, object_path)
+
+
+def verify_snapshots(backup_dir, snapshot_ids=None, full=True):
+    """
+    スナップショットが参照するオブジェクトがそろっているか確認する
+
+    Args:
+        backup_dir (str): バックアップ先のフォルダ
+        snapshot_ids (list, optional): 確認するスナップショット（Noneの場合はすべて）
+        full (bool): Trueの場合は内容のハッシュも確認し、Falseの場合は存在とサイズだけを確認する
+
+    Returns:
+        dict: 確認したスナップショット数 ("snapshots")、オブジェクト数 ("objects")、
+              問題のリスト ("problems"、[スナップショットID, 相対パス, 内容] のリスト)
+    """
+    if snapshot_ids is None:
+        snapshot_ids = list_snapshots(backup_dir)
+
+    result = {"snapshots": 0, "objects": 0, "problems": []}
+    # 同じオブジェクトは1回だけ確認する（ハッシュ -> 問題の内容、問題がなければNone）
+    checked = {}
+    for snapshot_id in snapshot_ids:
+        try:
+            snapshot = load_snapshot(backup_dir, snapshot_id)
+        except ValueError as e:
+            result["problems"].append([snapshot_id, "", str(e)])
+            continue
+        result["snapshots"] += 1
+
+        for rel_path, (digest, size, _mtime) in sorted(snapshot["files"].items()):
+            if digest not in checked:
+                checked[digest] = _check_object(backup_dir, digest, size, full)
+            if checked[digest]:
+                result["problems"].append([snapshot_id, rel_path, checked[digest]])
+    result["objects"] = len(checked)
+    return result
+
+
+def _check_object(backup_dir, digest, size, full):
+    """
+    オブジェクトを確認し、問題があればその内容を返す（問題がなければNone）
+    """
+    object_path = _object_path(backup_dir, digest)
+    try:
+        actual_size = os.path.getsize(object_path)
+    except OSError:
+        return "オブジェクトがありません"
+    if actual_size != size:
+        return "サイズが一致しません"
+    if full and _file_digest(object_path) != digest:
+        return "内容が壊れています"
+    return None
+
+
+def prune_snapshots(backup_dir, keep):
+    """
+    新しいものから keep 個を残してスナップショットを削除し、どこからも参照されなくなった
+    オブジェクトを削除する
+
+    Returns:
+        dict: 削除したスナップショット数 ("snapshots") とオブジェクト数 ("objects")
+    """
+    snapshots = list_snapshots(backup_dir)
+    removed = snapshots[:-keep] if keep > 0 else []
+    for snapshot_id in removed:
+        os.remove(os.path.join(backup_dir, "snapshots", f"{snapshot_id}.json"))
+
+    result = {"snapshots": len(removed), "objects": 0}
+    if not removed:
+        return result
+
+    referenced = set()
+    for snapshot_id in snapshots[len(removed):]:
+        referenced.update(digest for digest, _size, _mtime in load_snapshot(backup_dir, snapshot_id)["files"].values())
+    objects_folder = os.path.join(backup_dir, "objects")
+    for prefix in os.listdir(objects_folder):
+        folder = os.path.join(objects_folder, prefix)
+        for digest in os.listdir(folder):
+            if digest not in referenced:
+                os.remove(os.path.join(folder, digest))
+                result["objects"] += 1
+    return result
+
+
+def snapshot_at(backup_dir, at=None):
+    """
+    指定した日時の時点で最新のスナップショットIDを返す
+
+    Args:
+        at (str, optional): 日時（yyyy-MM-dd または yyyy-MM-dd HH:MM[:SS]）。Noneの場合は最新
+
+    Returns:
+        str: スナップショットID
+
+    Raises:
+        ValueError: 該当するスナップショットがない場合
+    """
+    snapshots = list_snapshots(backup_dir)
+    if at is not None:
+        moment = _parse_moment(at)
+        snapshots = [snapshot_id for snapshot_id in snapshots
+                     if datetime.datetime.strptime(snapshot_id[:15], SNAPSHOT_ID_FORMAT) <= moment]
+    if not snapshots:
+        raise ValueError("該当するスナップショットがありません")
+    return snapshots[-1]
+
+
+def _parse_moment(text):
+    """
+    日時の文字列を読み取る（日付だけの場合はその日の終わり）
+    """
+    for date_format in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            moment = datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        if date_format == "%Y-%m-%d":
+            moment = moment.replace(hour=23, minute=59, second=59)
+        return moment
+    raise ValueError(f"日時は yyyy-MM-dd または yyyy-MM-dd HH:MM の形式で指定してください: {text}")
+
+
+def entry_history(backup_dir, file_key):
+    """
+    日記1件の、スナップショットごとの版を返す（内容が前の版と同じスナップショットは除く）
+
+    Returns:
+        list: [スナップショットID, ハッシュ（削除されていた場合はNone）] のリスト（古い順）
+    """
+    rel_path = f"{file_key}.json"
+    history = []
+    last_digest = None
+    for snapshot_id in list_snapshots(backup_dir):
+        entry = load_snapshot(backup_dir, snapshot_id)["files"].get(rel_path)
+        digest = entry[0] if entry else None
+        if digest != last_digest:
+            history.append([snapshot_id, digest])
+            last_digest = digest
+    return history
+
+
+def read_backup_entry(backup_dir, file_key, snapshot_id):
+    """
+    スナップショットから日記1件と、その日記が参照する画像を読み出す
+
+    Returns:
+        tuple: (日記ファイルの内容のバイト列, {画像の相対パス: オブジェクトのパス})
+
+    Raises:
+        ValueError: スナップショットにその日記がない場合
+    """
+    files = load_snapshot(backup_dir, snapshot_id)["files"]
+    entry = files.get(f"{file_key}.json")
+    if entry is None:
+        raise ValueError(f"スナップショット {snapshot_id} に日記がありません: {file_key}")
+    with open(_object_path(backup_dir, entry[0]), 'rb') as f:
+        content = f.read()
+
+    images = {}
+    try:
+        html = json.loads(content.decode('utf-8')).get("content", "")
+    except ValueError:
+        html = ""
+    for src in re.findall(r'src="([^"]+)"', html):
+        if src in files:
+            images[src] = _object_path(backup_dir, files[src][0])
+    return content, images
@@ -0,0 +1,578 @@
+"""
+日記をコマンドラインから検索・集計・エクスポート・インポートするツール
+
+GUI（PyQt5）を読み込まずに diary_core だけで動作するため、スクリプトや
+cronからも素早く呼び出せる。日記の索引は日記フォルダ内のキャッシュに保存し、
+次回はファイルの更新日時とサイズが変わった日記だけを読み直す。
+
+使い方の例:
+    ./diary search 旅行 --from 2024-01-01 --format json
+    ./diary search --query 'tag:仕事 mood:疲れた days:90' --save 最近の仕事
+    ./diary saved 最近の仕事
+    ./diary stats --year 2024
+    ./diary list --sort old
+    ./diary export jsonl backup.jsonl --tag 仕事
+    ./diary import old_diary.zip
+    ./diary changes --since 120:8410
+    ./diary backup create /mnt/backup/diary --keep 30
+    ./diary backup restore /mnt/backup/diary 2024-05-01_旅行 --at 2024-06-01
+    ./diary sync /mnt/share/diary_entries
+    ./diary serve --port 8765
+
+（python diary_cli.py でも同じように実行できる）
+"""
+import sys
+import json
+import argparse
+import datetime
+
+from diary_core import DiaryStore, is_valid_date
+
+# 一覧表示でタイトルを切り詰める幅（半角文字数）
+TITLE_COLUMN_WIDTH = 40
+
+# 月の表示名
+MONTH_NAMES = ["1月", "2月", "3月", "4月", "5月", "6月", "7月", "8月", "9月", "10月", "11月", "12月"]
+
+
+def display_width(text):
+    """
+    端末での表示幅を返す（全角文字は2として数える）
+    """
+    import unicodedata
+    return sum(2 if unicodedata.east_asian_width(ch) in ('F', 'W') else 1 for ch in text)
+
+
+def fit_width(text, width):
+    """
+    表示幅が width を超える場合は切り詰めて "…" を付ける
+    """
+    if display_width(text) <= width:
+        return text
+    result = ""
+    for ch in text:
+        if display_width(result + ch) > width - 1:
+            break
+        result += ch
+    return result + "…"
+
+
+def format_table(headers, rows):
+    """
+    全角文字を考慮して列をそろえた表の文字列を返す
+
+    Args:
+        headers (list): 見出し
+        rows (list): 各行の値のリスト
+
+    Returns:
+        str: 表の文字列
+    """
+    widths = [display_width(header) for header in headers]
+    for row in rows:
+        for i, value in enumerate(row):
+            widths[i] = max(widths[i], display_width(value))
+
+    def format_row(values):
+        cells = [value + " " * (widths[i] - display_width(value)) for i, value in enumerate(values)]
+        return "  ".join(cells).rstrip()
+
+    lines = [format_row(headers), "  ".join("-" * width for width in widths)]
+    lines.extend(format_row(row) for row in rows)
+    return "\n".join(lines)
+
+
+def entry_summary(record, preview_length=0):
+    """
+    索引レコードから出力用の項目を取り出す
+    """
+    summary = {
+        "file_key": record["file_key"],
+        "date": record["date"],
+        "title": record["title"],
+        "mood": record["mood"],
+        "tags": record["tags"],
+        "last_modified": record["last_modified"]
+    }
+    if preview_length:
+        text = record["text"]
+        summary["preview"] = text[:preview_length] + "..." if len(text) > preview_length else text
+    return summary
+
+
+def print_json(data):
+    """
+    JSONとして出力する
+    """
+    json.dump(data, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+def print_entries(records, output_format):
+    """
+    日記の一覧を表またはJSONで出力する
+    """
+    if output_format == "json":
+        print_json([entry_summary(record, 100) for record in records])
+        return
+
+    rows = [[record["date"], fit_width(record["title"], TITLE_COLUMN_WIDTH), record["mood"], ", ".join(record["tags"])]
+            for record in records]
+    print(format_table(["日付", "タイトル", "気分", "タグ"], rows))
+    print(f"\n{len(records)}件")
+
+
+def print_counts(title, counts, limit=None):
+    """
+    件数の表を多い順に出力する
+    """
+    items = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+    if limit:
+        items = items[:limit]
+    if items:
+        print(f"\n[{title}]")
+        print(format_table(["項目", "件数"], [[name, f"{count}件"] for name, count in items]))
+
+
+def check_date(value):
+    """
+    argparse用: yyyy-MM-dd 形式の日付を検証する
+    """
+    if not is_valid_date(value):
+        raise argparse.ArgumentTypeError(f"日付は yyyy-MM-dd 形式で指定してください: {value}")
+    return value
+
+
+def cmd_search(store, args):
+    """
+    キーワードや条件、検索式で日記を検索する
+    """
+    if args.save and args.query is None:
+        print("--save には --query で検索式を指定してください", file=sys.stderr)
+        return 2
+    if args.query is not None:
+        from diary_query import QueryError
+
+        try:
+            if args.save:
+                count = store.save_search(args.save, args.query, args.case_sensitive, not args.no_fold)
+                print(f"検索を保存しました: {args.save}（{count}件）")
+                return 0
+            if args.explain:
+                print(store.explain(args.query, args.case_sensitive, not args.no_fold))
+                return 0
+            records = store.query(args.query, args.case_sensitive, not args.no_fold)
+        except QueryError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+    elif args.regex:
+        from diary_query import QueryError
+
+        if not args.keyword:
+            print("正規表現を指定してください", file=sys.stderr)
+            return 2
+        try:
+            result = store.regex_search(args.keyword, args.date_from, args.date_to, args.tag, args.mood,
+                                        args.title_only, args.case_sensitive, limit=args.limit or None)
+        except QueryError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        if result["timed_out"]:
+            print("制限時間を過ぎたため検索を打ち切りました", file=sys.stderr)
+        records = [record for record, _ in result["matches"]]
+    elif (args.date_from or args.date_to or args.tag or args.mood or args.title_only or args.case_sensitive or
+          args.exact or args.no_fold):
+        records = store.advanced_search(args.keyword or "", args.date_from, args.date_to, args.tag, args.mood,
+                                        args.title_only, args.case_sensitive, args.exact, not args.no_fold)
+    elif args.keyword:
+        records = store.search(args.keyword)
+    else:
+        print("キーワードか検索条件を指定してください", file=sys.stderr)
+        return 2
+
+    if args.limit:
+        records = records[:args.limit]
+    print_entries(records, args.format)
+    return 0
+
+
+def cmd_saved(store, args):
+    """
+    保存した検索の一覧を表示する（名前を指定した場合はその検索の結果を表示・削除する）
+    """
+    if not args.name:
+        saved_searches = store.saved_searches()
+        if args.format == "json":
+            print_json(saved_searches)
+        else:
+            print(format_table(["名前", "検索式", "件数"],
+                               [[search["name"], search["query"], f"{search['count']}件"] for search in saved_searches]))
+        return 0
+
+    if args.delete:
+        if not store.delete_saved_search(args.name):
+            print(f"保存した検索が見つかりません: {args.name}", file=sys.stderr)
+            return 1
+        print(f"保存した検索を削除しました: {args.name}")
+        return 0
+
+    records = store.saved_search_entries(args.name)
+    if records is None:
+        print(f"保存した検索が見つかりません: {args.name}", file=sys.stderr)
+        return 1
+    if args.limit:
+        records = records[:args.limit]
+    print_entries(records, args.format)
+    return 0
+
+
+def cmd_list(store, args):
+    """
+    日記の一覧を表示する
+    """
+    records = store.entries()
+
+    if args.filter:
+        filter_text = args.filter.lower()
+        records = [record for record in records
+                   if filter_text in record["title"].lower() or
+                   filter_text in record["date"] or
+                   filter_text in ", ".join(record["tags"]).lower() or
+                   filter_text in record["text"][:100].lower()]
+
+    if args.sort == "old":
+        records.sort(key=lambda record: record["date"])
+    elif args.sort == "title":
+        records.sort(key=lambda record: record["title"].lower())
+    else:
+        records.sort(key=lambda record: record["date"], reverse=True)
+
+    if args.limit:
+        records = records[:args.limit]
+    print_entries(records, args.format)
+    return 0
+
+
+def cmd_stats(store, args):
+    """
+    月間または年間の統計を表示する
+    """
+    if args.year:
+        stats = store.year_stats(args.year)
+        period = f"{args.year}年"
+    else:
+        month = args.month or datetime.date.today().strftime("%Y-%m")
+        stats = store.month_stats(month)
+        period = month
+
+    if args.format == "json":
+        print_json(dict(stats, period=period))
+        return 0
+
+    print(f"{period}の統計")
+    print(f"日記数: {stats['count']}件")
+    if "months" in stats:
+        print("\n[月別の日記数]")
+        print(format_table(["月", "件数"], [[MONTH_NAMES[int(month_str[5:7]) - 1], f"{count}件"]
+                                          for month_str, count in sorted(stats["months"].items())]))
+    print_counts("気分の分布", stats["moods"])
+    print_counts("よく使われたタグ", stats["tags"], 10)
+    return 0
+
+
+def cmd_export(store, args):
+    """
+    日記をZIP・静的サイト・JSON Linesとしてエクスポートする
+    """
+    if args.kind == "zip":
+        result = store.export_zip(args.output, args.date_from, args.date_to, args.tag)
+        summary = {"entries": result["entries"], "images": result["images"]}
+    elif args.kind == "site":
+        result = store.export_site(args.output)
+        summary = {"rendered": result["rendered"], "unchanged": result["unchanged"]}
+    elif args.output == "-":
+        # 標準出力に書き出す場合は結果の表示を標準エラー出力に回す
+        count = store.export_jsonl(sys.stdout, args.date_from, args.date_to, args.tag)
+        print(f"{count}件の日記をエクスポートしました", file=sys.stderr)
+        return 0
+    else:
+        summary = {"entries": store.export_jsonl(args.output, args.date_from, args.date_to, args.tag)}
+
+    if args.format == "json":
+        print_json(dict(summary, output=args.output))
+    else:
+        print(f"{args.output} にエクスポートしました: " + ", ".join(f"{key}={value}" for key, value in summary.items()))
+    return 0
+
+
+def cmd_import(store, args):
+    """
+    ファイルやフォルダから日記をまとめてインポートする
+    """
+    result = store.bulk_import(args.paths)
+    if args.format == "json":
+        print_json(result)
+    else:
+        print(f"インポート: {result['imported']}件 / 重複のためスキップ: {result['duplicates']}件 / "
+              f"画像: {result['images']}枚 / エラー: {result['errors']}件")
+    return 1 if result["errors"] else 0
+
+
+def cmd_changes(store, args):
+    """
+    変更履歴（日記の作成・更新・削除、お気に入り・タグ・設定の変更）を表示する
+    最後に表示されるカーソルを次回 --since に渡すと、その後の変更だけを表示する
+    """
+    events, cursor = store.changes_since(args.since, args.limit or None)
+    if args.format == "json":
+        print_json({"changes": events, "cursor": cursor})
+        return 0
+
+    rows = [[str(event["seq"]), event["time"].replace("T", " "), event["op"],
+             event.get("file_key") or event.get("tag") or event.get("key") or ""]
+            for event in events]
+    print(format_table(["番号", "日時", "操作", "対象"], rows))
+    print(f"\n{len(events)}件  カーソル: {cursor}")
+    return 0
+
+
+def cmd_backup_create(store, args):
+    """
+    増分バックアップ（スナップショット）を作る
+    """
+    result = store.backup(args.target)
+    if args.keep:
+        from diary_backup import prune_snapshots
+        pruned = prune_snapshots(args.target, args.keep)
+        result["pruned_snapshots"] = pruned["snapshots"]
+        result["pruned_objects"] = pruned["objects"]
+
+    if args.format == "json":
+        print_json(result)
+    else:
+        print(f"スナップショット {result['snapshot']} を作成しました: {result['files']}ファイル / "
+              f"新しく保存: {result['new_objects']}ファイル（{result['new_bytes']:,}バイト）")
+        if args.keep:
+            print(f"古いスナップショットを{result['pruned_snapshots']}個削除しました")
+    return 0
+
+
+def cmd_backup_list(store, args):
+    """
+    スナップショットの一覧、または日記1件の版の一覧を表示する
+    """
+    from diary_backup import list_snapshots, entry_history
+    if args.entry:
+        rows = [[snapshot_id, digest[:12] if digest else "（削除）"] for snapshot_id, digest in entry_history(args.target, args.entry)]
+        headers = ["スナップショット", "内容"]
+    else:
+        rows = [[snapshot_id] for snapshot_id in list_snapshots(args.target)]
+        headers = ["スナップショット"]
+
+    if args.format == "json":
+        print_json([dict(zip(("snapshot", "digest"), row)) for row in rows])
+    else:
+        print(format_table(headers, rows))
+    return 0
+
+
+def cmd_backup_verify(store, args):
+    """
+    スナップショットが参照するファイルがそろっていて壊れていないか確認する
+    """
+    from diary_backup import verify_snapshots
+    result = verify_snapshots(args.target, [args.snapshot] if args.snapshot else None, not args.quick)
+    if args.format == "json":
+        print_json(result)
+    else:
+        for snapshot_id, rel_path, problem in result["problems"]:
+            print(f"{snapshot_id}: {rel_path} - {problem}")
+        print(f"{result['snapshots']}個のスナップショット・{result['objects']}個のファイルを確認しました: "
+              f"問題 {len(result['problems'])}件")
+    return 1 if result["problems"] else 0
+
+
+def cmd_backup_restore(store, args):
+    """
+    バックアップから日記1件を復元する
+    """
+    result = store.restore_entry(args.target, args.file_key, args.at, args.snapshot)
+    if args.format == "json":
+        print_json(dict(result, file_key=args.file_key))
+    else:
+        print(f"{args.file_key} をスナップショット {result['snapshot']} から復元しました（画像: {result['images']}枚）")
+    return 0
+
+
+def cmd_sync(store, args):
+    """
+    別の日記フォルダと双方向に同期する（diary_sync を参照）
+    """
+    from diary_sync import sync_folders
+    remote_store = DiaryStore(args.remote)
+    try:
+        result = sync_folders(store, remote_store, args.dry_run)
+    finally:
+        try:
+            remote_store.save_index_cache()
+        except OSError:
+            pass
+
+    if args.format == "json":
+        print_json(result)
+        return 0
+
+    labels = [("to_local", "こちらへコピー"), ("to_remote", "相手へコピー"), ("delete_local", "こちらで削除"),
+              ("delete_remote", "相手で削除"), ("conflicts", "競合（競合コピーを作成）")]
+    rows = [[file_key, label] for key, label in labels for file_key in result[key]]
+    if rows:
+        print(format_table(["日記", "操作"], rows))
+        print()
+    for name, copy_name in zip(result["image_conflicts"], result["image_conflict_copies"]):
+        print(f"内容の異なる同名の画像があるため、片方を競合コピーとして残しました: {name} -> {copy_name}")
+    prefix = "（確認のみ）" if args.dry_run else ""
+    print(f"{prefix}日記: こちらへ{len(result['to_local'])}件 / 相手へ{len(result['to_remote'])}件 / "
+          f"削除{len(result['delete_local']) + len(result['delete_remote'])}件 / 競合{len(result['conflicts'])}件、"
+          f"画像: こちらへ{result['images_to_local']}枚 / 相手へ{result['images_to_remote']}枚")
+    return 0
+
+
+def cmd_serve(store, args):
+    """
+    読み取り専用のJSON APIサーバーを起動する（diary_server を参照）
+    """
+    from diary_server import serve
+    return serve(store.diary_folder, args.port)
+
+
+def build_parser():
+    """
+    コマンドライン引数のパーサーを作る
+    """
+    parser = argparse.ArgumentParser(prog="diary", description="日記をコマンドラインから検索・集計・エクスポートする")
+    parser.add_argument("--dir", default="diary_entries", help="日記フォルダ（既定: diary_entries）")
+
+    # 各サブコマンドで共通の出力形式オプション
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=["table", "json"], default="table", help="出力形式（既定: table）")
+
+    # 期間とタグの絞り込みオプション
+    scope = argparse.ArgumentParser(add_help=False)
+    scope.add_argument("--from", dest="date_from", type=check_date, metavar="DATE", help="開始日（yyyy-MM-dd）")
+    scope.add_argument("--to", dest="date_to", type=check_date, metavar="DATE", help="終了日（yyyy-MM-dd）")
+    scope.add_argument("--tag", help="タグ")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    search_parser = subparsers.add_parser("search", parents=[common, scope], help="日記を検索する")
+    search_parser.add_argument("keyword", nargs="?", help="検索キーワード")
+    search_parser.add_argument("--mood", help="気分")
+    search_parser.add_argument("--title-only", action="store_true", help="タイトルのみを検索する")
+    search_parser.add_argument("--case-sensitive", action="store_true", help="大文字/小文字を区別する")
+    search_parser.add_argument("--exact", action="store_true", help="完全一致で検索する")
+    search_parser.add_argument("--no-fold", action="store_true",
+                               help="ひらがな/カタカナ・全角/半角を区別する（既定では区別しない）")
+    search_parser.add_argument("--regex", "-E", action="store_true", help="キーワードを正規表現として検索する")
+    search_parser.add_argument("--limit", type=int, default=0, help="表示する最大件数")
+    search_parser.add_argument("--query", "-q", metavar="QUERY",
+                               help='検索式（例: \'tag:旅行 after:2024-01 "海の家" -雨\'。指定した場合は他の条件を無視する）')
+    search_parser.add_argument("--explain", action="store_true", help="検索式の実行計画を表示する")
+    search_parser.add_argument("--save", metavar="NAME", help="検索式に名前を付けて保存する（saved で結果を表示できる）")
+    search_parser.set_defaults(func=cmd_search)
+
+    saved_parser = subparsers.add_parser("saved", parents=[common], help="保存した検索の一覧・結果を表示する")
+    saved_parser.add_argument("name", nargs="?", help="結果を表示する検索の名前（省略すると一覧と件数を表示する）")
+    saved_parser.add_argument("--delete", action="store_true", help="保存した検索を削除する")
+    saved_parser.add_argument("--limit", type=int, default=0, help="表示する最大件数")
+    saved_parser.set_defaults(func=cmd_saved)
+
+    list_parser = subparsers.add_parser("list", parents=[common], help="日記の一覧を表示する")
+    list_parser.add_argument("--sort", choices=["new", "old", "title"], default="new", help="並べ替え（既定: new）")
+    list_parser.add_argument("--filter", help="タイトル・日付・タグ・本文の先頭で絞り込む")
+    list_parser.add_argument("--limit", type=int, default=0, help="表示する最大件数")
+    list_parser.set_defaults(func=cmd_list)
+
+    stats_parser = subparsers.add_parser("stats", parents=[common], help="月間・年間の統計を表示する")
+    period = stats_parser.add_mutually_exclusive_group()
+    period.add_argument("--month", help="対象の月（yyyy-MM、既定: 今月）")
+    period.add_argument("--year", help="対象の年（yyyy）")
+    stats_parser.set_defaults(func=cmd_stats)
+
+    export_parser = subparsers.add_parser("export", parents=[common, scope], help="日記をエクスポートする")
+    export_parser.add_argument("kind", choices=["zip", "site", "jsonl"], help="形式（zip: 画像付きZIP、site: 静的サイト、jsonl: JSON Lines）")
+    export_parser.add_argument("output", help="出力先のファイルまたはフォルダ（jsonl で - を指定すると標準出力）")
+    export_parser.set_defaults(func=cmd_export)
+
+    import_parser = subparsers.add_parser("import", parents=[common], help="日記をインポートする")
+    import_parser.add_argument("paths", nargs="+", help="ZIP・JSON Lines・JSON・HTML・テキストファイルまたはフォルダ")
+    import_parser.set_defaults(func=cmd_import)
+
+    changes_parser = subparsers.add_parser("changes", parents=[common], help="変更履歴を表示する")
+    changes_parser.add_argument("--since", metavar="CURSOR", help="前回表示されたカーソルより後の変更だけを表示する")
+    changes_parser.add_argument("--limit", type=int, default=0, help="表示する最大件数")
+    changes_parser.set_defaults(func=cmd_changes)
+
+    backup_parser = subparsers.add_parser("backup", help="増分バックアップを作成・確認・復元する")
+    backup_commands = backup_parser.add_subparsers(dest="backup_command", metavar="action")
+    backup_commands.required = True
+
+    create_parser = backup_commands.add_parser("create", parents=[common], help="スナップショットを作る")
+    create_parser.add_argument("target", help="バックアップ先のフォルダ")
+    create_parser.add_argument("--keep", type=int, default=0, help="残すスナップショットの数（古いものから削除する）")
+    create_parser.set_defaults(func=cmd_backup_create)
+
+    backup_list_parser = backup_commands.add_parser("list", parents=[common], help="スナップショットの一覧を表示する")
+    backup_list_parser.add_argument("target", help="バックアップ先のフォルダ")
+    backup_list_parser.add_argument("--entry", metavar="FILE_KEY", help="日記1件の版の一覧を表示する")
+    backup_list_parser.set_defaults(func=cmd_backup_list)
+
+    verify_parser = backup_commands.add_parser("verify", parents=[common], help="バックアップを検証する")
+    verify_parser.add_argument("target", help="バックアップ先のフォルダ")
+    verify_parser.add_argument("--snapshot", help="検証するスナップショット（既定: すべて）")
+    verify_parser.add_argument("--quick", action="store_true", help="内容のハッシュは確認せず、存在とサイズだけを確認する")
+    verify_parser.set_defaults(func=cmd_backup_verify)
+
+    restore_parser = backup_commands.add_parser("restore", parents=[common], help="日記1件を復元する")
+    restore_parser.add_argument("target", help="バックアップ先のフォルダ")
+    restore_parser.add_argument("file_key", help="復元する日記のファイルキー（ファイル名から .json を除いたもの）")
+    restore_parser.add_argument("--at", metavar="DATETIME", help="この日時（yyyy-MM-dd [HH:MM]）の時点の版を復元する")
+    restore_parser.add_argument("--snapshot", help="復元に使うスナップショット")
+    restore_parser.set_defaults(func=cmd_backup_restore)
+
+    sync_parser = subparsers.add_parser("sync", parents=[common], help="別の日記フォルダと双方向に同期する")
+    sync_parser.add_argument("remote", help="同期する相手の日記フォルダ（共有フォルダなど）")
+    sync_parser.add_argument("--dry-run", action="store_true", help="何も書き込まず、行う操作だけを表示する")
+    sync_parser.set_defaults(func=cmd_sync)
+
+    serve_parser = subparsers.add_parser("serve", help="読み取り専用のJSON APIを 127.0.0.1 で公開する")
+    serve_parser.add_argument("--port", type=int, default=8765, help="ポート番号（既定: 8765）")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    コマンドラインツールのエントリーポイント
+
+    Returns:
+        int: 終了コード
+    """
+    args = build_parser().parse_args(argv)
+
+    store = DiaryStore(args.dir)
+    try:
+        return args.func(store, args)
+    except (OSError, ValueError) as e:
+        print(f"エラー: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        try:
+            store.save_index_cache()
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3173 @@
+"""
+日記データの保存・索引・検索・統計・インポート/エクスポートを行うモジュール
+
+GUI（PyQt5）に依存せず標準ライブラリだけで動作するため、コマンドラインや
+他のスクリプトからも読み込んで使える。起動を速くするため、一部の処理でしか
+使わないモジュールは関数の中で読み込む。
+"""
+import os
+import json
+import re
+import time
+import datetime
+import threading
+import bisect
+
+# メタデータファイル名
+METADATA_FILE_NAME = "metadata.json"
+
+# 気分の初期値
+DEFAULT_MOODS = ["楽しい", "普通", "悲しい", "疲れた", "興奮", "不安", "満足"]
+
+# 日付（yyyy-MM-dd）の形式
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# アプリが内部で使うファイルを置くフォルダ（日記フォルダ内の隠しフォルダ）
+INTERNAL_DIR_NAME = ".diary"
+
+# 索引キャッシュのファイル名と形式のバージョン
+INDEX_CACHE_FILE_NAME = "index.json"
+INDEX_CACHE_VERSION = 3
+
+# 索引キャッシュに保存するレコードの項目（読み込みを速くするため、辞書ではなくこの順のリストで保存する）
+# folded は検索用に正規化したタイトル・本文・タグ（diary_search.fold_text を参照）
+INDEX_CACHE_FIELDS = ("date", "title", "mood", "tags", "last_modified", "revision", "text", "error", "folded")
+
+# 変更履歴（すべての書き込みを1行1件で追記するログ）のファイル名
+CHANGE_LOG_FILE_NAME = "changes.jsonl"
+
+# 日記ごとの過去の版を置くフォルダの名前（内部フォルダに置く）
+HISTORY_DIR_NAME = "history"
+
+# 書き込みを排他するロックファイルの名前（内部フォルダに置く）と、ロックを待つ最長の時間（秒）
+WRITE_LOCK_FILE_NAME = "write.lock"
+WRITE_LOCK_TIMEOUT = 10.0
+
+
+def default_metadata():
+    """
+    メタデータの初期値を返す
+    """
+    return {
+        "tags": [],
+        "moods": list(DEFAULT_MOODS),
+        "favorites": [],
+        "theme": "light"
+    }
+
+
+def is_entry_file(file_name):
+    """
+    日記ファイルかどうかを判定する（メタデータや隠しファイルは除く）
+    """
+    return file_name.endswith('.json') and file_name != METADATA_FILE_NAME and not file_name.startswith('.')
+
+
+def entry_date_str(file_key):
+    """
+    ファイルキーから日付部分を取り出す
+    新しい命名形式 (yyyy-MM-dd_title-slug) と旧形式 (yyyy-MM-dd) の両方に対応する
+    """
+    return file_key.split('_')[0]
+
+
+def is_valid_date(date_str):
+    """
+    yyyy-MM-dd 形式の有効な日付かどうかを判定する
+    """
+    if not date_str or not DATE_PATTERN.match(date_str):
+        return False
+    try:
+        datetime.date(int(date_str[:4]), int(date_str[5:7]), int(date_str[8:10]))
+        return True
+    except ValueError:
+        return False
+
+
+def format_jp_date(date_str):
+    """
+    yyyy-MM-dd 形式の日付を yyyy年MM月dd日 形式に変換する
+    """
+    parts = date_str.split('-')
+    if len(parts) != 3:
+        return date_str
+    return f"{parts[0]}年{parts[1]}月{parts[2]}日"
+
+
+def html_to_plain_text(html_content):
+    """
+    HTMLをプレーンテキストに変換する（Qtを使わない版）
+    ブロック要素ごとに改行し、head・style・script の中身は無視する
+    """
+    from html.parser import HTMLParser
+
+    class _PlainTextParser(HTMLParser):
+        BLOCK_TAGS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "table"}
+        SKIP_TAGS = {"head", "style", "script", "title"}
+
+        def __init__(self):
+            super().__init__(convert_charrefs=True)
+            self.parts = []
+            self.skip_depth = 0
+
+        def handle_starttag(self, tag, attrs):
+            if tag in self.SKIP_TAGS:
+                self.skip_depth += 1
+            elif tag in self.BLOCK_TAGS and self.parts and not self.parts[-1].endswith("\n"):
+                self.parts.append("\n")
+
+        def handle_endtag(self, tag):
+            if tag in self.SKIP_TAGS:
+                self.skip_depth = max(0, self.skip_depth - 1)
+
+        def handle_data(self, data):
+            if not self.skip_depth:
+                self.parts.append(data)
+
+    parser = _PlainTextParser()
+    parser.feed(html_content or "")
+    parser.close()
+    return "".join(parser.parts).strip()
+
+
+def make_title_slug(title):
+    """
+    タイトルからファイル名用のスラグを作る（スペースをハイフンに、特殊文字を削除）
+    """
+    title_slug = re.sub(r'[^\w\s-]', '', title.lower())
+    return re.sub(r'[\s]+', '-', title_slug)
+
+
+def new_file_key(diary_folder, date_str, title, reserved=None):
+    """
+    既存のファイルと重ならない新しいファイルキー（yyyy-MM-dd_title-slug）を決める
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        date_str (str): 日付（yyyy-MM-dd）
+        title (str): タイトル
+        reserved (set, optional): まだ書き込んでいないが使用予定のファイルキー
+    """
+    base_file_key = f"{date_str}_{make_title_slug(title)}"
+    file_key = base_file_key
+    counter = 1
+    while (reserved and file_key in reserved) or os.path.exists(os.path.join(diary_folder, f"{file_key}.json")):
+        file_key = f"{base_file_key}-{counter}"
+        counter += 1
+    return file_key
+
+
+def write_json_atomic(file_path, data, indent=4):
+    """
+    JSONを一時ファイルに書き込んでから置き換える（書き込み途中のファイルを読ませない）
+    一時ファイルの名前はプロセスとスレッドごとに変え、同時に書き込んでも混ざらないようにする
+    """
+    temp_path = f"{file_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(temp_path, file_path)
+
+
+def merge_metadata(base, ours, theirs):
+    """
+    メタデータの3方向マージ
+    共通の元 (base) からの自分の変更 (ours) を、他のインスタンスが保存した内容 (theirs) に合わせる
+    リスト（タグ・気分・お気に入り）は追加と削除をそれぞれ反映し、その他の値は自分が変えたものを優先する
+
+    Args:
+        base (dict): 自分が最後に読み込んだか保存したときの内容
+        ours (dict): 自分の現在の内容
+        theirs (dict): ファイルに保存されている現在の内容
+
+    Returns:
+        dict: マージした内容
+    """
+    merged = dict(theirs)
+    for key, value in ours.items():
+        base_value = base.get(key)
+        if isinstance(value, list) and isinstance(base_value, list) and isinstance(theirs.get(key), list):
+            removed = set(base_value) - set(value)
+            existing = set(theirs[key])
+            added = [item for item in value if item not in base_value and item not in existing]
+            merged[key] = [item for item in theirs[key] if item not in removed] + added
+        elif value != base_value:
+            merged[key] = value
+    return merged
+
+
+class ConflictError(Exception):
+    """
+    上書きしようとした日記が、読み込んだ後に他のインスタンスやツールで保存されていた
+    """
+
+    def __init__(self, file_key, revision):
+        super().__init__(f"日記が他で変更されています: {file_key}")
+        self.file_key = file_key
+        self.revision = revision
+
+
+def _lock_file_handle(lock_file):
+    """
+    ロックファイルを排他ロックする（取得できない場合はすぐに OSError を送出する）
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # Windows
+        import msvcrt
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        return
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def _unlock_file_handle(lock_file):
+    """
+    ロックファイルのロックを解除する
+    """
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class FolderLock:
+    """
+    日記フォルダへの書き込みを、複数のプロセス（GUIの複数のウィンドウやコマンドラインツール）の
+    間で排他するアドバイザリロック（with 文で使う）
+
+    同じインスタンスの中では入れ子にでき、スレッドの間でも排他する。
+    書き込みは一時ファイルからの置き換えで行うため、読み込みはロックを取らない。
+    """
+
+    def __init__(self, lock_file, timeout=WRITE_LOCK_TIMEOUT):
+        self.lock_file = lock_file
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._acquire()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock_file_handle(self._file)
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def _acquire(self):
+        """
+        ロックを取得する（他のプロセスが持っている間は timeout 秒まで待つ）
+        """
+        folder = os.path.dirname(self.lock_file)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        lock_file = open(self.lock_file, 'a+b')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                _lock_file_handle(lock_file)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise TimeoutError(f"日記フォルダのロックを取得できませんでした（他のアプリが書き込み中です）: {self.lock_file}")
+                time.sleep(0.05)
+        self._file = lock_file
+
+
+class ChangeLog:
+    """
+    日記フォルダへの書き込み（日記の作成・更新・削除、お気に入り・タグ・設定の変更）を
+    1行1件のJSONで追記する変更履歴
+
+    各行は {"seq": 通し番号, "time": 日時, "op": 操作, ...} の形式で、通し番号は1から増え続ける。
+    読み出しには「カーソル」（"通し番号:ファイル上の位置" の文字列）を使い、前回の続きから
+    読むため、キャッシュやバックアップ、同期などは変更の件数に比例する時間で追いつける。
+
+    操作 (op) の種類:
+        entry_created, entry_updated, entry_deleted   日記（file_key、作成・更新では revision も）
+        favorite_added, favorite_removed              お気に入り（file_key）
+        tag_added, tag_removed                        タグ一覧（tag）
+        setting_changed                               その他のメタデータ（key）
+
+    追記は FolderLock を持った状態で行う（通し番号が重複しないようにするため）。
+    """
+
+    def __init__(self, log_file):
+        self.log_file = log_file
+        # 最後に確認したファイルのサイズと、その時点の最後の通し番号
+        self._known_end = (0, 0)
+
+    def last_sequence(self):
+        """
+        最後に記録された変更の通し番号を返す（まだ変更がない場合は0）
+        """
+        try:
+            size = os.path.getsize(self.log_file)
+        except OSError:
+            return 0
+        if size == self._known_end[0]:
+            return self._known_end[1]
+
+        # ファイルの末尾から最後の完全な行を探す
+        with open(self.log_file, 'rb') as f:
+            chunk_size = 4096
+            while True:
+                start = max(0, size - chunk_size)
+                f.seek(start)
+                lines = f.read(size - start).split(b"\n")
+                complete = lines[:-1] if start == 0 else lines[1:-1]
+                for line in reversed(complete):
+                    try:
+                        sequence = json.loads(line)["seq"]
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    self._known_end = (size, sequence)
+                    return sequence
+                if start == 0:
+                    self._known_end = (size, 0)
+                    return 0
+                chunk_size *= 4
+
+    def append(self, events):
+        """
+        変更を追記する（呼び出し側で FolderLock を持っていること）
+
+        Args:
+            events (list): 操作 ("op") とその対象を持つ辞書のリスト
+        """
+        if not events:
+            return
+        folder = os.path.dirname(self.log_file)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        sequence = self.last_sequence()
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        lines = []
+        for event in events:
+            sequence += 1
+            lines.append(json.dumps(dict({"seq": sequence, "time": now}, **event), ensure_ascii=False))
+        with open(self.log_file, 'ab') as f:
+            # 書き込みの途中で終了した行があれば、その行とつながらないようにする
+            if f.tell() > 0:
+                with open(self.log_file, 'rb') as check:
+                    check.seek(-1, os.SEEK_END)
+                    if check.read(1) != b"\n":
+                        f.write(b"\n")
+            f.write(("\n".join(lines) + "\n").encode('utf-8'))
+            size = f.tell()
+        self._known_end = (size, sequence)
+
+    def read(self, cursor=None, limit=None):
+        """
+        カーソルより後の変更を古い順に返す
+
+        Args:
+            cursor (str or int): 前回返されたカーソル（Noneの場合は最初から）。
+                通し番号（int）を渡した場合は、ファイルの先頭から探す
+            limit (int, optional): 返す最大件数
+
+        Returns:
+            tuple: (変更のリスト, 次に渡すカーソル)
+        """
+        after, offset = self._parse_cursor(cursor)
+        events = []
+        try:
+            f = open(self.log_file, 'rb')
+        except OSError:
+            return events, self._make_cursor(after, 0)
+
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if offset > size:
+                # ファイルが作り直されたなどでカーソルが合わない場合は先頭から探す
+                offset = 0
+            f.seek(offset)
+            position = offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 書き込み中の行は次回に読む
+                    break
+                try:
+                    event = json.loads(line)
+                    sequence = event["seq"]
+                except (ValueError, KeyError, TypeError):
+                    position += len(line)
+                    continue
+                if sequence <= after:
+                    position += len(line)
+                    continue
+                if limit is not None and len(events) >= limit:
+                    break
+                events.append(event)
+                after = sequence
+                position += len(line)
+        return events, self._make_cursor(after, position)
+
+    def end_cursor(self):
+        """
+        現在の末尾を指すカーソルを返す（これから後の変更だけを読みたい場合に使う）
+        """
+        sequence = self.last_sequence()
+        return self._make_cursor(sequence, self._known_end[0])
+
+    @staticmethod
+    def _make_cursor(sequence, offset):
+        return f"{sequence}:{offset}"
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        """
+        カーソルを (通し番号, ファイル上の位置) に分ける
+        """
+        if cursor is None:
+            return 0, 0
+        if isinstance(cursor, int):
+            return cursor, 0
+        try:
+            sequence, offset = (int(part) for part in str(cursor).split(":"))
+        except ValueError:
+            raise ValueError(f"カーソルの形式が正しくありません: {cursor}")
+        return sequence, max(0, offset)
+
+
+def metadata_change_events(before, after):
+    """
+    メタデータの変更を変更履歴の操作のリストにする
+
+    Args:
+        before (dict): 変更前のメタデータ
+        after (dict): 変更後のメタデータ
+
+    Returns:
+        list: 変更履歴の操作（tag_added、favorite_removed など）
+    """
+    events = []
+    for key, op_prefix, field in (("favorites", "favorite", "file_key"), ("tags", "tag", "tag")):
+        old_items = before.get(key, [])
+        new_items = after.get(key, [])
+        events.extend({"op": f"{op_prefix}_added", field: item} for item in new_items if item not in old_items)
+        events.extend({"op": f"{op_prefix}_removed", field: item} for item in old_items if item not in new_items)
+    for key in sorted(set(before) | set(after)):
+        if key not in ("favorites", "tags") and before.get(key) != after.get(key):
+            events.append({"op": "setting_changed", "key": key})
+    return events
+
+
+# チェックサムの対象にする日記の項目
+CHECKSUM_FIELDS = ("date", "title", "content", "mood", "tags")
+
+
+def entry_checksum(data):
+    """
+    日記の内容のチェックサムを計算する（更新日時は含めない）
+    """
+    import hashlib
+
+    payload = json.dumps([data.get(field) for field in CHECKSUM_FIELDS], ensure_ascii=False, separators=(',', ':'))
+    return "sha256:" + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def convert_image_paths_to_relative(html_content, diary_folder, images_folder):
+    """
+    HTML内の画像パスを日記フォルダからの相対パスに変換する
+
+    Args:
+        html_content (str): 変換するHTML文字列
+        diary_folder (str): 日記フォルダ
+        images_folder (str): 画像フォルダ（この中を指す絶対パスだけを変換する）
+
+    Returns:
+        str: 変換後のHTML文字列
+    """
+    images_abs_path = os.path.abspath(images_folder)
+    diary_abs_path = os.path.abspath(diary_folder)
+
+    def replace_path(match):
+        path = match.group(1)
+        # 絶対パスが画像フォルダ内を指している場合は相対パスに変換
+        if os.path.abspath(path).startswith(images_abs_path):
+            return f'src="{os.path.relpath(path, diary_abs_path)}"'
+        return match.group(0)
+
+    return re.sub(r'src="([^"]+)"', replace_path, html_content)
+
+
+def convert_image_paths_to_absolute(html_content, diary_folder):
+    """
+    HTML内の相対画像パスを絶対パスに変換する
+
+    Args:
+        html_content (str): 変換するHTML文字列
+        diary_folder (str): 相対パスの基準となる日記フォルダ
+
+    Returns:
+        str: 変換後のHTML文字列
+    """
+    import urllib.parse
+
+    diary_abs_path = os.path.abspath(diary_folder)
+
+    def replace_path(match):
+        path = match.group(1)
+        # 相対パスの場合は絶対パスに変換
+        if not os.path.isabs(path) and not path.startswith(("http:", "https:")):
+            # URIエンコーディングされたパスを戻す場合もある
+            path = urllib.parse.unquote(path)
+            return f'src="{os.path.join(diary_abs_path, path)}"'
+        return match.group(0)
+
+    return re.sub(r'src="([^"]+)"', replace_path, html_content)
+
+
+def _bitmap_from_ordinals(ordinals, size):
+    """
+    番号のリストから、その番号のビットを立てた整数を作る
+    （1ビットずつ | で立てると日記数の2乗に比例する時間がかかるため、bytearray で組み立てる）
+    """
+    bits = bytearray((size + 7) // 8)
+    for ordinal in ordinals:
+        bits[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(bits, "little")
+
+
+class BitmapIndex:
+    """
+    タグ・気分・日付で日記を絞り込むためのビットマップ索引
+
+    日記に日付順の番号（序数）を振り、タグ・気分ごとに、それが付いた日記の番号のビットを
+    立てた整数（ビットマップ）を持つ。日付の範囲は番号の連続した範囲になるため、
+    条件の組み合わせはビットマップどうしの & で求められる。
+    タグ・気分はそれぞれ整数のIDに置き換えて持つ。日記の保存・削除は update() で反映する。
+    日付順に並べたファイルキーと日付のリストは、日付の範囲・月・年の日記や前後の日記を
+    bisect で探す日付の索引としても使う。
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (iterable): 索引レコード
+        """
+        # 日付順（同じ日付の中はファイルキー順）に並べる
+        records = sorted(records, key=lambda record: record["file_key"])
+        records.sort(key=lambda record: record["date"])
+        self.size = len(records)
+        # 番号 -> ファイルキー・日付（日付順。削除した日記のファイルキーはNone）と、ファイルキー -> 番号
+        self.keys = [record["file_key"] for record in records]
+        self.dates = [record["date"] for record in records]
+        self.ordinals = {file_key: ordinal for ordinal, file_key in enumerate(self.keys)}
+        # 索引にある日記のビットマップと、削除して空いた番号の数
+        self.live = (1 << self.size) - 1
+        self.removed = 0
+
+        # タグ・気分 -> ID と、ID -> ビットマップ
+        tag_ordinals = {}
+        mood_ordinals = {}
+        for ordinal, record in enumerate(records):
+            for tag in self._record_tags(record):
+                tag_ordinals.setdefault(tag, []).append(ordinal)
+            if record["mood"]:
+                mood_ordinals.setdefault(record["mood"], []).append(ordinal)
+        self.tag_ids = {tag: tag_id for tag_id, tag in enumerate(tag_ordinals)}
+        self.mood_ids = {mood: mood_id for mood_id, mood in enumerate(mood_ordinals)}
+        self.tag_bitmaps = [_bitmap_from_ordinals(ordinals, self.size) for ordinals in tag_ordinals.values()]
+        self.mood_bitmaps = [_bitmap_from_ordinals(ordinals, self.size) for ordinals in mood_ordinals.values()]
+
+    @staticmethod
+    def _record_tags(record):
+        # 1件の日記に同じタグが重複して付いていても1回だけ数える
+        return {tag for tag in record["tags"] if isinstance(tag, str)}
+
+    @staticmethod
+    def _value_id(ids, bitmaps, value):
+        """
+        タグ・気分のIDを返す（初めての値の場合はIDを割り当て、空のビットマップを追加する）
+        """
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(bitmaps)
+            bitmaps.append(0)
+        return value_id
+
+    def _set_bits(self, record, ordinal, on):
+        """
+        日記のタグ・気分のビットマップの、その日記の番号のビットを立てる（on がFalseの場合は消す）
+        """
+        bit = 1 << ordinal
+        values = [(self.tag_ids, self.tag_bitmaps, tag) for tag in self._record_tags(record)]
+        if record["mood"]:
+            values.append((self.mood_ids, self.mood_bitmaps, record["mood"]))
+        for ids, bitmaps, value in values:
+            value_id = self._value_id(ids, bitmaps, value)
+            bitmaps[value_id] = bitmaps[value_id] | bit if on else bitmaps[value_id] & ~bit
+
+    def update(self, old_record, new_record):
+        """
+        日記の追加・更新・削除をビットマップに反映する
+
+        日記の削除では番号を空けたままにし、追加は日付順の末尾に付け加えられる場合だけ反映する
+        （過去の日付の日記の追加のように番号の振り直しが必要な場合は反映しない）
+
+        Args:
+            old_record (dict or None): 変更前の索引レコード（追加の場合はNone）
+            new_record (dict or None): 変更後の索引レコード（削除の場合はNone）
+
+        Returns:
+            bool: 反映できた場合はTrue。作り直しが必要な場合はFalse
+        """
+        if old_record is not None and new_record is not None and old_record["date"] == new_record["date"]:
+            ordinal = self.ordinals.get(new_record["file_key"])
+            if ordinal is None:
+                return False
+            self._set_bits(old_record, ordinal, False)
+            self._set_bits(new_record, ordinal, True)
+            return True
+
+        if (new_record is not None and self.size and
+                (new_record["date"], new_record["file_key"]) < (self.dates[-1], self.keys[-1] or "")):
+            return False
+        if old_record is not None:
+            ordinal = self.ordinals.pop(old_record["file_key"], None)
+            if ordinal is None:
+                return False
+            self._set_bits(old_record, ordinal, False)
+            self.live &= ~(1 << ordinal)
+            self.keys[ordinal] = None
+            self.removed += 1
+        if new_record is not None:
+            ordinal = self.size
+            self.size += 1
+            self.keys.append(new_record["file_key"])
+            self.dates.append(new_record["date"])
+            self.ordinals[new_record["file_key"]] = ordinal
+            self.live |= 1 << ordinal
+            self._set_bits(new_record, ordinal, True)
+        # 空いた番号が増えすぎた場合は作り直す
+        return self.removed <= self.size // 2
+
+    def date_range(self, date_from=None, date_to=None):
+        """
+        日付が範囲内（両端を含む）の日記の番号の範囲を返す（日付のない日記は含まない）
+
+        Returns:
+            tuple: (先頭の番号, 末尾の番号 + 1)
+        """
+        # 日付のない日記（""）は先頭に集まるため、日付の最小値 "0" より前を除く
+        start = bisect.bisect_left(self.dates, date_from or "0")
+        end = bisect.bisect_right(self.dates, date_to) if date_to else self.size
+        return start, max(start, end)
+
+    def range_bitmap(self, start=None, end=None):
+        """
+        日付が start 以上 end 未満の日記のビットマップを返す（日付のない日記は含まない）
+
+        Args:
+            start (str, optional): 日付の下限（yyyy、yyyy-MM、yyyy-MM-dd。この値を含む）
+            end (str, optional): 日付の上限（この値を含まない）
+        """
+        first = bisect.bisect_left(self.dates, start or "0")
+        last = max(first, bisect.bisect_left(self.dates, end) if end else self.size)
+        return ((1 << last) - (1 << first)) & self.live
+
+    def keys_bitmap(self, file_keys):
+        """
+        ファイルキーの日記のビットマップを返す（索引にないファイルキーは無視する）
+        """
+        ordinals = self.ordinals
+        return _bitmap_from_ordinals([ordinals[file_key] for file_key in file_keys if file_key in ordinals],
+                                     self.size)
+
+    def period_range(self, period):
+        """
+        日付が period（yyyy や yyyy-MM）で始まる日記の番号の範囲を返す
+
+        Returns:
+            tuple: (先頭の番号, 末尾の番号 + 1)
+        """
+        return self.date_range(period, period + "\uffff")
+
+    def adjacent(self, ordinal, step):
+        """
+        番号 ordinal から step の向きに進んで最初に見つかる、日付のある日記のファイルキーを返す
+        （ない場合はNone）
+        """
+        lowest = self.date_range()[0]
+        ordinal += step
+        while lowest <= ordinal < self.size:
+            if self.keys[ordinal] is not None:
+                return self.keys[ordinal]
+            ordinal += step
+        return None
+
+    def select(self, date_from=None, date_to=None, tags=(), mood=None):
+        """
+        条件をすべて満たす日記のビットマップを返す（日付のない日記は含まない）
+
+        Args:
+            date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+            date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+            tags (iterable): すべてが付いている日記に絞り込むタグ
+            mood (str, optional): 気分
+
+        Returns:
+            int: ビットマップ
+        """
+        start, end = self.date_range(date_from, date_to)
+        bitmap = ((1 << end) - (1 << start)) & self.live
+        for tag in tags:
+            tag_id = self.tag_ids.get(tag)
+            bitmap &= self.tag_bitmaps[tag_id] if tag_id is not None else 0
+        if mood:
+            mood_id = self.mood_ids.get(mood)
+            bitmap &= self.mood_bitmaps[mood_id] if mood_id is not None else 0
+        return bitmap
+
+    def file_keys(self, bitmap):
+        """
+        ビットマップに含まれる日記のファイルキーを返す（日付の古い順）
+        """
+        # ビットを1つずつ取り出すと日記数に比例する演算が件数分必要になるため、2進数の文字列から探す
+        bits = bin(bitmap)[:1:-1]
+        keys = self.keys
+        file_keys = []
+        ordinal = bits.find("1")
+        while ordinal >= 0:
+            file_keys.append(keys[ordinal])
+            ordinal = bits.find("1", ordinal + 1)
+        return file_keys
+
+    @staticmethod
+    def count(bitmap):
+        """
+        ビットマップに含まれる日記の件数を返す
+        """
+        return bin(bitmap).count("1")
+
+    def tag_counts(self):
+        """
+        タグごとの日記の件数を返す
+        """
+        counts = {tag: self.count(self.tag_bitmaps[tag_id]) for tag, tag_id in self.tag_ids.items()}
+        return {tag: count for tag, count in counts.items() if count}
+
+    def mood_counts(self):
+        """
+        気分ごとの日記の件数を返す
+        """
+        counts = {mood: self.count(self.mood_bitmaps[mood_id]) for mood, mood_id in self.mood_ids.items()}
+        return {mood: count for mood, count in counts.items() if count}
+
+
+class DiaryStore:
+    """
+    日記フォルダの読み書き・索引・検索・統計を行うクラス
+
+    日記ファイル（yyyy-MM-dd_title-slug.json）とメタデータ（metadata.json）を扱う。
+    各日記のタイトル・日付・気分・タグ・本文のプレーンテキストをメモリ上の索引に持ち、
+    検索や統計はファイルを開かずに索引から求める。索引はファイルの更新日時とサイズで
+    変更を検出し、変わったファイルだけを読み直す。
+
+    同じ日記フォルダを複数のインスタンスで開いても変更が失われないように、書き込みは
+    FolderLock で排他し、メタデータは保存時に他のインスタンスの変更とマージする。
+    日記は保存のたびに増える revision を持ち、読み込んだ後に他で保存された日記を
+    上書きしようとすると ConflictError になる。
+    """
+
+    def __init__(self, diary_folder="diary_entries", refresh_interval=0):
+        """
+        Args:
+            diary_folder (str): 日記フォルダ
+            refresh_interval (float): フォルダを走査する最短の間隔（秒）。0の場合は毎回走査する。
+                頻繁に問い合わせを受けるサーバーなどで、走査の回数を抑えるために使う
+        """
+        self.diary_folder = diary_folder
+        self.refresh_interval = refresh_interval
+        self.images_folder = os.path.join(diary_folder, "images")
+        self.metadata_file = os.path.join(diary_folder, METADATA_FILE_NAME)
+
+        for folder in (self.diary_folder, self.images_folder):
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+        self._metadata_stat = None
+        # 最後に読み込んだか保存したときのメタデータ（保存時のマージの元にする）
+        self._metadata_base = None
+        self.metadata = self.load_metadata()
+
+        self.internal_folder = os.path.join(diary_folder, INTERNAL_DIR_NAME)
+        self.index_cache_file = os.path.join(self.internal_folder, INDEX_CACHE_FILE_NAME)
+        # 書き込み（日記・メタデータ）を他のプロセスと排他するロックと、書き込みの変更履歴
+        self.write_lock = FolderLock(os.path.join(self.internal_folder, WRITE_LOCK_FILE_NAME))
+        self.change_log = ChangeLog(os.path.join(self.internal_folder, CHANGE_LOG_FILE_NAME))
+        # 日記ごとの過去の版（diary_history.EntryHistory。最初に使うときに作る）
+        self._history = None
+
+        # 索引（ファイルキー -> レコード）と、読み込んだ時点のファイルの (更新日時, サイズ)
+        self._records = {}
+        self._file_stats = {}
+        # ファイルキー順に並べたキーの一覧（日記が追加・削除されるまで使い回す）
+        self._sorted_keys = None
+        # タグ・気分・日付で絞り込むためのビットマップ索引（BitmapIndex）と、キーワードの全文索引
+        # （diary_search.FullTextIndex）、日記へ移動するためのあいまい検索の索引（diary_fuzzy.FuzzyIndex）。
+        # 最初に使うときに作り、日記の変更を反映していく
+        self._bitmap_index = None
+        self._full_text_index = None
+        self._fuzzy_index = None
+        # 保存した検索と、それぞれに一致する日記の集合（diary_saved.SavedSearches。最初に使うときに読み込む）
+        self._saved_searches = None
+        # 索引キャッシュを読み込んだ（または読み込もうとした）かどうか
+        self._index_cache_checked = False
+        # 索引キャッシュを保存した後に索引が変わったかどうか
+        self._index_dirty = False
+        # 索引かメタデータが変わるたびに増える番号（問い合わせ結果のキャッシュの検証に使う）
+        self.generation = 0
+        # このインスタンスで保存・削除した日記のファイルキー（adopt_index で読み直す）
+        self._written_keys = set()
+        # 最後にフォルダを走査した時刻（time.monotonic() の値）
+        self._last_refresh = None
+        # 問い合わせのたびにフォルダを走査するかどうか
+        # （ファイル監視で変更を受け取り refresh_entries() や refresh(force=True) を呼ぶ場合はFalseにする）
+        self.auto_refresh = True
+
+    # ---- メタデータ ----
+
+    def load_metadata(self):
+        """
+        メタデータを読み込む（ファイルがない場合は初期値で作成する）
+        """
+        if os.path.exists(self.metadata_file):
+            metadata = self._read_metadata_file()
+        else:
+            metadata = default_metadata()
+            write_json_atomic(self.metadata_file, metadata)
+        self._metadata_stat = self._stat_signature(self.metadata_file)
+        self._metadata_base = json.loads(json.dumps(metadata))
+        return metadata
+
+    def _read_metadata_file(self):
+        """
+        メタデータファイルを読み込み、足りない項目を初期値で補う
+        """
+        with open(self.metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        for key, value in default_metadata().items():
+            metadata.setdefault(key, value)
+        return metadata
+
+    def save_metadata(self):
+        """
+        メタデータをJSONファイルに保存する
+        読み込んだ後に他のインスタンスが保存していた場合は、その内容に
+        このインスタンスでの変更（タグ・お気に入りの追加と削除、設定の変更）を合わせて保存する
+        """
+        with self.write_lock:
+            try:
+                theirs = self._read_metadata_file()
+            except (OSError, ValueError):
+                theirs = None
+            events = metadata_change_events(self._metadata_base, self.metadata)
+            if theirs is not None and theirs != self._metadata_base:
+                merged = merge_metadata(self._metadata_base, self.metadata, theirs)
+                # bulk_import などが同じ辞書を持ち続けるため、辞書自体は置き換えずに中身を入れ替える
+                self.metadata.clear()
+                self.metadata.update(merged)
+            write_json_atomic(self.metadata_file, self.metadata)
+            self._metadata_stat = self._stat_signature(self.metadata_file)
+            self._metadata_base = json.loads(json.dumps(self.metadata))
+            self.change_log.append(events)
+        self.generation += 1
+
+    @staticmethod
+    def _stat_signature(file_path):
+        """
+        ファイルの (更新日時, サイズ) を返す（ファイルがない場合はNone）
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    # ---- 索引 ----
+
+    def load_index_cache(self):
+        """
+        前回保存した索引キャッシュを読み込む（最初の refresh() が自動的に呼ぶ）
+        キャッシュの内容は refresh() でファイルの更新日時とサイズと照合され、
+        変わったファイルだけが読み直される
+
+        Returns:
+            bool: 読み込めた場合はTrue
+        """
+        self._index_cache_checked = True
+        try:
+            with open(self.index_cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (not isinstance(cache, dict) or cache.get("version") != INDEX_CACHE_VERSION or
+                cache.get("fields") != list(INDEX_CACHE_FIELDS)):
+            return False
+
+        # 各行は [ファイルキー, 更新日時, サイズ, INDEX_CACHE_FIELDS の順の値...]
+        for row in cache.get("entries", []):
+            record = dict(zip(INDEX_CACHE_FIELDS, row[3:]))
+            record["file_key"] = row[0]
+            self._records[row[0]] = record
+            self._file_stats[row[0]] = (row[1], row[2])
+        self._sorted_keys = None
+        self._bitmap_index = None
+        self._full_text_index = None
+        self._fuzzy_index = None
+        self._saved_searches = None
+        return True
+
+    def save_index_cache(self):
+        """
+        索引をキャッシュファイルに保存する（前回の保存から変更がない場合は何もしない）
+        """
+        if not self._index_dirty:
+            return
+        if not os.path.exists(self.internal_folder):
+            os.makedirs(self.internal_folder)
+
+        entries = []
+        for file_key, stat in self._file_stats.items():
+            record = self._records.get(file_key)
+            if record is not None:
+                entries.append([file_key, stat[0], stat[1]] + [record[field] for field in INDEX_CACHE_FIELDS])
+        cache = {"version": INDEX_CACHE_VERSION, "fields": list(INDEX_CACHE_FIELDS), "entries": entries}
+        write_json_atomic(self.index_cache_file, cache, indent=None)
+        self._index_dirty = False
+
+    def load_state(self, name, default=None):
+        """
+        内部フォルダに保存した状態（JSON）を読み込む
+
+        Args:
+            name (str): 状態の名前（ファイル名は name.json）
+            default: ファイルがないか読み込めない場合に返す値
+
+        Returns:
+            読み込んだ値
+        """
+        try:
+            with open(os.path.join(self.internal_folder, f"{name}.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def save_state(self, name, data):
+        """
+        状態（JSON）を内部フォルダに保存する
+        """
+        if not os.path.exists(self.internal_folder):
+            os.makedirs(self.internal_folder)
+        write_json_atomic(os.path.join(self.internal_folder, f"{name}.json"), data, indent=None)
+
+    def entry_path(self, file_key):
+        """
+        ファイルキーから日記ファイルのパスを返す
+        """
+        return os.path.join(self.diary_folder, f"{file_key}.json")
+
+    def _read_record(self, file_key):
+        """
+        日記ファイルを読み込んで索引のレコードを作る
+        検索用に正規化した文字列（"folded"）もここで一度だけ作る
+        """
+        from diary_search import fold_text, search_text
+
+        try:
+            with open(self.entry_path(file_key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            # 読み込みエラーの場合でも一覧に表示できるようにする
+            print(f"ファイル読み込みエラー: {file_key}.json - {str(e)}")
+            record = {
+                "file_key": file_key,
+                "date": "",
+                "title": f"[読み込みエラー] {file_key}",
+                "mood": "",
+                "tags": [],
+                "last_modified": "",
+                "revision": 0,
+                "text": "",
+                "error": True
+            }
+            record["folded"] = fold_text(search_text(record))
+            return record
+
+        # ファイル名から日付を取得し、取得できない場合は更新日時を使う
+        date_str = entry_date_str(file_key)
+        if not is_valid_date(date_str):
+            date_str = str(data.get("last_modified", ""))[:10]
+            if not is_valid_date(date_str):
+                date_str = ""
+
+        record = {
+            "file_key": file_key,
+            "date": date_str,
+            "title": data.get("title", "無題"),
+            "mood": data.get("mood", ""),
+            "tags": data.get("tags", []),
+            "last_modified": data.get("last_modified", ""),
+            "revision": data.get("revision", 0),
+            "text": html_to_plain_text(data.get("content", "")),
+            "error": False
+        }
+        record["folded"] = fold_text(search_text(record))
+        return record
+
+    def _update_record(self, file_key):
+        """
+        1件の日記の索引を読み直す（ファイルがなければ索引から削除する）
+        """
+        self._index_dirty = True
+        self._sorted_keys = None
+        self.generation += 1
+        self._written_keys.add(file_key)
+        old_record = self._records.get(file_key)
+        try:
+            stat = os.stat(self.entry_path(file_key))
+        except OSError:
+            self._records.pop(file_key, None)
+            self._file_stats.pop(file_key, None)
+            self._update_search_indexes(old_record, None)
+            return
+        self._records[file_key] = record = self._read_record(file_key)
+        self._file_stats[file_key] = (stat.st_mtime_ns, stat.st_size)
+        self._update_search_indexes(old_record, record)
+
+    def refresh(self, force=False):
+        """
+        日記フォルダを走査して索引を最新にする
+        更新日時とサイズが前回と同じファイルは読み直さない
+        最初の走査の前に索引キャッシュがあれば読み込み、変わったファイルだけを読む
+
+        Args:
+            force (bool): refresh_interval と auto_refresh に関係なく走査する
+
+        Returns:
+            dict: 追加 ("added")・更新 ("updated")・削除 ("removed") されたファイルキーのリストと、
+                日記が増減・変更された日付 ("dates") のリスト
+        """
+        changes = {"added": [], "updated": [], "removed": [], "dates": []}
+
+        # ファイル監視で変更を受け取っている場合は、明示的に求められたときだけ走査する
+        if not force and not self.auto_refresh and self._index_cache_checked:
+            return changes
+
+        # 走査の間隔が指定されている場合は、前回の走査から間もなければ何もしない
+        now = time.monotonic()
+        if (not force and self.refresh_interval and self._last_refresh is not None and
+                now - self._last_refresh < self.refresh_interval):
+            return changes
+        self._last_refresh = now
+
+        if not self._index_cache_checked:
+            self.load_index_cache()
+        self._reload_metadata_if_changed()
+
+        seen = set()
+        dates = set()
+        # 日記が多い場合はこのループが処理時間の大半を占めるため、属性の参照をループの外に出す
+        known_stats = self._file_stats
+        with os.scandir(self.diary_folder) as it:
+            for dir_entry in it:
+                name = dir_entry.name
+                if not is_entry_file(name):
+                    continue
+                file_key = name[:-5]
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                seen.add(file_key)
+
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if known_stats.get(file_key) != signature:
+                    self._apply_file_change(file_key, signature, changes, dates)
+
+        for file_key in [file_key for file_key in self._records if file_key not in seen]:
+            self._apply_file_change(file_key, None, changes, dates)
+
+        self._finish_changes(changes, dates)
+        return changes
+
+    def refresh_entries(self, file_keys):
+        """
+        指定した日記だけを読み直して索引を最新にする（フォルダは走査しない）
+        ファイル監視の通知などで、変わったファイルが分かっている場合に使う
+
+        Args:
+            file_keys (iterable): 読み直す日記のファイルキー
+
+        Returns:
+            dict: refresh() と同じ形式の変更内容
+        """
+        changes = {"added": [], "updated": [], "removed": [], "dates": []}
+        if not self._index_cache_checked:
+            self.load_index_cache()
+        self._reload_metadata_if_changed()
+
+        dates = set()
+        for file_key in file_keys:
+            signature = self._stat_signature(self.entry_path(file_key))
+            if signature is None and file_key not in self._records:
+                continue
+            if self._file_stats.get(file_key) != signature:
+                self._apply_file_change(file_key, signature, changes, dates)
+
+        self._finish_changes(changes, dates)
+        return changes
+
+    def _reload_metadata_if_changed(self):
+        """
+        他のプロセス（GUIやコマンドラインツール、同期ツール）がメタデータを書き換えていれば読み直す
+        """
+        if self._stat_signature(self.metadata_file) == self._metadata_stat:
+            return
+        try:
+            base = self._metadata_base
+            theirs = self.load_metadata()
+            if base is not None and self.metadata != base:
+                # まだ保存していない変更（インポート中に追加したタグ・お気に入りなど）は読み直した内容に合わせて残す
+                theirs = merge_metadata(base, self.metadata, theirs)
+            # bulk_import などが同じ辞書を持ち続けるため、辞書自体は置き換えずに中身を入れ替える
+            self.metadata.clear()
+            self.metadata.update(theirs)
+            self.generation += 1
+        except (OSError, ValueError):
+            # 読めない場合は今のメタデータを使い続ける
+            pass
+
+    def _apply_file_change(self, file_key, signature, changes, dates):
+        """
+        1件の日記の索引を読み直し（signature がNoneの場合は削除し）、変更内容を記録する
+        """
+        old_record = self._records.get(file_key)
+        if old_record is not None:
+            dates.add(old_record["date"])
+
+        if signature is None:
+            del self._records[file_key]
+            self._file_stats.pop(file_key, None)
+            self._update_search_indexes(old_record, None)
+            changes["removed"].append(file_key)
+            return
+
+        changes["updated" if old_record is not None else "added"].append(file_key)
+        record = self._read_record(file_key)
+        self._records[file_key] = record
+        self._file_stats[file_key] = signature
+        self._update_search_indexes(old_record, record)
+        dates.add(record["date"])
+
+        # 他のツールで付けられたタグもタグ一覧に出るように、メタデータ（メモリ上）に追加する
+        for tag in record["tags"]:
+            if tag not in self.metadata["tags"]:
+                self.metadata["tags"].append(tag)
+
+    def _update_search_indexes(self, old_record, new_record):
+        """
+        1件の日記の変更を検索用の索引に反映する（反映できない場合は次に使うときに作り直す）
+        """
+        if self._bitmap_index is not None and not self._bitmap_index.update(old_record, new_record):
+            self._bitmap_index = None
+        if self._full_text_index is not None and not self._full_text_index.update(old_record, new_record):
+            self._full_text_index = None
+        if self._fuzzy_index is not None and not self._fuzzy_index.update(old_record, new_record):
+            self._fuzzy_index = None
+        # 保存した検索の集合は、変わった日記だけを各検索の条件で確かめて更新する
+        if self._saved_searches is not None:
+            self._saved_searches.update(old_record, new_record)
+
+    def _finish_changes(self, changes, dates):
+        """
+        索引が変わった場合に、キャッシュの状態と世代番号を更新する
+        """
+        if changes["added"] or changes["updated"] or changes["removed"]:
+            self._index_dirty = True
+            self.generation += 1
+        if changes["added"] or changes["removed"]:
+            self._sorted_keys = None
+        changes["dates"] = sorted(date_str for date_str in dates if date_str)
+
+    def adopt_index(self, other):
+        """
+        別のインスタンス（別スレッドで索引を作ったものなど）の索引を引き継ぐ
+        その間にこのインスタンスで保存・削除した日記は、ファイルから読み直す
+
+        Args:
+            other (DiaryStore): 同じ日記フォルダの索引を読み込んだインスタンス
+        """
+        written_keys = self._written_keys
+        self._records = other._records
+        self._file_stats = other._file_stats
+        self._sorted_keys = None
+        # 別スレッドで作っておいた検索用の索引も引き継ぐ
+        self._bitmap_index = other._bitmap_index
+        self._full_text_index = other._full_text_index
+        self._fuzzy_index = other._fuzzy_index
+        self._saved_searches = other._saved_searches
+        self._index_cache_checked = True
+        self._index_dirty = self._index_dirty or other._index_dirty
+        self._last_refresh = other._last_refresh
+        self._written_keys = set()
+        for file_key in written_keys:
+            self._update_record(file_key)
+        self.generation += 1
+
+    def entries(self):
+        """
+        すべての日記の索引レコードを返す（ファイルキー順）
+        """
+        self.refresh()
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self._records)
+        return [self._records[file_key] for file_key in self._sorted_keys]
+
+    def bitmap_index(self):
+        """
+        タグ・気分・日付で日記を絞り込むためのビットマップ索引（BitmapIndex）を返す
+        """
+        self.refresh()
+        if self._bitmap_index is None:
+            self._bitmap_index = BitmapIndex(self._records.values())
+        return self._bitmap_index
+
+    def full_text_index(self):
+        """
+        キーワードの全文索引（diary_search.FullTextIndex）を返す
+        """
+        self.refresh()
+        if self._full_text_index is None:
+            from diary_search import FullTextIndex
+            self._full_text_index = FullTextIndex(self._records.values())
+        return self._full_text_index
+
+    def fuzzy_index(self):
+        """
+        日記へ移動するためのあいまい検索の索引（diary_fuzzy.FuzzyIndex）を返す
+        """
+        self.refresh()
+        if self._fuzzy_index is None:
+            from diary_fuzzy import FuzzyIndex
+            self._fuzzy_index = FuzzyIndex(self._records.values())
+        return self._fuzzy_index
+
+    def get_entry(self, file_key):
+        """
+        ファイルキーに対応する索引レコードを返す（ない場合はNone）
+        """
+        if file_key not in self._records:
+            self.refresh()
+        return self._records.get(file_key)
+
+    def get_entries(self, file_keys):
+        """
+        ファイルキーのリストに対応する索引レコードのリストを返す（索引にない日記は除く。フォルダは走査しない）
+        """
+        records = self._records
+        return [records[file_key] for file_key in file_keys if file_key in records]
+
+    def read_entry(self, file_key):
+        """
+        日記ファイルの内容をすべて読み込む
+
+        Returns:
+            dict or None: 日記データ（読み込めない場合はNone）
+        """
+        try:
+            with open(self.entry_path(file_key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def entries_on_date(self, date_str):
+        """
+        指定した日付（yyyy-MM-dd）の日記の索引レコードを返す（ファイルキー順）
+        """
+        return [record for record in self.entries_between(date_str, date_str)
+                if record["file_key"].startswith(date_str)]
+
+    def entries_between(self, date_from=None, date_to=None):
+        """
+        日付が範囲内の日記の索引レコードを日付順に返す（日付のない日記は含まない）
+        日付順の索引を bisect で探すため、範囲外の日記は調べない
+
+        Args:
+            date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+            date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+        """
+        index = self.bitmap_index()
+        return self._records_in_range(index, *index.date_range(date_from, date_to))
+
+    def entries_in_period(self, period):
+        """
+        日付が period（yyyy や yyyy-MM）で始まる日記の索引レコードを日付順に返す
+        """
+        index = self.bitmap_index()
+        return self._records_in_range(index, *index.period_range(period))
+
+    def _records_in_range(self, index, start, end):
+        records = self._records
+        return [records[file_key] for file_key in index.keys[start:end] if file_key is not None]
+
+    def adjacent_entry(self, file_key, step, date_str=None):
+        """
+        日付順で前または次の日記のファイルキーを返す（ない場合はNone）
+
+        Args:
+            file_key (str or None): 基準にする日記のファイルキー
+            step (int): -1 の場合は前の日記、1 の場合は次の日記
+            date_str (str, optional): file_key がNone（まだ保存していない日記）の場合に基準にする日付。
+                この日付より前または後の日記を探す
+        """
+        index = self.bitmap_index()
+        ordinal = index.ordinals.get(file_key) if file_key is not None else None
+        if ordinal is None:
+            if not date_str:
+                return None
+            start, end = index.date_range(date_str, date_str)
+            ordinal = start if step < 0 else end - 1
+        return index.adjacent(ordinal, step)
+
+    def find_entry(self, date_str, title):
+        """
+        日付とタイトルが一致する日記のファイルキーを返す（ない場合はNone）
+        """
+        for record in self.entries_on_date(date_str):
+            if not record["error"] and record["title"] == title:
+                return record["file_key"]
+        return None
+
+    def diary_dates(self, date_strs=None, period=None):
+        """
+        日記がある日付ごとの件数とお気に入りの有無を返す
+
+        Args:
+            date_strs (iterable): 集計する日付（yyyy-MM-dd）。Noneの場合はすべての日付
+            period (str, optional): 集計する月や年（yyyy-MM や yyyy）。date_strs と同時には指定しない
+
+        Returns:
+            dict: 日付 (yyyy-MM-dd) -> {"count": 件数, "favorite": お気に入りがあるか}
+        """
+        favorites = set(self.metadata["favorites"])
+        if date_strs is not None:
+            records = [record for date_str in sorted(set(date_strs)) if date_str
+                       for record in self.entries_between(date_str, date_str)]
+        elif period is not None:
+            records = self.entries_in_period(period)
+        else:
+            records = self.entries_between()
+        dates = {}
+        for record in records:
+            info = dates.setdefault(record["date"], {"count": 0, "favorite": False})
+            info["count"] += 1
+            if record["file_key"] in favorites:
+                info["favorite"] = True
+        return dates
+
+    # ---- 保存・削除・お気に入り ----
+
+    def save_entry(self, date_str, title, content, mood, tags, expected_revision=None):
+        """
+        日記を保存する
+        同じ日付でタイトルが同じ日記があれば上書きし、なければ新しいファイルを作る
+
+        Args:
+            date_str (str): 日付（yyyy-MM-dd）
+            title (str): タイトル
+            content (str): 本文のHTML（画像パスは日記フォルダからの相対パス）
+            mood (str): 気分
+            tags (list): タグ
+            expected_revision (int): 上書きする日記を読み込んだときの revision。
+                ファイルの revision がこれと異なる（読み込んだ後に他で保存された）場合は
+                ConflictError を送出する。Noneの場合は確認せずに上書きする
+
+        Returns:
+            str: 保存した日記のファイルキー
+        """
+        with self.write_lock:
+            # 同じタイトルがあれば上書きし、なければ新しいファイル名を決める
+            file_key = self.find_entry(date_str, title)
+            revision = 0
+            current = None
+            if file_key is None:
+                file_key = new_file_key(self.diary_folder, date_str, title)
+            else:
+                current = self.read_entry(file_key)
+                if current is not None:
+                    revision = current.get("revision", 0)
+                    if expected_revision is not None and revision != expected_revision:
+                        raise ConflictError(file_key, revision)
+
+            # メタデータに追加
+            for tag in tags:
+                if tag not in self.metadata["tags"]:
+                    self.metadata["tags"].append(tag)
+
+            data = {
+                "title": title,
+                "content": content,
+                "mood": mood,
+                "tags": tags,
+                "date": date_str,
+                "last_modified": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "revision": revision + 1
+            }
+            self._archive_version(file_key, current, data)
+            write_json_atomic(self.entry_path(file_key), data)
+            self._update_record(file_key)
+            self.change_log.append([{"op": "entry_updated" if current is not None else "entry_created",
+                                     "file_key": file_key, "revision": data["revision"]}])
+            self.save_metadata()
+        return file_key
+
+    def write_entry_data(self, file_key, data):
+        """
+        日記のデータ（バックアップや別の日記フォルダから取り出したもの）をそのまま書き込む
+        revision は今の版より大きくし、この日記を開いている他のインスタンスが上書き前に気づけるようにする
+
+        Args:
+            file_key (str): 書き込む日記のファイルキー
+            data (dict): 日記のデータ
+
+        Returns:
+            int: 書き込んだ日記の revision
+        """
+        with self.write_lock:
+            current = self.read_entry(file_key)
+            data = dict(data)
+            if current is not None:
+                data["revision"] = max(data.get("revision", 0), current.get("revision", 0) + 1)
+            self._archive_version(file_key, current, data)
+            write_json_atomic(self.entry_path(file_key), data)
+            self._update_record(file_key)
+            self.change_log.append([{"op": "entry_updated" if current is not None else "entry_created",
+                                     "file_key": file_key, "revision": data.get("revision", 0)}])
+        return data.get("revision", 0)
+
+    def write_imported_entries(self, entries):
+        """
+        インポートした日記をまとめて書き込む（書き込みロックと変更履歴への追記はまとめて1回だけ行う）
+        ファイルの有無はロックの中で確かめ直し、インポート中に他のインスタンスが作った日記を置き換えない
+
+        Args:
+            entries (list): (ファイルキー, 日記のデータ, 既存の日記を上書きするかどうか) のリスト。
+                上書きしない場合にファイルキーがすでに使われていれば、新しいファイルキーで書き込む。
+                上書きする場合は write_entry_data と同じく今の内容を過去の版に残し、revision を今の版より大きくする
+
+        Returns:
+            list: 書き込んだ日記のファイルキー（entries と同じ順）
+        """
+        file_keys = []
+        events = []
+        with self.write_lock:
+            for file_key, data, overwrite in entries:
+                current = None
+                if os.path.exists(self.entry_path(file_key)):
+                    if overwrite:
+                        current = self.read_entry(file_key)
+                    else:
+                        file_key = new_file_key(self.diary_folder, data["date"], data["title"])
+                data = dict(data)
+                if current is not None:
+                    data["revision"] = max(data.get("revision", 0), current.get("revision", 0) + 1)
+                self._archive_version(file_key, current, data)
+                write_json_atomic(self.entry_path(file_key), data)
+                self._update_record(file_key)
+                file_keys.append(file_key)
+                events.append({"op": "entry_updated" if current is not None else "entry_created",
+                               "file_key": file_key, "revision": data.get("revision", 0)})
+            self.change_log.append(events)
+        return file_keys
+
+    @property
+    def history(self):
+        """
+        日記ごとの過去の版（diary_history.EntryHistory）
+        """
+        if self._history is None:
+            from diary_history import EntryHistory
+            self._history = EntryHistory(os.path.join(self.internal_folder, HISTORY_DIR_NAME))
+        return self._history
+
+    def _archive_version(self, file_key, current, data=None):
+        """
+        上書き・削除する前の日記の内容を過去の版として残す（内容が変わらない上書きは残さない）
+        """
+        if current is None or (data is not None and entry_checksum(current) == entry_checksum(data)):
+            return
+        self.history.add(file_key, current)
+
+    def entry_versions(self, file_key):
+        """
+        日記の過去の版の一覧を新しい順に返す（diary_history.EntryHistory.versions を参照）
+        削除した日記の版も残っている
+        """
+        return self.history.versions(file_key)
+
+    def entry_version(self, file_key, index):
+        """
+        日記の過去の版を本文を含めて返す
+
+        Args:
+            file_key (str): 日記のファイルキー
+            index (int): entry_versions() の中の位置
+        """
+        return self.history.version(file_key, index)
+
+    def restore_version(self, file_key, index):
+        """
+        日記を過去の版に戻す（今の内容は新しい版として履歴に残るため、元に戻すこともできる）
+
+        Returns:
+            int: 書き込んだ日記の revision
+        """
+        data = self.entry_version(file_key, index)
+        data["last_modified"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self.write_entry_data(file_key, data)
+
+    def delete_entry(self, file_key):
+        """
+        日記を削除する（お気に入りからも削除する）
+        """
+        with self.write_lock:
+            self._archive_version(file_key, self.read_entry(file_key))
+            os.remove(self.entry_path(file_key))
+            self._update_record(file_key)
+            self.change_log.append([{"op": "entry_deleted", "file_key": file_key}])
+
+            self._reload_metadata_if_changed()
+            if file_key in self.metadata["favorites"]:
+                self.metadata["favorites"].remove(file_key)
+                self.save_metadata()
+
+    def is_favorite(self, file_key):
+        """
+        お気に入りに登録されているかどうか
+        """
+        return file_key in self.metadata["favorites"]
+
+    def toggle_favorite(self, file_key):
+        """
+        お気に入り状態を切り替える
+
+        Returns:
+            bool: 切り替え後にお気に入りであればTrue
+        """
+        with self.write_lock:
+            # 他のインスタンスで切り替えられていれば、その状態から切り替える
+            self._reload_metadata_if_changed()
+            if file_key in self.metadata["favorites"]:
+                self.metadata["favorites"].remove(file_key)
+                favorite = False
+            else:
+                self.metadata["favorites"].append(file_key)
+                favorite = True
+            self.save_metadata()
+        return favorite
+
+    def favorite_entries(self):
+        """
+        お気に入りの日記の索引レコードを新しい順に返す（ファイルがないものは除く）
+        """
+        self.refresh()
+        return [self._records[file_key] for file_key in sorted(self.metadata["favorites"], reverse=True)
+                if file_key in self._records and not self._records[file_key]["error"]]
+
+    # ---- 変更履歴 ----
+
+    def changes_since(self, cursor=None, limit=None):
+        """
+        カーソルより後に記録された変更を古い順に返す（ChangeLog を参照）
+        日記を書き込んだすべてのインスタンス・ツールの変更が含まれる
+
+        Args:
+            cursor (str): 前回返されたカーソル（Noneの場合は最初から）
+            limit (int, optional): 返す最大件数
+
+        Returns:
+            tuple: (変更のリスト, 次に渡すカーソル)
+        """
+        return self.change_log.read(cursor, limit)
+
+    def changes_cursor(self):
+        """
+        変更履歴の現在の末尾を指すカーソルを返す
+        """
+        return self.change_log.end_cursor()
+
+    # ---- 検索 ----
+
+    def entries_with_tag(self, tag):
+        """
+        タグが付いた日記を日付の新しい順に返す
+        """
+        index = self.bitmap_index()
+        matching_entries = [self._records[file_key] for file_key in index.file_keys(index.select(tags=[tag]))]
+        matching_entries.sort(key=lambda record: record["date"], reverse=True)
+        return matching_entries
+
+    def tag_counts(self):
+        """
+        タグごとの日記の件数を返す
+        """
+        return self.bitmap_index().tag_counts()
+
+    def mood_counts(self):
+        """
+        気分ごとの日記の件数を返す（気分が記録されていない日記は数えない）
+        """
+        return self.bitmap_index().mood_counts()
+
+    def search(self, keyword):
+        """
+        タイトル・本文・タグに対するキーワード検索
+        （大文字/小文字・全角/半角・ひらがな/カタカナを区別しない。diary_search.fold_text を参照）
+
+        Returns:
+            list: 一致した日記の索引レコード（日付の新しい順）
+        """
+        from diary_query import build_query, execute_query
+
+        keyword = keyword.strip()
+        if not keyword:
+            return []
+        return execute_query(self, build_query(keyword))[0]
+
+    def advanced_search(self, keyword="", date_from=None, date_to=None, tag=None, mood=None,
+                        title_only=False, case_sensitive=False, exact_match=False, fold=True):
+        """
+        条件を組み合わせた詳細検索
+
+        Args:
+            keyword (str): キーワード（空の場合はキーワードで絞り込まない）
+            date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+            date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+            tag (str or list, optional): タグ（リストの場合はすべてが付いている日記）
+            mood (str, optional): 気分
+            title_only (bool): タイトルのみを検索する
+            case_sensitive (bool): 大文字/小文字を区別する
+            exact_match (bool): 単語として完全に一致するものだけを探す
+            fold (bool): 全角/半角・ひらがな/カタカナの違いを区別しない（case_sensitive の場合は使わない）
+
+        Returns:
+            list: 一致した日記の索引レコード（日付の新しい順）
+        """
+        from diary_query import build_query, execute_query
+
+        tags = [tag] if isinstance(tag, str) else (tag or [])
+        query = build_query(keyword.strip(), date_from, date_to, [tag for tag in tags if tag], mood,
+                            title_only, case_sensitive, exact_match, fold)
+        return execute_query(self, query)[0]
+
+    def regex_search(self, pattern, date_from=None, date_to=None, tag=None, mood=None, title_only=False,
+                     case_sensitive=False, limit=None, timeout=None):
+        """
+        正規表現で日記を検索する（キーワード以外の条件は advanced_search と同じ。diary_regex を参照）
+
+        Args:
+            pattern (str): 正規表現
+            limit (int, optional): 結果の件数の上限（省略時は diary_regex.REGEX_RESULT_LIMIT）
+            timeout (float, optional): 制限時間（秒、省略時は diary_regex.REGEX_TIMEOUT）
+
+        Returns:
+            dict: 一致した日記の (索引レコード, 一致した範囲のリスト) のリスト ("matches"、日付の新しい順。
+                  範囲は diary_search.search_text() の文字列での位置)、件数が上限に達して打ち切ったかどうか
+                  ("limited")、制限時間を過ぎて打ち切ったかどうか ("timed_out")
+
+        Raises:
+            diary_query.QueryError: 正規表現が正しくない場合
+        """
+        from diary_regex import compile_pattern, regex_search, REGEX_RESULT_LIMIT, REGEX_TIMEOUT
+
+        regex = compile_pattern(pattern, case_sensitive)
+        records = self.advanced_search("", date_from, date_to, tag, mood)
+        return regex_search(records, regex, title_only, limit or REGEX_RESULT_LIMIT, timeout or REGEX_TIMEOUT)
+
+    def rank_entries(self, records, keywords):
+        """
+        検索結果をキーワードとの関連度（BM25）の高い順に並べる
+        関連度が同じ日記は元の順（search() などの結果では日付の新しい順）のまま
+
+        Args:
+            records (list): 索引レコード
+            keywords (list): キーワード（空の場合は並べ替えない）
+
+        Returns:
+            list: 並べ替えた索引レコード
+        """
+        if not keywords:
+            return records
+        scores = self.full_text_index().scores([record["file_key"] for record in records], keywords)
+        # sorted は安定なため、reverse=True でも関連度が同じ日記の順は変わらない
+        order = sorted(range(len(records)), key=scores.__getitem__, reverse=True)
+        return [records[index] for index in order]
+
+    def entry_snippet(self, record, keywords):
+        """
+        検索結果に表示する、キーワードの前後の本文の抜粋を作る（diary_search.FullTextIndex.snippet を参照）
+
+        Returns:
+            tuple: (抜粋の文字列, 抜粋の中のキーワードの範囲 (開始, 終了) のリスト)
+        """
+        return self.full_text_index().snippet(record, keywords)
+
+    def find_entries(self, text, limit=None):
+        """
+        日付・タイトル・タグに対するあいまい検索（「日記へ移動」で使う。並び順は diary_fuzzy を参照）
+
+        Args:
+            text (str): 入力（例: 2024-05 旅行、rkd）
+            limit (int, optional): 返す件数の上限（省略時は diary_fuzzy.FUZZY_RESULT_LIMIT）
+
+        Returns:
+            list: 一致した日記の索引レコード
+        """
+        index = self.fuzzy_index()
+        file_keys = index.search(text) if limit is None else index.search(text, limit)
+        return self.get_entries(file_keys)
+
+    def query(self, text, case_sensitive=False, fold=True):
+        """
+        検索式で日記を検索する（書き方は diary_query を参照）
+
+        Args:
+            text (str): 検索式（例: tag:旅行 mood:楽しい after:2024-01 "海の家" -雨 海 OR 山）
+            case_sensitive (bool): キーワードの大文字/小文字を区別する
+            fold (bool): キーワードの全角/半角・ひらがな/カタカナの違いを区別しない
+
+        Returns:
+            list: 一致した日記の索引レコード（キーワードを含む場合は関連度の高い順、含まない場合は日付の新しい順）
+
+        Raises:
+            diary_query.QueryError: 検索式が正しくない場合
+        """
+        from diary_query import parse_query, execute_query, query_keywords
+
+        query = parse_query(text, case_sensitive, fold)
+        return self.rank_entries(execute_query(self, query)[0], query_keywords(query))
+
+    def _saved_search_list(self):
+        """
+        保存した検索（diary_saved.SavedSearches）を返す（一致する日記の集合は最新にする）
+        """
+        self.refresh()
+        if self._saved_searches is None:
+            from diary_saved import SavedSearches, SAVED_SEARCHES_STATE
+            self._saved_searches = SavedSearches(self.load_state(SAVED_SEARCHES_STATE, []))
+        self._saved_searches.refresh(self)
+        return self._saved_searches
+
+    def saved_searches(self):
+        """
+        保存した検索の一覧を返す（件数は日記の変更のたびに更新している集合の大きさで、検索し直さない）
+
+        Returns:
+            list: 名前 ("name")・検索式 ("query")・一致する日記の件数 ("count") の辞書のリスト（保存した順）
+        """
+        return [{"name": search.name, "query": search.text, "count": len(search.matches)}
+                for search in self._saved_search_list().searches]
+
+    def save_search(self, name, text, case_sensitive=False, fold=True):
+        """
+        検索式に名前を付けて保存する（同じ名前の検索があれば置き換える）
+
+        Args:
+            name (str): 名前
+            text (str): 検索式（書き方は diary_query を参照）
+            case_sensitive (bool): キーワードの大文字/小文字を区別する
+            fold (bool): キーワードの全角/半角・ひらがな/カタカナの違いを区別しない
+
+        Returns:
+            int: 一致する日記の件数
+
+        Raises:
+            diary_query.QueryError: 検索式が正しくない場合
+        """
+        from diary_saved import SavedSearch, SavedSearches, SAVED_SEARCHES_STATE
+
+        search = SavedSearch(name, text, case_sensitive, fold)
+        saved = self._saved_search_list()
+        saved.put(search)
+        search.build(self)
+        # 他のプロセスが保存した検索を消さないように、ファイルの一覧に反映して保存する
+        stored = SavedSearches(self.load_state(SAVED_SEARCHES_STATE, []))
+        stored.put(search)
+        self.save_state(SAVED_SEARCHES_STATE, stored.to_list())
+        return len(search.matches)
+
+    def delete_saved_search(self, name):
+        """
+        保存した検索を削除する
+
+        Returns:
+            bool: 削除した場合はTrue
+        """
+        from diary_saved import SavedSearches, SAVED_SEARCHES_STATE
+
+        removed = self._saved_search_list().remove(name)
+        stored = SavedSearches(self.load_state(SAVED_SEARCHES_STATE, []))
+        if stored.remove(name):
+            self.save_state(SAVED_SEARCHES_STATE, stored.to_list())
+            removed = True
+        return removed
+
+    def saved_search_entries(self, name):
+        """
+        保存した検索に一致する日記を返す（日記の変更のたびに更新している集合を並べるだけで、検索し直さない）
+
+        Returns:
+            list or None: 一致した日記の索引レコード（日付の新しい順）。その名前の検索がない場合はNone
+        """
+        search = self._saved_search_list().get(name)
+        if search is None:
+            return None
+        return self.get_entries(search.file_keys())
+
+    def explain(self, text, case_sensitive=False, fold=True):
+        """
+        検索式を実行し、実行計画（使った索引と、各手順の見積もり・実際の件数・時間）を文字列で返す
+        遅い検索式の原因を調べるために使う
+
+        Raises:
+            diary_query.QueryError: 検索式が正しくない場合
+        """
+        from diary_query import parse_query, execute_query, format_steps
+
+        return format_steps(execute_query(self, parse_query(text, case_sensitive, fold))[1])
+
+    # ---- 統計 ----
+
+    def _collect_stats(self, prefix):
+        """
+        日付が prefix で始まる日記の件数・気分・タグを集計する
+        """
+        stats = {"count": 0, "moods": {}, "tags": {}, "months": {}}
+        for record in self.entries_in_period(prefix):
+            stats["count"] += 1
+
+            month_str = record["date"][:7]
+            stats["months"][month_str] = stats["months"].get(month_str, 0) + 1
+
+            mood = record["mood"] or "不明"
+            stats["moods"][mood] = stats["moods"].get(mood, 0) + 1
+
+            for tag in record["tags"]:
+                stats["tags"][tag] = stats["tags"].get(tag, 0) + 1
+        return stats
+
+    def month_stats(self, month_str):
+        """
+        月間統計を求める
+
+        Args:
+            month_str (str): 対象の月（yyyy-MM）
+
+        Returns:
+            dict: 日記数 ("count")、気分ごとの件数 ("moods")、タグごとの件数 ("tags")
+        """
+        stats = self._collect_stats(month_str)
+        del stats["months"]
+        return stats
+
+    def year_stats(self, year_str):
+        """
+        年間統計を求める
+
+        Args:
+            year_str (str): 対象の年（yyyy）
+
+        Returns:
+            dict: 日記数 ("count")、月ごとの件数 ("months"、1月～12月すべて)、
+                  気分ごとの件数 ("moods")、タグごとの件数 ("tags")
+        """
+        stats = self._collect_stats(year_str)
+        months = {f"{year_str}-{str(month).zfill(2)}": 0 for month in range(1, 13)}
+        for month_str, count in stats["months"].items():
+            if month_str in months:
+                months[month_str] = count
+        stats["months"] = months
+        return stats
+
+    # ---- インポート/エクスポート ----
+
+    def export_zip(self, zip_file_path, date_from=None, date_to=None, tag=None, progress_callback=None):
+        """
+        日記を画像付きで1つのZIPファイルにエクスポートする（bulk_export_zip を参照）
+        """
+        return bulk_export_zip(self.diary_folder, zip_file_path, date_from, date_to, tag, progress_callback)
+
+    def export_site(self, output_dir, progress_callback=None):
+        """
+        日記を静的なHTMLサイトとして書き出す（export_static_site を参照）
+        """
+        return export_static_site(self.diary_folder, output_dir, progress_callback)
+
+    def export_jsonl(self, output, date_from=None, date_to=None, tag=None):
+        """
+        日記をJSON Lines形式で書き出す（export_jsonl を参照）
+        """
+        return export_jsonl(self.diary_folder, output, date_from, date_to, tag, self.metadata["favorites"])
+
+    def import_jsonl(self, input_path):
+        """
+        JSON Lines形式の日記をインポートする（import_jsonl を参照）
+        """
+        result = import_jsonl(self, input_path)
+        self.save_metadata()
+        return result
+
+    def bulk_import(self, paths, progress_callback=None):
+        """
+        フォルダ・ZIP・JSONLなどから日記をまとめてインポートする（bulk_import を参照）
+        """
+        return bulk_import(self, paths, progress_callback)
+
+    # ---- バックアップ ----
+
+    def backup(self, backup_dir, progress_callback=None):
+        """
+        日記フォルダの増分バックアップ（スナップショット）を作る（diary_backup.create_snapshot を参照）
+        作成中は書き込みを止め、すべてのファイルが同じ時点の内容になるようにする
+        """
+        from diary_backup import create_snapshot
+        with self.write_lock:
+            return create_snapshot(self.diary_folder, backup_dir, progress_callback)
+
+    def restore_entry(self, backup_dir, file_key, at=None, snapshot_id=None):
+        """
+        バックアップから日記1件を復元する
+        日記が参照している画像のうち、日記フォルダにないものも復元する
+
+        Args:
+            backup_dir (str): バックアップ先のフォルダ
+            file_key (str): 復元する日記のファイルキー
+            at (str, optional): この日時（yyyy-MM-dd [HH:MM]）の時点で最新のスナップショットから復元する
+            snapshot_id (str, optional): 復元に使うスナップショット（at より優先。どちらもなければ最新）
+
+        Returns:
+            dict: 使ったスナップショット ("snapshot") と、復元した画像の数 ("images")
+        """
+        import shutil
+        from diary_backup import snapshot_at, read_backup_entry
+
+        if snapshot_id is None:
+            snapshot_id = snapshot_at(backup_dir, at)
+        content, images = read_backup_entry(backup_dir, file_key, snapshot_id)
+        data = json.loads(content.decode('utf-8'))
+
+        restored_images = 0
+        with self.write_lock:
+            for rel_path, object_path in images.items():
+                dest_path = os.path.join(self.diary_folder, rel_path)
+                if not os.path.exists(dest_path):
+                    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                    shutil.copyfile(object_path, dest_path)
+                    restored_images += 1
+
+            self.write_entry_data(file_key, data)
+        return {"snapshot": snapshot_id, "images": restored_images}
+
+
+# エクスポート用HTMLテンプレート
+HTML_EXPORT_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+    <style>
+        body {{ font-family: "Yu Gothic", sans-serif; margin: 20px; }}
+        .diary-date {{ color: #555; }}
+        .diary-title {{ font-size: 1.5em; margin: 10px 0; }}
+        .diary-content {{ margin-top: 20px; }}{extra_style}
+    </style>
+</head>
+<body>
+    <div class="diary-date">{date}</div>
+    <h1 class="diary-title">{title}</h1>
+    <div class="diary-content">{content}</div>
+</body>
+</html>"""
+
+# 画像付きエクスポートで追加するスタイル
+IMAGE_EXPORT_STYLE = "\n        img { max-width: 100%; height: auto; }"
+
+# 既に圧縮済みの画像形式（ZIPでは再圧縮せずに格納する）
+COMPRESSED_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+
+def build_export_html(title, date_str, content, extra_style=""):
+    """
+    エクスポート用のHTML文書を組み立てる
+
+    Args:
+        title (str): 日記のタイトル
+        date_str (str): 表示用の日付文字列
+        content (str): 日記本文のHTML
+        extra_style (str): 追加するCSS
+
+    Returns:
+        str: HTML文書
+    """
+    return HTML_EXPORT_TEMPLATE.format(title=title, date=date_str, content=content, extra_style=extra_style)
+
+
+def find_image_sources(html_content, diary_folder):
+    """
+    HTML内で参照されているローカル画像を抽出する
+
+    Args:
+        html_content (str): 日記本文のHTML
+        diary_folder (str): 相対パスの基準となる日記フォルダ
+
+    Returns:
+        list: (src属性の値, 画像の絶対パス) のリスト（同じsrcは1回のみ）
+    """
+    import urllib.parse
+
+    diary_abs_path = os.path.abspath(diary_folder)
+    sources = []
+    seen = set()
+    for match in re.finditer(r'src="([^"]+)"', html_content):
+        src = match.group(1)
+        if src in seen or src.startswith(("http:", "https:")):
+            continue
+        seen.add(src)
+
+        path = src[len("file://"):] if src.startswith("file://") else src
+        path = urllib.parse.unquote(path)
+        if not os.path.isabs(path):
+            # 相対パスは日記フォルダからの相対パス
+            path = os.path.join(diary_abs_path, path)
+        if os.path.isfile(path):
+            sources.append((src, os.path.abspath(path)))
+    return sources
+
+
+class ZipImageWriter:
+    """
+    ZIPファイルに画像を重複なく直接書き込むヘルパー
+    同じ画像が複数回参照されても1回だけ格納する
+    """
+    def __init__(self, zipf, folder="images"):
+        self.zipf = zipf
+        self.folder = folder
+        self.arcnames = {}  # 絶対パス -> ZIP内のパス
+        self.used_names = set()
+
+    def add(self, abs_path):
+        """
+        画像をZIPに追加し、ZIP内のパスを返す（追加済みなら既存のパスを返す）
+        """
+        import zipfile
+
+        real_path = os.path.realpath(abs_path)
+        if real_path in self.arcnames:
+            return self.arcnames[real_path]
+
+        # ファイル名の衝突を避ける
+        base_name = os.path.basename(real_path)
+        stem, ext = os.path.splitext(base_name)
+        name = base_name
+        counter = 1
+        while name in self.used_names:
+            name = f"{stem}-{counter}{ext}"
+            counter += 1
+        self.used_names.add(name)
+
+        arcname = f"{self.folder}/{name}"
+        # 圧縮済み形式はそのまま格納し、ファイルから直接ストリーミングする
+        if ext.lower() in COMPRESSED_IMAGE_EXTENSIONS:
+            compress_type = zipfile.ZIP_STORED
+        else:
+            compress_type = zipfile.ZIP_DEFLATED
+        self.zipf.write(real_path, arcname=arcname, compress_type=compress_type)
+
+        self.arcnames[real_path] = arcname
+        return arcname
+
+    @property
+    def count(self):
+        return len(self.arcnames)
+
+
+def _prepare_bulk_export_entry(diary_folder, file_name, tag):
+    """
+    一括エクスポート用に1件の日記を読み込む（ワーカースレッドで実行）
+
+    Returns:
+        dict or None: タグが一致しない場合はNone
+    """
+    file_path = os.path.join(diary_folder, file_name)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        raw = f.read()
+    data = json.loads(raw)
+
+    if tag and tag not in data.get("tags", []):
+        return None
+
+    content = data.get("content", "")
+    return {
+        "file_key": file_name[:-5],
+        "raw": raw,
+        "data": data,
+        "content": content,
+        "images": find_image_sources(content, diary_folder)
+    }
+
+
+def bulk_export_zip(diary_folder, zip_file_path, date_from=None, date_to=None, tag=None,
+                    progress_callback=None, max_workers=None):
+    """
+    複数の日記を画像付きで1つのZIPファイルにストリーミングでエクスポートする
+
+    日記の読み込みと変換はスレッドプールで並列に行い、先読み数を制限することで
+    アーカイブの大きさに関係なくメモリ使用量を一定に保つ。
+    画像は一時ファイルを作らずに元のファイルからZIPへ直接書き込み、重複は1回だけ格納する。
+
+    ZIPの構成:
+        index.html              日記の一覧
+        entries/<キー>.html     各日記のHTML
+        entries/<キー>.json     各日記の元データ
+        images/<ファイル名>     参照されている画像
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        zip_file_path (str): 出力するZIPファイルのパス
+        date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+        date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+        tag (str, optional): このタグが付いた日記のみをエクスポートする
+        progress_callback (callable, optional): progress_callback(処理済み件数, 総件数) の形で呼ばれる。
+            Falseを返すと処理を中断する
+        max_workers (int, optional): 読み込みに使うスレッド数
+
+    Returns:
+        dict: エクスポート件数 ("entries")、画像数 ("images")、中断されたかどうか ("cancelled")
+    """
+    import html
+    import zipfile
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    # ファイル名の日付部分で対象を絞り込む（ファイルを開く必要がない）
+    file_names = []
+    for file_name in sorted(os.listdir(diary_folder)):
+        if is_entry_file(file_name):
+            date_str = entry_date_str(file_name[:-5])
+            if date_from and date_str < date_from:
+                continue
+            if date_to and date_str > date_to:
+                continue
+            file_names.append(file_name)
+
+    total = len(file_names)
+    if max_workers is None:
+        max_workers = min(8, (os.cpu_count() or 1) + 2)
+    # 先読みする件数の上限（メモリ使用量を抑える）
+    window = max_workers * 4
+
+    index_rows = []
+    exported = 0
+    cancelled = False
+
+    with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zipf, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        images = ZipImageWriter(zipf)
+        pending = deque()
+        names = iter(file_names)
+        done = 0
+
+        def fill():
+            while len(pending) < window:
+                file_name = next(names, None)
+                if file_name is None:
+                    return
+                pending.append((file_name, executor.submit(_prepare_bulk_export_entry, diary_folder, file_name, tag)))
+
+        fill()
+        while pending:
+            file_name, future = pending.popleft()
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"ファイル読み込みエラー: {file_name} - {str(e)}")
+                entry = None
+
+            if entry is not None:
+                file_key = entry["file_key"]
+                data = entry["data"]
+                content = entry["content"]
+
+                # 画像を書き込み、HTML内のパスをZIP内のパスに置き換える
+                for src, abs_path in entry["images"]:
+                    arcname = images.add(abs_path)
+                    content = content.replace(f'src="{src}"', f'src="../{arcname}"')
+
+                title = data.get("title", "無題")
+                date_str = data.get("date", entry_date_str(file_key))
+                html_content = build_export_html(html.escape(title), format_jp_date(date_str), content, IMAGE_EXPORT_STYLE)
+                zipf.writestr(f"entries/{file_key}.html", html_content)
+                zipf.writestr(f"entries/{file_key}.json", entry["raw"])
+
+                index_rows.append((date_str, file_key, title))
+                exported += 1
+
+            done += 1
+            fill()
+            if progress_callback and progress_callback(done, total) is False:
+                cancelled = True
+                for _, remaining in pending:
+                    remaining.cancel()
+                break
+
+        # 一覧ページ
+        items = []
+        for date_str, file_key, title in sorted(index_rows, reverse=True):
+            items.append(f'        <li>{format_jp_date(date_str)}: <a href="entries/{file_key}.html">{html.escape(title)}</a></li>')
+        list_html = "<ul>\n" + "\n".join(items) + "\n    </ul>"
+        zipf.writestr("index.html", build_export_html("日記一覧", f"{exported}件", list_html))
+
+    return {"entries": exported, "images": images.count, "cancelled": cancelled}
+
+
+# 静的サイトのマニフェストファイル名
+SITE_MANIFEST_NAME = ".site-manifest.json"
+
+# ページの出力内容を変えたときに上げる（全ページを再生成させる）
+SITE_TEMPLATE_VERSION = 2
+
+# 静的サイトで日付のない日記の一覧を置くフォルダ
+SITE_UNDATED_DIR = "undated"
+
+# 静的サイトで追加するスタイル
+SITE_EXPORT_STYLE = IMAGE_EXPORT_STYLE + """
+        .site-nav { font-size: 0.9em; margin-bottom: 10px; }
+        .site-nav a { margin-right: 10px; }
+        .diary-tags a { margin-right: 8px; }"""
+
+
+def site_slug(text):
+    """
+    タグなどをファイル名として使える文字列に変換する
+    """
+    slug = re.sub(r'[\\/:*?"<>|#%&\s]+', '-', text).strip('-.')
+    return slug or "untitled"
+
+
+def _site_entry_date(file_key, data):
+    """
+    静的サイトで使う日記の日付を返す
+    日記の日付が正しくない場合は、索引と同じくファイルキー・更新日時の日付を使い、どれもなければ空文字列を返す
+    """
+    for date_str in (data.get("date"), entry_date_str(file_key), str(data.get("last_modified", ""))[:10]):
+        if isinstance(date_str, str) and is_valid_date(date_str):
+            return date_str
+    return ""
+
+
+def _site_entry_label(date_str, title):
+    """
+    一覧ページに表示する日記の見出し（日付がない日記はタイトルだけ）
+    """
+    return f"{format_jp_date(date_str)}: {title}" if date_str else title
+
+
+def _site_page_hash(*parts):
+    """
+    ページの入力からハッシュ値を計算する
+    """
+    import hashlib
+
+    payload = json.dumps([SITE_TEMPLATE_VERSION] + list(parts), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _site_list_html(rows):
+    """
+    (リンク先, 表示テキスト) のリストからHTMLのリストを作る
+    """
+    import html
+
+    items = [f'        <li><a href="{href}">{html.escape(text)}</a></li>' for href, text in rows]
+    return "<ul>\n" + "\n".join(items) + "\n    </ul>"
+
+
+def _render_site_page(job):
+    """
+    静的サイトの1ページを描画して書き込む（プロセスプールで実行）
+
+    Args:
+        job (dict): "kind" が "entry" の場合は日記ページ、"list" の場合は一覧ページ
+
+    Returns:
+        tuple: (ページのパス, 参照している画像の (ファイル名, 絶対パス) のリスト)
+    """
+    import html
+
+    output_dir = job["output_dir"]
+    page_path = job["page"]
+    images = []
+
+    if job["kind"] == "entry":
+        with open(job["source"], 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        title = data.get("title", "無題")
+        date_str = job["date"]
+        content = data.get("content", "")
+
+        # 画像は images/ にまとめ、ページからの相対パスに置き換える
+        for src, abs_path in find_image_sources(content, job["diary_folder"]):
+            image_name = os.path.basename(abs_path)
+            images.append((image_name, abs_path))
+            content = content.replace(f'src="{src}"', f'src="../images/{image_name}"')
+
+        if date_str:
+            year, month = date_str[:4], date_str[5:7]
+            nav = (f'<div class="site-nav"><a href="../index.html">トップ</a>'
+                   f'<a href="../{year}/index.html">{year}年</a>'
+                   f'<a href="../{year}/{month}/index.html">{int(month)}月</a></div>')
+        else:
+            nav = (f'<div class="site-nav"><a href="../index.html">トップ</a>'
+                   f'<a href="../{SITE_UNDATED_DIR}/index.html">日付なし</a></div>')
+        tag_links = "".join(f'<a href="../tags/{site_slug(tag)}.html">#{html.escape(tag)}</a>'
+                            for tag in data.get("tags", []))
+        if tag_links:
+            nav += f'<div class="diary-tags">{tag_links}</div>'
+        page_html = build_export_html(html.escape(title), format_jp_date(date_str), nav + content, SITE_EXPORT_STYLE)
+    else:
+        depth = page_path.count('/')
+        prefix = "../" * depth
+        nav = f'<div class="site-nav"><a href="{prefix}index.html">トップ</a><a href="{prefix}tags/index.html">タグ一覧</a></div>'
+        page_html = build_export_html(html.escape(job["title"]), job["subtitle"],
+                                      nav + _site_list_html(job["rows"]), SITE_EXPORT_STYLE)
+
+    output_path = os.path.join(output_dir, *page_path.split('/'))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(page_html)
+    return page_path, images
+
+
+def export_static_site(diary_folder, output_dir, progress_callback=None, max_workers=None):
+    """
+    すべての日記を静的なHTMLサイトとして書き出す
+
+    出力先のマニフェストに各ページの入力のハッシュ値を保存し、再エクスポート時には
+    入力が変わったページだけを描画し直す。日記ファイルの更新日時とサイズが
+    前回と同じ場合はファイルを読まずにマニフェストの情報を使う。
+
+    サイトの構成:
+        index.html                  年の一覧
+        <yyyy>/index.html           月の一覧
+        <yyyy>/<MM>/index.html      その月の日記の一覧
+        undated/index.html          日付のない日記の一覧（ある場合のみ）
+        entries/<キー>.html         各日記のページ
+        tags/index.html             タグの一覧
+        tags/<タグ>.html            タグが付いた日記の一覧
+        images/<ファイル名>         参照されている画像
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        output_dir (str): 出力先フォルダ
+        progress_callback (callable, optional): progress_callback(描画済みページ数, 描画するページ数) の形で呼ばれる
+        max_workers (int, optional): 描画に使うプロセス数
+
+    Returns:
+        dict: 描画したページ数 ("rendered")、変更がなかったページ数 ("unchanged")、削除したページ数 ("removed")
+    """
+    import hashlib
+    import shutil
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, SITE_MANIFEST_NAME)
+    old_manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                old_manifest = json.load(f)
+        except (OSError, ValueError):
+            old_manifest = {}
+    if old_manifest.get("version") != SITE_TEMPLATE_VERSION:
+        old_manifest = {}
+    old_entries = old_manifest.get("entries", {})
+    old_pages = old_manifest.get("pages", {})
+
+    # 日記の情報を集める（変更のないファイルは読まない）
+    entries = {}
+    for file_name in os.listdir(diary_folder):
+        if not is_entry_file(file_name):
+            continue
+        file_key = file_name[:-5]
+        file_path = os.path.join(diary_folder, file_name)
+        try:
+            stat = os.stat(file_path)
+            previous = old_entries.get(file_key)
+            if previous and previous["mtime_ns"] == stat.st_mtime_ns and previous["size"] == stat.st_size:
+                entries[file_key] = previous
+                continue
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            data = json.loads(raw.decode('utf-8'))
+        except (OSError, ValueError) as e:
+            print(f"ファイル読み込みエラー: {file_name} - {str(e)}")
+            continue
+        entry = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": hashlib.sha256(raw).hexdigest(),
+            "title": data.get("title", "無題") or "無題",
+            "date": _site_entry_date(file_key, data),
+            "tags": data.get("tags", []),
+            "images": []
+        }
+        if previous and previous["hash"] == entry["hash"]:
+            # 更新日時だけが変わった場合は前回の画像情報を引き継ぐ
+            entry["images"] = previous.get("images", [])
+        entries[file_key] = entry
+
+    # 描画するページを決める
+    pages = {}
+    jobs = []
+
+    def add_page(page_path, page_hash, job):
+        pages[page_path] = page_hash
+        output_path = os.path.join(output_dir, *page_path.split('/'))
+        if old_pages.get(page_path) == page_hash and os.path.exists(output_path):
+            return
+        job.update({"page": page_path, "output_dir": output_dir})
+        jobs.append(job)
+
+    for file_key, entry in entries.items():
+        add_page(f"entries/{file_key}.html", _site_page_hash("entry", entry["hash"]), {
+            "kind": "entry",
+            "source": os.path.join(diary_folder, f"{file_key}.json"),
+            "diary_folder": diary_folder,
+            "date": entry["date"]
+        })
+
+    def add_list_page(page_path, title, subtitle, rows):
+        add_page(page_path, _site_page_hash("list", title, subtitle, rows), {
+            "kind": "list", "title": title, "subtitle": subtitle, "rows": rows
+        })
+
+    # 年・月ごとの一覧（日付のない日記は別の一覧にまとめる）
+    by_month = {}
+    undated = []
+    for file_key, entry in entries.items():
+        if entry["date"]:
+            by_month.setdefault(entry["date"][:7], []).append((entry["date"], entry["title"], file_key))
+        else:
+            undated.append((entry["title"], file_key))
+    by_year = {}
+    for month_str, month_entries in by_month.items():
+        by_year.setdefault(month_str[:4], []).append((month_str, len(month_entries)))
+
+    top_rows = [(f"{year}/index.html", f"{year}年 ({sum(count for _, count in months)}件)")
+                for year, months in sorted(by_year.items(), reverse=True)]
+    if undated:
+        top_rows.append((f"{SITE_UNDATED_DIR}/index.html", f"日付なし ({len(undated)}件)"))
+        add_list_page(f"{SITE_UNDATED_DIR}/index.html", "日付のない日記", f"{len(undated)}件",
+                      [(f"../entries/{file_key}.html", title) for title, file_key in sorted(undated)])
+    add_list_page("index.html", "日記", f"{len(entries)}件", top_rows)
+    for year, months in by_year.items():
+        add_list_page(f"{year}/index.html", f"{year}年の日記", f"{year}年",
+                      [(f"{month_str[5:7]}/index.html", f"{int(month_str[5:7])}月 ({count}件)")
+                       for month_str, count in sorted(months, reverse=True)])
+    for month_str, month_entries in by_month.items():
+        add_list_page(f"{month_str[:4]}/{month_str[5:7]}/index.html",
+                      f"{month_str[:4]}年{int(month_str[5:7])}月の日記", month_str,
+                      [(f"../../entries/{file_key}.html", _site_entry_label(date_str, title))
+                       for date_str, title, file_key in sorted(month_entries, reverse=True)])
+
+    # タグごとの一覧
+    by_tag = {}
+    for file_key, entry in entries.items():
+        for tag in entry["tags"]:
+            by_tag.setdefault(tag, []).append((entry["date"], entry["title"], file_key))
+    add_list_page("tags/index.html", "タグ一覧", f"{len(by_tag)}個",
+                  [(f"{site_slug(tag)}.html", f"#{tag} ({len(tag_entries)}件)")
+                   for tag, tag_entries in sorted(by_tag.items())])
+    for tag, tag_entries in by_tag.items():
+        add_list_page(f"tags/{site_slug(tag)}.html", f"#{tag}", f"{len(tag_entries)}件",
+                      [(f"../entries/{file_key}.html", _site_entry_label(date_str, title))
+                       for date_str, title, file_key in sorted(tag_entries, reverse=True)])
+
+    # ページを描画する（件数が少ない場合はプロセスを起動しない）
+    total = len(jobs)
+    if total:
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        if total < 32 or max_workers <= 1:
+            results = map(_render_site_page, jobs)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            results = executor.map(_render_site_page, jobs, chunksize=max(1, min(64, total // (max_workers * 4))))
+        try:
+            for done, (page_path, images) in enumerate(results, 1):
+                if page_path.startswith("entries/"):
+                    entry = entries[page_path[len("entries/"):-len(".html")]]
+                    entry["images"] = images
+                    # 画像をコピーする（更新されていないものはコピーしない）
+                    for image_name, abs_path in images:
+                        dest_path = os.path.join(output_dir, "images", image_name)
+                        source_stat = os.stat(abs_path)
+                        if os.path.exists(dest_path):
+                            dest_stat = os.stat(dest_path)
+                            if dest_stat.st_size == source_stat.st_size and dest_stat.st_mtime >= source_stat.st_mtime:
+                                continue
+                        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                        shutil.copy2(abs_path, dest_path)
+                if progress_callback:
+                    progress_callback(done, total)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    # 不要になったページと画像を削除する
+    removed = 0
+    for page_path in old_pages:
+        if page_path not in pages:
+            try:
+                os.remove(os.path.join(output_dir, *page_path.split('/')))
+                removed += 1
+            except OSError:
+                pass
+    used_images = {image_name for entry in entries.values() for image_name, _ in entry["images"]}
+    for old_entry in old_entries.values():
+        for image_name, _ in old_entry.get("images", []):
+            if image_name not in used_images:
+                try:
+                    os.remove(os.path.join(output_dir, "images", image_name))
+                except OSError:
+                    pass
+
+    # マニフェストを保存する
+    manifest = {"version": SITE_TEMPLATE_VERSION, "entries": entries, "pages": pages}
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+    return {"rendered": total, "unchanged": len(pages) - total, "removed": removed}
+
+
+def iter_jsonl_records(diary_folder, date_from=None, date_to=None, tag=None, favorites=None):
+    """
+    日記を1件ずつJSON Lines用のレコードとして返すジェネレーター
+    日付順に1ファイルずつ読み込むため、日記の数に関係なくメモリ使用量は一定
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+        date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+        tag (str, optional): このタグが付いた日記のみを返す
+        favorites (iterable, optional): お気に入りのファイルキー
+
+    Yields:
+        dict: id, date, title, content, plain_content, mood, tags, last_modified, favorite, checksum
+    """
+    favorites = set(favorites or [])
+    for file_name in sorted(os.listdir(diary_folder)):
+        if not is_entry_file(file_name):
+            continue
+        file_key = file_name[:-5]
+        date_str = entry_date_str(file_key)
+        if date_from and date_str < date_from:
+            continue
+        if date_to and date_str > date_to:
+            continue
+
+        try:
+            with open(os.path.join(diary_folder, file_name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ファイル読み込みエラー: {file_name} - {str(e)}")
+            continue
+
+        tags = data.get("tags", [])
+        if tag and tag not in tags:
+            continue
+
+        record = {
+            "id": file_key,
+            "date": data.get("date", date_str),
+            "title": data.get("title", ""),
+            "content": data.get("content", ""),
+            "plain_content": html_to_plain_text(data.get("content", "")),
+            "mood": data.get("mood", ""),
+            "tags": tags,
+            "last_modified": data.get("last_modified", ""),
+            "favorite": file_key in favorites
+        }
+        record["checksum"] = entry_checksum(record)
+        yield record
+
+
+def export_jsonl(diary_folder, output, date_from=None, date_to=None, tag=None, favorites=None):
+    """
+    日記をJSON Lines形式（1行に1件）で書き出す
+
+    Args:
+        output (str or file): 出力先のパス、または書き込み可能なテキストファイル
+        その他の引数は iter_jsonl_records と同じ
+
+    Returns:
+        int: 書き出した件数
+    """
+    if isinstance(output, str):
+        with open(output, 'w', encoding='utf-8', newline='\n') as f:
+            return export_jsonl(diary_folder, f, date_from, date_to, tag, favorites)
+
+    count = 0
+    for record in iter_jsonl_records(diary_folder, date_from, date_to, tag, favorites):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def import_jsonl(store, input_path):
+    """
+    JSON Lines形式の日記を1行ずつ読み込んで日記フォルダに保存する
+    既存の日記とチェックサムが同じレコードは書き込まずにスキップする
+    書き込みは DiaryStore.write_imported_entries で行い、IDが同じ既存の日記は上書きする
+
+    Args:
+        store (DiaryStore): 書き込む日記フォルダ（メタデータにタグとお気に入りを追加する。保存は呼び出し側で行う）
+        input_path (str): 読み込むファイルのパス
+
+    Returns:
+        dict: 保存した件数 ("imported")、変更がなくスキップした件数 ("skipped")、エラー件数 ("errors")
+    """
+    result = {"imported": 0, "skipped": 0, "errors": 0}
+    metadata = store.metadata
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                date_str = record["date"]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"JSONLの読み込みエラー: {line_number}行目 - {str(e)}")
+                result["errors"] += 1
+                continue
+            # 日付はファイル名の一部になるため、yyyy-MM-dd 以外は受け付けない
+            if not isinstance(date_str, str) or not is_valid_date(date_str):
+                print(f"JSONLの日付が正しくありません: {line_number}行目 - {date_str!r}")
+                result["errors"] += 1
+                continue
+            if (not isinstance(record.get("title", ""), str) or not isinstance(record.get("content", ""), str) or
+                    not isinstance(record.get("tags", []), list)):
+                print(f"JSONLのタイトル・本文・タグが正しくありません: {line_number}行目")
+                result["errors"] += 1
+                continue
+
+            # チェックサムは書き出したときのレコードのまま確かめ、タイトルの補完はその後で行う
+            record_checksum = entry_checksum(record)
+            if record.get("checksum") and record["checksum"] != record_checksum:
+                print(f"JSONLのチェックサム不一致: {line_number}行目")
+                result["errors"] += 1
+                continue
+
+            title = record.get("title", "") or "無題"
+            data = {
+                "title": title,
+                "content": record.get("content", ""),
+                "mood": record.get("mood", "普通"),
+                "tags": record.get("tags", []),
+                "date": date_str,
+                "last_modified": record.get("last_modified") or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            checksum = entry_checksum(data)
+
+            # IDがファイル名として安全な場合はそのまま使う
+            file_key = record.get("id")
+            if (not isinstance(file_key, str) or not file_key or file_key != os.path.basename(file_key) or
+                    not file_key.startswith(date_str)):
+                file_key = new_file_key(store.diary_folder, date_str, title)
+                overwrite = False
+            else:
+                existing = store.read_entry(file_key)
+                if existing is not None and entry_checksum(existing) in (record_checksum, checksum):
+                    result["skipped"] += 1
+                    continue
+                overwrite = True
+
+            file_key = store.write_imported_entries([(file_key, data, overwrite)])[0]
+            result["imported"] += 1
+
+            for tag in data["tags"]:
+                if tag not in metadata["tags"]:
+                    metadata["tags"].append(tag)
+            if record.get("favorite") and file_key not in metadata["favorites"]:
+                metadata["favorites"].append(file_key)
+    return result
+
+
+# 一括インポートで読み込むファイルの拡張子
+BULK_IMPORT_EXTENSIONS = ('.json', '.jsonl', '.html', '.htm', '.txt', '.zip')
+
+# 一括インポートでまとめて書き込む件数
+BULK_IMPORT_BATCH_SIZE = 500
+
+# 一括インポートのワーカーごとに開いたZIPファイル
+_import_zip_cache = {}
+
+
+def _parse_jp_date(text):
+    """
+    「yyyy年MM月dd日」または「yyyy-MM-dd」を含む文字列から yyyy-MM-dd を取り出す
+    """
+    match = re.search(r'(\d{4})年(\d{1,2})月(\d{1,2})日', text) or re.search(r'(\d{4})-(\d{2})-(\d{2})', text)
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _plain_text_to_html(text):
+    """
+    プレーンテキストを段落ごとの簡単なHTMLに変換する
+    """
+    import html
+
+    return "".join(f"<p>{html.escape(line)}</p>" for line in text.split("\n"))
+
+
+def _parse_import_text(name, text, fallback_date, first_line=1):
+    """
+    インポートするファイルの内容を日記データのリストに変換する
+    JSON Lines の行や JSON の配列の要素は1件ずつ読み込み、読み込めないものだけをエラーにする
+
+    Args:
+        name (str): ファイル名（拡張子で形式を判断する）
+        text (str): ファイルの内容
+        fallback_date (str): 日付が見つからない場合に使う日付（yyyy-MM-dd）
+        first_line (int): text の最初の行の行番号（JSONLの一部を読み込む場合）
+
+    Returns:
+        tuple: (日記データ（dict）のリスト, 読み込めなかった行・要素のエラーメッセージのリスト)
+    """
+    lower_name = name.lower()
+    base_name = os.path.basename(name)
+    file_date = _parse_jp_date(base_name) or fallback_date
+
+    def normalize(data, default_date):
+        if not isinstance(data, dict):
+            raise ValueError("日記のデータ（JSONのオブジェクト）ではありません")
+        # 項目の型は import_jsonl と同じく確かめ、正しくない日記は読み込まない
+        for field in ("title", "content", "mood", "last_modified"):
+            if field in data and not isinstance(data[field], str):
+                raise ValueError(f"{field} が文字列ではありません")
+        if "tags" in data and not isinstance(data["tags"], list):
+            raise ValueError("tags がリストではありません")
+        # 日付はファイル名の一部になるため、正しくない値は使わない
+        date_str = data.get("date")
+        return {
+            "id": data.get("id"),
+            "title": data.get("title") or "無題",
+            "content": data.get("content", ""),
+            "mood": data.get("mood") or "普通",
+            "tags": [tag for tag in data.get("tags", []) if isinstance(tag, str) and tag.strip()],
+            "date": date_str if isinstance(date_str, str) and is_valid_date(date_str) else default_date,
+            "last_modified": data.get("last_modified", ""),
+            "favorite": bool(data.get("favorite", False))
+        }
+
+    if lower_name.endswith('.jsonl'):
+        entries = []
+        errors = []
+        # export_jsonl は U+2028 などをエスケープせずに書くため、splitlines() ではなく改行だけで分ける
+        for line_number, line in enumerate(text.split("\n"), first_line):
+            if not line.strip():
+                continue
+            try:
+                entries.append(normalize(json.loads(line), file_date))
+            except (ValueError, TypeError, AttributeError) as e:
+                errors.append(f"{line_number}行目 - {str(e)}")
+        return entries, errors
+
+    if lower_name.endswith('.json'):
+        data = json.loads(text)
+        if isinstance(data, list):
+            entries = []
+            errors = []
+            for index, item in enumerate(data, 1):
+                try:
+                    entries.append(normalize(item, file_date))
+                except (ValueError, TypeError, AttributeError) as e:
+                    errors.append(f"{index}件目 - {str(e)}")
+            return entries, errors
+        if "id" not in data and base_name.endswith('.json'):
+            data["id"] = base_name[:-5]
+        return [normalize(data, file_date)], []
+
+    if lower_name.endswith(('.html', '.htm')):
+        title_match = (re.search(r'<h1 class="diary-title">(.*?)</h1>', text, re.S) or
+                       re.search(r'<title>(.*?)</title>', text, re.S))
+        date_match = re.search(r'<div class="diary-date">(.*?)</div>', text, re.S)
+        content = text
+        content_start = text.find('<div class="diary-content">')
+        if content_start >= 0:
+            # エクスポートしたHTMLの場合は本文部分だけを取り出す
+            content_end = text.rfind('</div>', content_start, text.rfind('</body>'))
+            if content_end > content_start:
+                content = text[content_start + len('<div class="diary-content">'):content_end]
+        return [normalize({
+            "title": title_match.group(1).strip() if title_match else os.path.splitext(base_name)[0],
+            "content": content,
+            "date": (date_match and _parse_jp_date(date_match.group(1))) or file_date
+        }, file_date)], []
+
+    # テキストファイル（テキストエクスポートの見出し行があれば読み取る）
+    header = {}
+    body = text
+    lines = text.split("\n")
+    if lines and lines[0].startswith("日付:"):
+        keys = {"日付": "date", "タイトル": "title", "気分": "mood", "タグ": "tags"}
+        index = 0
+        while index < len(lines) and lines[index].strip():
+            key, _, value = lines[index].partition(":")
+            if key in keys:
+                header[keys[key]] = value.strip()
+            index += 1
+        body = "\n".join(lines[index + 1:])
+    return [normalize({
+        "title": header.get("title") or os.path.splitext(base_name)[0],
+        "content": _plain_text_to_html(body),
+        "mood": header.get("mood", "普通"),
+        "tags": [tag.strip() for tag in header.get("tags", "").split(",")],
+        "date": _parse_jp_date(header.get("date", "")) or file_date
+    }, file_date)], []
+
+
+def _parse_import_source(source):
+    """
+    一括インポートの1ファイル分を読み込んで解析する（プロセスプールで実行）
+
+    Args:
+        source (tuple): (種類, パス, ZIP内の名前) 種類は "file"・"zip"・"lines"。
+            "lines" の場合、3番目は (最初の行の行番号, JSONLの行のまとまり)
+
+    Returns:
+        tuple: (source, 日記データのリスト, エラーメッセージのリスト)
+    """
+    import zipfile
+
+    kind, path, member = source
+    first_line = 1
+    try:
+        if kind == "file":
+            with open(path, 'r', encoding='utf-8-sig') as f:
+                text = f.read()
+            name = path
+            fallback_date = datetime.date.fromtimestamp(os.path.getmtime(path)).isoformat()
+        elif kind == "zip":
+            zipf = _import_zip_cache.get(path)
+            if zipf is None:
+                zipf = _import_zip_cache[path] = zipfile.ZipFile(path)
+            info = zipf.getinfo(member)
+            text = zipf.read(info).decode('utf-8-sig')
+            name = member
+            fallback_date = datetime.date(*info.date_time[:3]).isoformat()
+        else:
+            # JSONLの一部（最初の行の行番号と、行のまとまり）
+            first_line, text = member
+            name = path
+            fallback_date = datetime.date.today().isoformat()
+        entries, errors = _parse_import_text(name, text, fallback_date, first_line)
+        return source, entries, errors
+    except Exception as e:
+        return source, [], [str(e)]
+
+
+def _hash_entry_file(file_path):
+    """
+    既存の日記ファイルのチェックサムを計算する（プロセスプールで実行）
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return entry_checksum(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def _list_import_sources(paths):
+    """
+    一括インポートの対象を (種類, パス, ZIP内の名前) のリストにする
+    フォルダは再帰的に探し、ZIPは中のファイルを1つずつ対象にする
+    """
+    import zipfile
+
+    sources = []
+
+    def add_file(file_path):
+        lower_path = file_path.lower()
+        if os.path.basename(lower_path) == METADATA_FILE_NAME or not lower_path.endswith(BULK_IMPORT_EXTENSIONS):
+            return
+        if lower_path.endswith('.zip'):
+            with zipfile.ZipFile(file_path) as zipf:
+                members = [name for name in zipf.namelist()
+                           if name.lower().endswith(BULK_IMPORT_EXTENSIONS[:-1]) and not name.endswith('/')]
+            if any(name.startswith("entries/") and name.endswith(".json") for name in members):
+                # 一括エクスポートのZIPは元データ（entries/*.json）だけを読み込む
+                members = [name for name in members if name.startswith("entries/") and name.endswith(".json")]
+            for name in sorted(members):
+                sources.append(("zip", file_path, name))
+        elif lower_path.endswith('.jsonl'):
+            # JSONLは行のまとまりごとに、最初の行の行番号を付けてワーカーへ渡す
+            with open(file_path, 'r', encoding='utf-8-sig') as f:
+                chunk = []
+                first_line = 1
+                for line_number, line in enumerate(f, 1):
+                    chunk.append(line)
+                    if len(chunk) >= 1000:
+                        sources.append(("lines", file_path, (first_line, "".join(chunk))))
+                        chunk = []
+                        first_line = line_number + 1
+                if chunk:
+                    sources.append(("lines", file_path, (first_line, "".join(chunk))))
+        else:
+            sources.append(("file", file_path, None))
+
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for file_name in sorted(files):
+                    add_file(os.path.join(root, file_name))
+        else:
+            add_file(path)
+    return sources
+
+
+class _ImportImageCopier:
+    """
+    一括インポートした日記が参照している画像を日記の画像フォルダへコピーする
+    同じ画像は1回だけコピーし、同名で内容が異なる場合は名前を変える
+    """
+    def __init__(self, images_folder):
+        import zipfile
+
+        self.images_folder = images_folder
+        self.copied = {}  # 画像の取得元 -> 画像フォルダ内のファイル名
+        self.zip_files = {}
+        self.count = 0
+        self._zipfile = zipfile
+
+    def close(self):
+        for zipf in self.zip_files.values():
+            zipf.close()
+
+    def _file_digest(self, file_obj):
+        import hashlib
+
+        digest = hashlib.sha256()
+        for block in iter(lambda: file_obj.read(1024 * 1024), b""):
+            digest.update(block)
+        return digest.hexdigest()
+
+    def _store(self, open_source):
+        """
+        画像を保存し、画像フォルダ内のファイル名を返す
+        open_source は (ファイル名, バイナリで開く関数) を返す
+        """
+        import shutil
+
+        name, opener = open_source
+        stem, ext = os.path.splitext(name)
+        candidate = name
+        counter = 1
+        while True:
+            dest_path = os.path.join(self.images_folder, candidate)
+            if not os.path.exists(dest_path):
+                break
+            # 同名のファイルがある場合は内容が同じか確認する
+            with opener() as source, open(dest_path, 'rb') as existing:
+                if self._file_digest(source) == self._file_digest(existing):
+                    return candidate
+            candidate = f"{stem}-{counter}{ext}"
+            counter += 1
+
+        os.makedirs(self.images_folder, exist_ok=True)
+        with opener() as source, open(dest_path, 'wb') as dest:
+            shutil.copyfileobj(source, dest, 1024 * 1024)
+        self.count += 1
+        return candidate
+
+    def rewrite(self, content, source):
+        """
+        日記本文の画像を取り込み、src属性を画像フォルダからの相対パスに置き換える
+        """
+        import posixpath
+        import urllib.parse
+
+        kind, path, member = source
+
+        def replace_path(match):
+            src = match.group(1)
+            if src.startswith(("http:", "https:", "data:")):
+                return match.group(0)
+            unquoted = urllib.parse.unquote(src[len("file://"):] if src.startswith("file://") else src)
+
+            if kind == "zip" and not os.path.isabs(unquoted):
+                member_name = posixpath.normpath(posixpath.join(posixpath.dirname(member), unquoted))
+                zipf = self.zip_files.get(path)
+                if zipf is None:
+                    zipf = self.zip_files[path] = self._zipfile.ZipFile(path)
+                if member_name.startswith("entries/") and "images/" + posixpath.basename(member_name) in zipf.NameToInfo:
+                    # 一括エクスポートの元データは日記フォルダ基準のパスを持っている
+                    member_name = "images/" + posixpath.basename(member_name)
+                if member_name not in zipf.NameToInfo:
+                    return match.group(0)
+                key = (path, member_name)
+                opener = (posixpath.basename(member_name), lambda: zipf.open(member_name))
+            else:
+                base_dir = os.path.dirname(path) if kind == "file" else ""
+                file_path = unquoted if os.path.isabs(unquoted) else os.path.join(base_dir, unquoted)
+                if not os.path.isfile(file_path):
+                    return match.group(0)
+                key = os.path.realpath(file_path)
+                opener = (os.path.basename(file_path), lambda: open(file_path, 'rb'))
+
+            if key not in self.copied:
+                self.copied[key] = self._store(opener)
+            return f'src="images/{self.copied[key]}"'
+
+        return re.sub(r'src="([^"]+)"', replace_path, content)
+
+
+def bulk_import(store, paths, progress_callback=None, max_workers=None):
+    """
+    フォルダ・ZIP・JSONLなどから日記をまとめてインポートする
+
+    ファイルの解析はプロセスプールで並列に行い、内容のチェックサムで既存の日記や
+    インポート中の重複を除く。書き込みは BULK_IMPORT_BATCH_SIZE 件ずつまとめて
+    DiaryStore.write_imported_entries で行い、まとまりごとにメタデータを1回だけ保存する。
+
+    Args:
+        store (DiaryStore): 書き込む日記フォルダ（メタデータにタグとお気に入りを追加する）
+        paths (list): インポートするファイルまたはフォルダのパス
+        progress_callback (callable, optional): progress_callback(処理済み数, 総数) の形で呼ばれる。
+            Falseを返すと処理を中断する
+        max_workers (int, optional): 解析に使うプロセス数
+
+    Returns:
+        dict: 保存した件数 ("imported")、重複でスキップした件数 ("duplicates")、
+              エラー件数 ("errors")、コピーした画像数 ("images")、中断されたかどうか ("cancelled")
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    sources = _list_import_sources(paths)
+    result = {"imported": 0, "duplicates": 0, "errors": 0, "images": 0, "cancelled": False}
+    if not sources:
+        return result
+
+    diary_folder = store.diary_folder
+    metadata = store.metadata
+    existing_files = [os.path.join(diary_folder, file_name) for file_name in os.listdir(diary_folder)
+                      if is_entry_file(file_name)]
+    images = _ImportImageCopier(os.path.join(diary_folder, "images"))
+    pending = []
+    reserved = set()
+
+    def flush():
+        # まとめて書き込み、最後にメタデータを1回だけ保存する
+        file_keys = store.write_imported_entries([(file_key, data, False) for file_key, data, favorite in pending])
+        for file_key, (_, data, favorite) in zip(file_keys, pending):
+            for tag in data["tags"]:
+                if tag not in metadata["tags"]:
+                    metadata["tags"].append(tag)
+            if favorite and file_key not in metadata["favorites"]:
+                metadata["favorites"].append(file_key)
+        result["imported"] += len(pending)
+        pending.clear()
+        reserved.clear()
+        store.save_metadata()
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        chunksize = max(1, min(256, len(existing_files) // (max_workers * 4)))
+        known_hashes = set(executor.map(_hash_entry_file, existing_files, chunksize=chunksize))
+        known_hashes.discard(None)
+
+        total = len(sources)
+        chunksize = max(1, min(64, total // (max_workers * 4)))
+        for done, (source, entries, errors) in enumerate(executor.map(_parse_import_source, sources, chunksize=chunksize), 1):
+            for error in errors:
+                print(f"インポートエラー: {source[1]} {source[2] if source[0] == 'zip' else ''} - {error}")
+            result["errors"] += len(errors)
+
+            for entry in entries:
+                try:
+                    entry["content"] = images.rewrite(entry["content"], source)
+                except (OSError, ValueError) as e:
+                    print(f"画像のインポートエラー: {source[1]} - {str(e)}")
+                data = {
+                    "title": entry["title"],
+                    "content": entry["content"],
+                    "mood": entry["mood"],
+                    "tags": entry["tags"],
+                    "date": entry["date"],
+                    "last_modified": entry["last_modified"] or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                }
+                checksum = entry_checksum(data)
+                if checksum in known_hashes:
+                    result["duplicates"] += 1
+                    continue
+                known_hashes.add(checksum)
+
+                # 元のIDがファイル名として使え、まだ存在しない場合はそのまま使う
+                file_key = entry["id"] if isinstance(entry["id"], str) else ""
+                if (not file_key or file_key != os.path.basename(file_key) or not file_key.startswith(data["date"]) or
+                        file_key in reserved or os.path.exists(os.path.join(diary_folder, f"{file_key}.json"))):
+                    file_key = new_file_key(diary_folder, data["date"], data["title"], reserved)
+                reserved.add(file_key)
+                pending.append((file_key, data, entry["favorite"]))
+                if len(pending) >= BULK_IMPORT_BATCH_SIZE:
+                    flush()
+
+            if progress_callback and progress_callback(done, total) is False:
+                result["cancelled"] = True
+                break
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if pending:
+            flush()
+        images.close()
+
+    result["images"] = images.count
+    return result
@@ -0,0 +1,229 @@
+"""
+日記へ移動するためのあいまい検索（「日記へ移動」のパレット）
+
+日記ごとに「日付 タイトル #タグ」の文字列（ラベル）を作り、正規化したラベル（diary_search.fold_text）の索引を持つ。
+    単語 -> その単語を含む日記の番号の配列（ラベルを空白・#・- などで区切ったもの）
+    文字 -> その文字を含む日記の番号の配列（多くの日記に含まれる文字はビットマップも持つ）
+    3文字の組 -> その組を含む日記の番号の配列
+入力と一致する単語を持つ日記は単語の索引で、入力をそのまま含む日記は3文字の組の索引で、入力の文字が順に現れる日記（部分列）は文字の索引で
+候補を絞り込み、候補だけを確かめる。日記の番号は日付の順に振るため、候補は新しい日記から確かめ、
+表示する件数が集まったところで打ち切る。入力の文字がどれも多くの日記に含まれる場合は候補が
+絞り込めないため、1回の入力で確かめる候補は新しい日記から FUZZY_SCAN_LIMIT 件までにする。
+"""
+import re
+from array import array
+from itertools import islice
+
+from diary_search import fold_text
+
+# 表示する候補の数
+FUZZY_RESULT_LIMIT = 50
+
+# 1回の入力で、一致の種類ごとに確かめる候補の数の上限
+FUZZY_SCAN_LIMIT = 5000
+
+# ビットマップも持つ文字（日記の 1/FUZZY_BITMAP_DIVISOR 以上に含まれる文字）
+FUZZY_BITMAP_DIVISOR = 32
+
+# ラベルの中で単語の区切りとみなす文字（この直後から一致する候補を上に表示する）
+WORD_SEPARATORS = " #-/_"
+WORD_SEPARATOR_PATTERN = re.compile("[" + re.escape(WORD_SEPARATORS) + "]+")
+
+
+def entry_label(record):
+    """
+    日記のラベル（「日付 タイトル #タグ」）を返す
+    """
+    tags = " ".join(f"#{tag}" for tag in record["tags"])
+    return f"{record['date']} {record['title']} {tags}".rstrip()
+
+
+def _trigrams(text):
+    return {text[position:position + 3] for position in range(len(text) - 2)}
+
+
+def _bitmap_ordinals(bitmap):
+    """
+    ビットマップに含まれる番号を大きい順（日付の新しい順）に返すジェネレータ
+    """
+    bits = bin(bitmap)
+    top = len(bits) - 1
+    position = bits.find("1", 2)
+    while position >= 0:
+        yield top - position
+        position = bits.find("1", position + 1)
+
+
+class FuzzyIndex:
+    """
+    ラベルの文字と3文字の組の索引
+
+    日記には日付の順に番号を振る（作った後に追加した日記は末尾に追加する）。日記の更新は古い番号を
+    無効にして新しい番号で追加し、無効な番号が増えたら作り直す（update() がFalseを返す）。
+    """
+
+    def __init__(self, records=()):
+        """
+        Args:
+            records (iterable): 索引レコード
+        """
+        # 番号 -> ファイルキー・正規化したラベル（無効な番号はNone）と、ファイルキー -> 番号
+        self.keys = []
+        self.labels = []
+        self.ids = {}
+        # 単語・文字・3文字の組 -> それを含む日記の番号（昇順）
+        self.word_postings = {}
+        self.char_postings = {}
+        self.trigram_postings = {}
+        # 文字 -> それを含む日記の番号のビットを立てた整数（多くの日記に含まれる文字だけ）
+        self.char_bitmaps = {}
+        # 無効になった番号の数
+        self.stale = 0
+
+        for record in sorted(records, key=lambda record: (record["date"], record["file_key"])):
+            self.add(record)
+        for char, posting in self.char_postings.items():
+            if len(posting) * FUZZY_BITMAP_DIVISOR >= len(self.keys):
+                bits = bytearray(len(self.keys) // 8 + 1)
+                for ordinal in posting:
+                    bits[ordinal >> 3] |= 1 << (ordinal & 7)
+                self.char_bitmaps[char] = int.from_bytes(bits, "little")
+
+    def add(self, record):
+        """
+        日記を索引に追加する（読み込みエラーの日記は追加しない）
+        """
+        if record["error"]:
+            return
+        label = fold_text(entry_label(record))
+        ordinal = len(self.keys)
+        self.keys.append(record["file_key"])
+        self.labels.append(label)
+        self.ids[record["file_key"]] = ordinal
+
+        for word in set(WORD_SEPARATOR_PATTERN.split(label)):
+            posting = self.word_postings.get(word)
+            if posting is None:
+                posting = self.word_postings[word] = array("I")
+            posting.append(ordinal)
+        for char in set(label):
+            posting = self.char_postings.get(char)
+            if posting is None:
+                posting = self.char_postings[char] = array("I")
+            posting.append(ordinal)
+            if char in self.char_bitmaps:
+                self.char_bitmaps[char] |= 1 << ordinal
+        for trigram in _trigrams(label):
+            posting = self.trigram_postings.get(trigram)
+            if posting is None:
+                posting = self.trigram_postings[trigram] = array("I")
+            posting.append(ordinal)
+
+    def remove(self, file_key):
+        """
+        日記を索引から外す（番号を無効にするだけで、索引の配列からは消さない）
+        """
+        ordinal = self.ids.pop(file_key, None)
+        if ordinal is not None:
+            self.keys[ordinal] = None
+            self.labels[ordinal] = None
+            self.stale += 1
+
+    def update(self, old_record, new_record):
+        """
+        日記の追加・更新・削除を索引に反映する
+
+        Returns:
+            bool: 無効な番号が増えすぎて作り直したほうがよい場合はFalse
+        """
+        if old_record is not None:
+            self.remove(old_record["file_key"])
+        if new_record is not None:
+            self.add(new_record)
+        return self.stale <= max(len(self.ids), 1000)
+
+    def _candidates(self, chars):
+        """
+        すべての文字を含む日記の番号の候補を新しい順に返す（実際に含むかどうかは呼び出し側で確かめる）
+        """
+        postings = [self.char_postings.get(char) for char in chars]
+        if not all(postings):
+            return iter(())
+        rarest = min(postings, key=len)
+        # どの文字も多くの日記に含まれる場合は、ビットマップの & ですべての文字を含む日記に絞る
+        if len(rarest) * FUZZY_BITMAP_DIVISOR >= len(self.keys) and all(char in self.char_bitmaps for char in chars):
+            bitmap = -1
+            for char in chars:
+                bitmap &= self.char_bitmaps[char]
+            return _bitmap_ordinals(bitmap)
+        return reversed(rarest)
+
+    def search(self, text, limit=FUZZY_RESULT_LIMIT):
+        """
+        入力に一致する日記を探す
+
+        入力と一致する単語を持つ日記、入力をそのまま含む日記（単語の先頭から一致するものを先に）、
+        入力の文字が順に現れる日記（一致した範囲が短いものを先に）の順に、それぞれの中では
+        日付の新しい順に並べる。
+        入力はラベルと同じように正規化し、空白は部分列の一致では無視する。入力が空の場合は新しい日記を返す。
+
+        Args:
+            text (str): 入力
+            limit (int): 返す件数の上限
+
+        Returns:
+            list: ファイルキーのリスト
+        """
+        text = fold_text(text).strip()
+        labels = self.labels
+        if not text:
+            newest = []
+            for ordinal in range(len(labels) - 1, -1, -1):
+                if len(newest) >= limit:
+                    break
+                if labels[ordinal] is not None:
+                    newest.append(self.keys[ordinal])
+            return newest
+        found = {}
+
+        # 1. 入力と一致する単語を持つ日記
+        for ordinal in islice(reversed(self.word_postings.get(text, ())), limit):
+            if labels[ordinal] is not None:
+                found[ordinal] = (3, 0, 0)
+
+        # 2. 入力をそのまま含む日記（最も少ない日記に含まれる3文字の組、または文字の日記から探す）
+        grams = _trigrams(text)
+        if grams:
+            postings = [self.trigram_postings.get(gram, ()) for gram in grams]
+            candidates = reversed(min(postings, key=len))
+        else:
+            candidates = self._candidates(set(text))
+        for ordinal in islice(candidates, FUZZY_SCAN_LIMIT):
+            if len(found) >= limit:
+                break
+            label = labels[ordinal]
+            if label is None or ordinal in found:
+                continue
+            position = label.find(text)
+            if position >= 0:
+                # 単語の先頭から一致するものを上にする
+                found[ordinal] = (2, int(position == 0 or label[position - 1] in WORD_SEPARATORS), 0)
+
+        # 3. 入力の文字が順に現れる日記
+        chars = text.replace(" ", "")
+        if len(found) < limit and len(chars) > 1:
+            # 「次の文字以外の並び + 次の文字」をつなぐ（.*? と違い、一致しない場合に何度も戻って試さない）
+            pattern = re.compile(re.escape(chars[0]) +
+                                 "".join(f"[^{re.escape(char)}]*{re.escape(char)}" for char in chars[1:]))
+            for ordinal in islice(self._candidates(set(chars)), FUZZY_SCAN_LIMIT):
+                label = labels[ordinal]
+                if label is None or ordinal in found:
+                    continue
+                match = pattern.search(label)
+                if match:
+                    found[ordinal] = (1, 0, match.start() - match.end())
+                    if len(found) >= limit:
+                        break
+
+        ranked = sorted(found, key=lambda ordinal: (found[ordinal], ordinal), reverse=True)
+        return [self.keys[ordinal] for ordinal in ranked]
@@ -0,0 +1,257 @@
+"""
+日記ごとの過去の版
+
+日記を上書き・削除する前の版を、内部フォルダの history/<ファイルキー>.json に保存する。
+容量を抑えるため、最も新しい版だけを全文で持ち、それより古い版は1つ新しい版との
+差分（逆方向の差分）で持つ。差分をたどる回数が増えすぎないように、KEYFRAME_INTERVAL 版ごとに
+全文（キーフレーム）を置く。
+
+自動保存で版が増え続けないように、保存のたびに次の規則で古い版を間引く:
+    1時間以内の版はすべて残す
+    1日以内の版は1時間ごとに最新の1つ
+    30日以内の版は1日ごとに最新の1つ
+    それより古い版は1か月ごとに最新の1つ
+    （全体で HISTORY_MAX_VERSIONS 版まで）
+"""
+import os
+import json
+import datetime
+
+from diary_core import write_json_atomic
+
+# 履歴ファイルの形式のバージョン
+HISTORY_VERSION = 1
+
+# 全文で持つ版の間隔（差分をたどる回数の上限）
+KEYFRAME_INTERVAL = 20
+
+# 残す版の数の上限
+HISTORY_MAX_VERSIONS = 200
+
+# 版を間引く規則: (この秒数より新しい版に適用, 残す単位（Noneの場合はすべて残す）)
+RETENTION_RULES = (
+    (60 * 60, None),
+    (24 * 60 * 60, "%Y-%m-%d %H"),
+    (30 * 24 * 60 * 60, "%Y-%m-%d"),
+    (None, "%Y-%m")
+)
+
+# 全文・差分と一緒に保存する日記の項目
+VERSION_FIELDS = ("date", "title", "mood", "tags", "last_modified", "revision")
+
+
+def make_delta(new_text, old_text):
+    """
+    新しい本文から古い本文を作るための行単位の差分を作る
+
+    Returns:
+        list: 操作のリスト（正の整数: 新しい本文からその行数をコピー、負の整数: その行数を飛ばす、
+              文字列のリスト: その行を挿入）
+    """
+    import difflib
+
+    new_lines = new_text.splitlines(keepends=True)
+    old_lines = old_text.splitlines(keepends=True)
+    delta = []
+
+    def push(op):
+        # 同じ種類の操作が続く場合は1つにまとめる
+        if delta and isinstance(op, list) and isinstance(delta[-1], list):
+            delta[-1].extend(op)
+        elif delta and isinstance(op, int) and isinstance(delta[-1], int) and (op > 0) == (delta[-1] > 0):
+            delta[-1] += op
+        else:
+            delta.append(op)
+
+    matcher = difflib.SequenceMatcher(None, new_lines, old_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            push(i2 - i1)
+            continue
+        if i2 > i1:
+            push(-(i2 - i1))
+        if j2 > j1:
+            push(list(old_lines[j1:j2]))
+    return delta
+
+
+def apply_delta(new_text, delta):
+    """
+    新しい本文に差分を当てて、古い本文を作る
+    """
+    lines = new_text.splitlines(keepends=True)
+    position = 0
+    result = []
+    for op in delta:
+        if isinstance(op, list):
+            result.extend(op)
+        elif op > 0:
+            result.extend(lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(result)
+
+
+def _version_time(version, fallback):
+    """
+    版が保存された日時を返す（last_modified を読めない場合は fallback）
+    """
+    try:
+        return datetime.datetime.strptime(str(version.get("last_modified", ""))[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return fallback
+
+
+def select_versions(versions, now=None):
+    """
+    間引きの規則に従って残す版を選ぶ
+
+    Args:
+        versions (list): 版のリスト（新しい順。各要素は last_modified を持つ）
+        now (datetime, optional): 基準にする現在の日時
+
+    Returns:
+        list: 残す版の位置（versions の中のインデックス、新しい順）
+    """
+    now = now or datetime.datetime.now()
+    kept = []
+    seen_buckets = set()
+    for index, version in enumerate(versions):
+        saved = _version_time(version, now)
+        age = (now - saved).total_seconds()
+        for limit, bucket_format in RETENTION_RULES:
+            if limit is None or age < limit:
+                break
+        if bucket_format is None:
+            kept.append(index)
+            continue
+        bucket = (bucket_format, saved.strftime(bucket_format))
+        if bucket not in seen_buckets:
+            # 新しい順に見ているため、各区間で最初に見つかった版がその区間の最新の版
+            seen_buckets.add(bucket)
+            kept.append(index)
+    return kept[:HISTORY_MAX_VERSIONS]
+
+
+class EntryHistory:
+    """
+    日記ごとの過去の版を保存・復元するクラス
+
+    履歴ファイルの "versions" は新しい順の版のリストで、各版は VERSION_FIELDS の項目と、
+    本文の全文 ("content") または1つ新しい版からの差分 ("delta") を持つ。
+    """
+
+    def __init__(self, history_folder):
+        self.history_folder = history_folder
+
+    def _path(self, file_key):
+        return os.path.join(self.history_folder, f"{file_key}.json")
+
+    def _load(self, file_key):
+        """
+        履歴ファイルの版のリストを読み込む（ない場合は空のリスト）
+        """
+        try:
+            with open(self._path(file_key), 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return []
+        if history.get("version") != HISTORY_VERSION:
+            return []
+        return history.get("versions", [])
+
+    def _save(self, file_key, versions):
+        if not os.path.exists(self.history_folder):
+            os.makedirs(self.history_folder)
+        write_json_atomic(self._path(file_key), {"version": HISTORY_VERSION, "versions": versions}, indent=None)
+
+    def add(self, file_key, data, now=None):
+        """
+        日記の版を履歴に追加する（上書き・削除する前の内容を渡す）
+
+        Args:
+            file_key (str): 日記のファイルキー
+            data (dict): 日記のデータ
+            now (datetime, optional): 間引きの基準にする現在の日時
+        """
+        versions = self._load(file_key)
+        new_version = {field: data.get(field) for field in VERSION_FIELDS}
+        new_version["content"] = data.get("content", "")
+
+        if versions:
+            # それまで全文で持っていた最新の版を、新しい版からの差分にする
+            # （その後ろに続く差分がすでに KEYFRAME_INTERVAL - 1 個ある場合は全文のまま残す）
+            run = 0
+            for version in versions[1:]:
+                if "content" in version:
+                    break
+                run += 1
+            previous = versions[0]
+            if run + 1 < KEYFRAME_INTERVAL:
+                previous["delta"] = make_delta(new_version["content"], previous.pop("content"))
+        versions.insert(0, new_version)
+
+        kept = select_versions(versions, now)
+        if len(kept) < len(versions):
+            versions = self._reencode([self._materialize(versions)[index] for index in kept])
+        self._save(file_key, versions)
+
+    def _materialize(self, versions):
+        """
+        すべての版の本文を全文にしたリストを返す
+        """
+        full_versions = []
+        content = ""
+        for version in versions:
+            content = version["content"] if "content" in version else apply_delta(content, version["delta"])
+            full_version = {field: version.get(field) for field in VERSION_FIELDS}
+            full_version["content"] = content
+            full_versions.append(full_version)
+        return full_versions
+
+    def _reencode(self, full_versions):
+        """
+        全文の版のリストを、キーフレームと差分の形式に戻す
+        """
+        versions = []
+        for index, full_version in enumerate(full_versions):
+            version = {field: full_version.get(field) for field in VERSION_FIELDS}
+            if index % KEYFRAME_INTERVAL == 0:
+                version["content"] = full_version["content"]
+            else:
+                version["delta"] = make_delta(full_versions[index - 1]["content"], full_version["content"])
+            versions.append(version)
+        return versions
+
+    def versions(self, file_key):
+        """
+        日記の過去の版の一覧を返す（新しい順、本文は含まない）
+
+        Returns:
+            list: VERSION_FIELDS の項目を持つ辞書のリスト
+        """
+        return [{field: version.get(field) for field in VERSION_FIELDS} for version in self._load(file_key)]
+
+    def version(self, file_key, index):
+        """
+        過去の版を本文を含めて返す
+
+        Args:
+            file_key (str): 日記のファイルキー
+            index (int): versions() の中の位置
+
+        Returns:
+            dict: 日記のデータ
+
+        Raises:
+            IndexError: その版がない場合
+        """
+        versions = self._load(file_key)
+        if not 0 <= index < len(versions):
+            raise IndexError(f"指定した版がありません: {file_key} ({index})")
+        # 指定した版より新しい最も近いキーフレームから差分を当てる
+        start = index
+        while "content" not in versions[start]:
+            start -= 1
+        return self._materialize(versions[start:index + 1])[-1]
@@ -0,0 +1,474 @@
+"""
+詳細検索の検索式と実行計画
+
+検索式の書き方（空白で区切った条件をすべて満たす日記を探す）:
+    旅行                 タイトル・本文・タグに「旅行」を含む
+    "海 の 家"           空白を含めてそのまま含む
+    title:旅行           タイトルに含む
+    tag:旅行             タグ「旅行」が付いている
+    mood:楽しい          気分が「楽しい」
+    after:2024-01        2024年1月以降（yyyy、yyyy-MM、yyyy-MM-dd で指定）
+    before:2024-03       2024年3月より前
+    date:2024-05         2024年5月（その年・月・日）
+    days:90              今日までの90日間（今日を含む）
+    is:favorite          お気に入り
+    -雨  -tag:仕事       先頭に - を付けると、その条件を満たさない
+    海 OR 山             どちらかを満たす（OR は大文字）
+
+検索式は条件のリストに変換し、実行計画を立ててから実行する。実行計画では、
+ビットマップ索引（タグ・気分・お気に入り）と日付の索引で絞り込める条件を先に求め、
+全文索引はそれまでの候補より少なく絞り込めると見積もられる場合だけ使う。
+最後に、残った候補だけを本文などの文字列で確かめる。
+
+入力しながらのキーワード検索（クイック検索）は IncrementalSearch で、少しずつ進めて途中で打ち切れるようにする。
+"""
+import re
+import time
+import datetime
+
+from diary_core import is_valid_date
+from diary_search import fold_text, search_text
+
+# 検索式の1つの条件（- の有無、フィールド名、"..." で囲んだ値、囲んでいない値）
+QUERY_TOKEN_PATTERN = re.compile(r'(-?)(?:([A-Za-z]+):)?(?:"([^"]*)"?|(\S+))')
+
+# 日付の条件に指定できる形式（年、年月、年月日）
+QUERY_DATE_PATTERN = re.compile(r"^\d{4}(-\d{2}(-\d{2})?)?$")
+
+# お気に入りを表す is: の値
+FAVORITE_VALUES = ("favorite", "fav", "お気に入り")
+
+# 条件の種類と、それを絞り込む索引
+KEYWORD = "keyword"
+TITLE = "title"
+TAG = "tag"
+MOOD = "mood"
+DATE = "date"
+FAVORITE = "favorite"
+BITMAP_KINDS = (TAG, MOOD, DATE, FAVORITE)
+
+
+class QueryError(ValueError):
+    """
+    検索式が正しくない場合に送出する例外
+    """
+
+
+class Predicate:
+    """
+    検索式の1つの条件
+
+    kind が KEYWORD・TITLE の場合の value はキーワード、DATE の場合は (開始, 終了) の組
+    （開始はこの文字列以上、終了はこの文字列未満の日付。Noneの場合は制限しない）
+    """
+
+    def __init__(self, kind, value, negated=False, case_sensitive=False, exact=False, source=None, fold=True):
+        self.kind = kind
+        self.value = value
+        self.negated = negated
+        # キーワードの大文字/小文字を区別するか、空白で区切った単語として完全に一致させるか
+        self.case_sensitive = case_sensitive
+        self.exact = exact
+        # 大文字/小文字を区別しない場合に、正規化した文字列（diary_search.fold_text）で比べるか
+        # （キーワードはここで一度だけ正規化し、日記は索引レコードの正規化済みの文字列を使う）
+        self.fold = fold and not case_sensitive and kind in (KEYWORD, TITLE)
+        self.folded_value = fold_text(value) if self.fold else None
+        # 検索式での書き方（実行計画の表示に使う）
+        self.source = source or self._describe()
+
+    def _describe(self):
+        if self.kind == DATE:
+            start, end = self.value
+            parts = [f"{start}以降"] if start else []
+            if end:
+                parts.append(f"{end[:-1]}まで" if end.endswith("\uffff") else f"{end}より前")
+            text = "日付 " + " ".join(parts)
+        elif self.kind == FAVORITE:
+            text = "is:favorite"
+        elif self.kind == KEYWORD:
+            text = f'"{self.value}"' if " " in self.value else self.value
+        else:
+            text = f"{self.kind}:{self.value}"
+        return f"-{text}" if self.negated else text
+
+    def matches(self, record, favorites):
+        """
+        索引レコードがこの条件を満たすかどうかを返す
+
+        Args:
+            record (dict): 索引レコード
+            favorites (set): お気に入りのファイルキー
+        """
+        kind = self.kind
+        if kind == TAG:
+            result = self.value in record["tags"]
+        elif kind == MOOD:
+            result = record["mood"] == self.value
+        elif kind == FAVORITE:
+            result = record["file_key"] in favorites
+        elif kind == DATE:
+            start, end = self.value
+            date_str = record["date"]
+            result = bool(date_str) and (not start or date_str >= start) and (not end or date_str < end)
+        else:
+            if self.fold:
+                # タイトルは索引レコードに正規化したものがないが、短いためその都度正規化する
+                text = fold_text(record["title"]) if kind == TITLE else record["folded"]
+                keyword = self.folded_value
+            else:
+                text = record["title"] if kind == TITLE else search_text(record)
+                keyword = self.value
+                if not self.case_sensitive:
+                    text = text.lower()
+                    keyword = keyword.lower()
+            result = keyword in text.split() if self.exact else keyword in text
+        return result != self.negated
+
+
+class Query:
+    """
+    検索式を変換した条件のリスト
+
+    clauses の各要素は、どれか1つを満たせばよい条件（OR でつないだ条件）のリストで、
+    すべての要素を満たす日記が検索結果になる。
+    relative は今日から数えた日付の条件（days:）を含むかどうか（含む場合、日付の範囲は解析した日のもの）。
+    """
+
+    def __init__(self, clauses, text="", relative=False):
+        self.clauses = clauses
+        self.text = text
+        self.relative = relative
+
+    def matches(self, record, favorites):
+        """
+        索引レコードがすべての条件を満たすかどうかを返す（日付のない日記は execute_query と同じく含めない）
+
+        Args:
+            record (dict): 索引レコード
+            favorites (set): お気に入りのファイルキー
+        """
+        return bool(record["date"]) and all(any(predicate.matches(record, favorites) for predicate in clause)
+                                            for clause in self.clauses)
+
+
+def _date_bounds(field, value):
+    """
+    日付の条件の値を (開始, 終了) の組にする
+    """
+    if not QUERY_DATE_PATTERN.match(value) or not is_valid_date((value + "-01-01")[:10]):
+        raise QueryError(f"{field}: の日付は yyyy、yyyy-MM、yyyy-MM-dd のいずれかの形式で指定してください: {value}")
+    if field == "after":
+        return value, None
+    if field == "before":
+        return None, value
+    # date: はその年・月・日に含まれる日付（終了は value で始まるどの日付よりも大きい文字列）
+    return value, value + "\uffff"
+
+
+def _recent_bounds(value):
+    """
+    days: の値（日数）を、今日までのその日数の (開始, 終了) の組にする
+    """
+    if not value.isdigit() or int(value) < 1:
+        raise QueryError(f"days: には1以上の日数を指定してください: {value}")
+    start = datetime.date.today() - datetime.timedelta(days=int(value) - 1)
+    return start.strftime("%Y-%m-%d"), None
+
+
+def parse_query(text, case_sensitive=False, fold=True):
+    """
+    検索式を解析する
+
+    Args:
+        text (str): 検索式
+        case_sensitive (bool): キーワードの大文字/小文字を区別する
+        fold (bool): キーワードの全角/半角・ひらがな/カタカナの違いを区別しない
+
+    Returns:
+        Query: 条件のリスト
+
+    Raises:
+        QueryError: 日付の形式が正しくない場合など
+    """
+    clauses = []
+    join_next = False
+    relative = False
+    for match in QUERY_TOKEN_PATTERN.finditer(text):
+        minus, field, quoted, bare = match.groups()
+        value = quoted if quoted is not None else bare
+        if field is None and quoted is None and bare == "OR" and not minus:
+            # 直前の条件と OR でつなぐ（先頭の OR は無視する）
+            join_next = bool(clauses)
+            continue
+
+        negated = bool(minus)
+        field = field.lower() if field else None
+        if field in ("tag", "mood") and value:
+            predicate = Predicate(TAG if field == "tag" else MOOD, value, negated)
+        elif field == "title" and value:
+            predicate = Predicate(TITLE, value, negated, case_sensitive, fold=fold)
+        elif field in ("after", "before", "date"):
+            predicate = Predicate(DATE, _date_bounds(field, value), negated, source=match.group(0))
+        elif field == "days":
+            predicate = Predicate(DATE, _recent_bounds(value), negated, source=match.group(0))
+            relative = True
+        elif field == "is" and value.lower() in FAVORITE_VALUES:
+            predicate = Predicate(FAVORITE, True, negated)
+        else:
+            # 知らないフィールド名（「メモ:」など）は、そのままキーワードとして扱う
+            keyword = match.group(0)[len(minus):]
+            if quoted is not None and field is None:
+                keyword = quoted
+            if not keyword:
+                continue
+            predicate = Predicate(KEYWORD, keyword, negated, case_sensitive, fold=fold)
+
+        if join_next:
+            clauses[-1].append(predicate)
+        else:
+            clauses.append([predicate])
+        join_next = False
+    return Query(clauses, text, relative)
+
+
+def build_query(keyword="", date_from=None, date_to=None, tags=(), mood=None,
+                title_only=False, case_sensitive=False, exact_match=False, fold=True):
+    """
+    詳細検索の入力欄の条件を Query にする（DiaryStore.advanced_search の引数と同じ意味）
+    """
+    clauses = []
+    if date_from or date_to:
+        clauses.append([Predicate(DATE, (date_from, date_to + "\uffff" if date_to else None))])
+    clauses.extend([Predicate(TAG, tag)] for tag in tags)
+    if mood:
+        clauses.append([Predicate(MOOD, mood)])
+    if keyword:
+        clauses.append([Predicate(TITLE if title_only else KEYWORD, keyword, False, case_sensitive, exact_match,
+                                  fold=fold)])
+    return Query(clauses)
+
+
+def query_keywords(query):
+    """
+    検索式の中の、除外ではないキーワードを返す（関連度の計算と抜粋の強調に使う）
+    """
+    return [predicate.value for clause in query.clauses for predicate in clause
+            if predicate.kind in (KEYWORD, TITLE) and not predicate.negated]
+
+
+def _clause_text(clause):
+    return " OR ".join(predicate.source for predicate in clause)
+
+
+def _predicate_bitmap(index, predicate, favorites):
+    """
+    ビットマップ索引・日付の索引で求められる条件のビットマップを返す
+    """
+    if predicate.kind == DATE:
+        start, end = predicate.value
+        bitmap = index.range_bitmap(start, end)
+    elif predicate.kind == FAVORITE:
+        bitmap = index.keys_bitmap(favorites)
+    else:
+        bitmap = index.select(tags=[predicate.value]) if predicate.kind == TAG else index.select(mood=predicate.value)
+    if predicate.negated:
+        bitmap = index.range_bitmap() & ~bitmap
+    return bitmap
+
+
+def execute_query(store, query):
+    """
+    検索式の実行計画を立てて実行する
+
+    Args:
+        store (DiaryStore): 日記フォルダ
+        query (Query): 条件のリスト
+
+    Returns:
+        tuple: (一致した日記の索引レコードのリスト（日付の新しい順）,
+                実行した手順のリスト（format_steps で表にできる）)
+    """
+    started = time.perf_counter()
+    index = store.bitmap_index()
+    favorites = set(store.metadata["favorites"])
+    steps = []
+    # 索引を作ったり読み直したりした時間は、検索そのものとは分けて表示する
+    if time.perf_counter() - started > 0.001:
+        steps.append({"kind": "prepare", "detail": "ビットマップ索引・日付の索引", "estimate": None,
+                      "rows": index.count(index.live), "time": time.perf_counter() - started})
+
+    def add_step(kind, detail, estimate, bitmap, step_started):
+        steps.append({"kind": kind, "detail": detail, "estimate": estimate, "rows": index.count(bitmap),
+                      "time": time.perf_counter() - step_started})
+
+    # 1. タグ・気分・お気に入り・日付の条件はビットマップで求め、件数の少ないものから & でつなぐ
+    step_started = time.perf_counter()
+    bitmap = index.range_bitmap()
+    add_step("scan", "日付のあるすべての日記", None, bitmap, step_started)
+    bitmap_clauses = []
+    residual = []
+    for clause in query.clauses:
+        if all(predicate.kind in BITMAP_KINDS for predicate in clause):
+            clause_bitmap = 0
+            for predicate in clause:
+                clause_bitmap |= _predicate_bitmap(index, predicate, favorites)
+            bitmap_clauses.append((index.count(clause_bitmap), clause, clause_bitmap))
+        else:
+            residual.append(clause)
+    for count, clause, clause_bitmap in sorted(bitmap_clauses, key=lambda item: item[0]):
+        step_started = time.perf_counter()
+        if bitmap:
+            bitmap &= clause_bitmap
+        add_step("date" if clause[0].kind == DATE and len(clause) == 1 else "bitmap",
+                 _clause_text(clause), count, bitmap, step_started)
+
+    # 2. キーワードの条件（OR でつないだものを含む）は、全文索引の見積もりがそれまでの候補より
+    #    少ない場合だけ全文索引で絞り込む（候補の日記は文字の組をすべて含むだけなので、
+    #    条件は残りの条件として確かめる）
+    full_text = None
+    keyword_clauses = []
+    for clause in residual:
+        if not all(predicate.kind in (KEYWORD, TITLE) and not predicate.negated for predicate in clause):
+            continue
+        if full_text is None:
+            step_started = time.perf_counter()
+            full_text = store.full_text_index()
+            if time.perf_counter() - step_started > 0.001:
+                steps.append({"kind": "prepare", "detail": "全文索引", "estimate": None,
+                              "rows": len(full_text.doc_ids), "time": time.perf_counter() - step_started})
+        estimates = [full_text.estimate(predicate.value) for predicate in clause]
+        if None not in estimates:
+            keyword_clauses.append((sum(estimates), clause))
+    for estimate, clause in sorted(keyword_clauses, key=lambda item: item[0]):
+        current = index.count(bitmap)
+        if not current or estimate >= current:
+            steps.append({"kind": "skip", "detail": f"全文索引 {_clause_text(clause)}（候補 {current}件より多い）",
+                          "estimate": estimate, "rows": current, "time": 0.0})
+            continue
+        step_started = time.perf_counter()
+        clause_bitmap = 0
+        for predicate in clause:
+            clause_bitmap |= index.keys_bitmap(full_text.candidates(predicate.value))
+        bitmap &= clause_bitmap
+        add_step("fulltext", _clause_text(clause), estimate, bitmap, step_started)
+
+    # 3. 残りの条件を、候補の日記だけで確かめる
+    step_started = time.perf_counter()
+    matching_entries = store.get_entries(index.file_keys(bitmap))
+    checked = len(matching_entries)
+    if residual:
+        matching_entries = [record for record in matching_entries
+                            if all(any(predicate.matches(record, favorites) for predicate in clause)
+                                   for clause in residual)]
+        steps.append({"kind": "filter", "detail": " ".join(_clause_text(clause) for clause in residual),
+                      "estimate": checked, "rows": len(matching_entries),
+                      "time": time.perf_counter() - step_started})
+
+    matching_entries.sort(key=lambda record: record["date"], reverse=True)
+    steps.append({"kind": "total", "detail": query.text, "estimate": None, "rows": len(matching_entries),
+                  "time": time.perf_counter() - started})
+    return matching_entries, steps
+
+
+# 入力しながらの検索で、一度に確かめる候補の数と、一度に返す結果の数
+SEARCH_CHUNK_SIZE = 2000
+SEARCH_BATCH_SIZE = 50
+
+
+class IncrementalSearch:
+    """
+    入力しながらの検索（クイック検索）
+
+    run() はキーワード検索を少しずつ進めるジェネレータで、候補を SEARCH_CHUNK_SIZE 件確かめるごとに
+    空のリストを、検索が終わると関連度の高い順の結果を SEARCH_BATCH_SIZE 件ずつ返す。
+    呼び出し側は新しいキーワードが入力されたら close() で前の検索を打ち切る。
+    新しいキーワードが前回最後まで終わった検索のキーワードを含む場合（入力を続けて絞り込んだ場合）は、
+    前回の結果の中だけを確かめる。
+    """
+
+    def __init__(self, store):
+        """
+        Args:
+            store (DiaryStore): 日記フォルダ
+        """
+        self.store = store
+        # 前回最後まで終わった検索のキーワード（正規化したもの）と結果のファイルキー、そのときの索引の世代
+        self.keyword = None
+        self.file_keys = None
+        self.generation = None
+
+    def is_refinement(self, keyword):
+        """
+        前回の結果の中だけを確かめればよいキーワードかどうかを返す
+        （前回のキーワードを含む文字列は、前回の結果の日記にしか含まれない）
+        """
+        return (self.keyword is not None and self.generation == self.store.generation and
+                self.keyword in fold_text(keyword))
+
+    def run(self, keyword, batch_size=SEARCH_BATCH_SIZE, chunk_size=SEARCH_CHUNK_SIZE):
+        """
+        キーワード検索を少しずつ進める（DiaryStore.search と同じ条件で、結果は関連度の高い順）
+
+        Args:
+            keyword (str): キーワード
+            batch_size (int): 一度に返す結果の数
+            chunk_size (int): 一度に確かめる候補の数
+
+        Yields:
+            list: 検索の途中は空のリスト、終わった後は結果の索引レコードを batch_size 件ずつ
+        """
+        keyword = keyword.strip()
+        if not keyword:
+            return
+        store = self.store
+        full_text = store.full_text_index()
+        # 絞り込みの場合も、全文索引の候補のほうが少なければそちらを使う（1文字目から入力した場合など）
+        estimate = full_text.estimate(keyword)
+        if self.is_refinement(keyword) and (estimate is None or len(self.file_keys) <= estimate):
+            file_keys = self.file_keys
+        else:
+            file_keys = full_text.candidates(keyword)
+            if file_keys is None:
+                file_keys = [record["file_key"] for record in store.entries()]
+        generation = store.generation
+        predicate = Predicate(KEYWORD, keyword)
+
+        matching_entries = []
+        for start in range(0, len(file_keys), chunk_size):
+            if start:
+                yield []
+            matching_entries.extend(record for record in store.get_entries(file_keys[start:start + chunk_size])
+                                    if record["date"] and predicate.matches(record, ()))
+        matching_entries.sort(key=lambda record: record["date"], reverse=True)
+        self.keyword = fold_text(keyword)
+        self.file_keys = [record["file_key"] for record in matching_entries]
+        self.generation = generation
+
+        matching_entries = store.rank_entries(matching_entries, [keyword])
+        for start in range(0, len(matching_entries), batch_size):
+            yield matching_entries[start:start + batch_size]
+
+
+# 実行計画の手順の名前
+STEP_NAMES = {
+    "prepare": "索引の準備",
+    "scan": "対象",
+    "date": "日付の索引",
+    "bitmap": "ビットマップ",
+    "fulltext": "全文索引",
+    "skip": "使わない索引",
+    "filter": "残りの条件",
+    "total": "結果"
+}
+
+
+def format_steps(steps):
+    """
+    実行した手順を、見積もり・実際の件数・時間の表にする
+    """
+    lines = []
+    for number, step in enumerate(steps, 1):
+        estimate = "" if step["estimate"] is None else f"見積もり {step['estimate']}件 → "
+        lines.append(f"{number:2d}. {STEP_NAMES[step['kind']]}: {step['detail']}  "
+                     f"({estimate}{step['rows']}件, {step['time'] * 1000:.2f}ms)")
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+"""
+正規表現による検索
+
+索引に保存したプレーンテキスト（diary_search.search_text() の文字列）を正規表現で調べる。
+正規表現の検索は索引で絞り込めないため、日記を REGEX_CHUNK_SIZE 件ずつのまとまりに分けて
+ワーカープロセスに分散する。各ワーカーは初期化のときに正規表現を一度だけコンパイルし、
+対象の索引レコードも初期化のときに受け取る（fork で起動する環境ではコピーされない）ため、
+まとまりごとに送るのは番号の範囲だけで済む。
+
+結果はまとまりの順（日付の新しい順）に受け取り、件数が上限に達したら残りを打ち切る。
+破滅的なバックトラックを起こす正規表現はワーカーの中で止められないため、制限時間を過ぎたら
+ワーカープロセスごと終了させる（それまでに見つかった結果は返す）。
+"""
+import os
+import re
+import time
+
+# 1つのまとまりで調べる日記の数
+REGEX_CHUNK_SIZE = 500
+
+# 検索結果の件数の上限
+REGEX_RESULT_LIMIT = 1000
+
+# 検索の制限時間（秒）
+REGEX_TIMEOUT = 10.0
+
+# 1件の日記について返す一致した範囲の数の上限（強調表示に使う）
+REGEX_MAX_SPANS = 20
+
+# ワーカープロセスごとの正規表現と対象の索引レコード
+_worker_state = {}
+
+
+def compile_pattern(pattern, case_sensitive=False):
+    """
+    正規表現をコンパイルする
+
+    Raises:
+        diary_query.QueryError: 正規表現が正しくない場合
+    """
+    from diary_query import QueryError
+
+    try:
+        return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        raise QueryError(f"正規表現が正しくありません: {e}")
+
+
+def find_spans(regex, text, max_spans=REGEX_MAX_SPANS):
+    """
+    文字列の中で正規表現に一致する範囲を返す
+
+    Returns:
+        list or None: 一致した範囲 (開始, 終了) のリスト（長さ0の一致は含まない）。一致しない場合はNone
+    """
+    spans = None
+    for match in regex.finditer(text):
+        if spans is None:
+            spans = []
+        if match.end() > match.start():
+            spans.append(match.span())
+            if len(spans) >= max_spans:
+                break
+    return spans
+
+
+def _init_regex_worker(pattern, flags, records, title_only):
+    _worker_state["regex"] = re.compile(pattern, flags)
+    _worker_state["records"] = records
+    _worker_state["title_only"] = title_only
+
+
+def _search_chunk(task):
+    """
+    ワーカープロセスで1つのまとまりを調べる
+
+    Args:
+        task (tuple): (開始番号, 終了番号, 返す件数の上限)
+
+    Returns:
+        list: 一致した日記の (番号, 一致した範囲のリスト) のリスト
+    """
+    from diary_search import search_text
+
+    start, stop, limit = task
+    regex = _worker_state["regex"]
+    records = _worker_state["records"]
+    title_only = _worker_state["title_only"]
+    found = []
+    for index in range(start, stop):
+        # タイトルはどちらの文字列でも先頭にあるため、タイトルのみの場合も範囲の位置は同じ
+        record = records[index]
+        spans = find_spans(regex, record["title"] if title_only else search_text(record))
+        if spans is not None:
+            found.append((index, spans))
+            if len(found) >= limit:
+                break
+    return found
+
+
+def regex_search(records, regex, title_only=False, limit=REGEX_RESULT_LIMIT, timeout=REGEX_TIMEOUT,
+                 max_workers=None):
+    """
+    索引レコードのタイトル・本文・タグ（diary_search.search_text() の文字列）を正規表現で調べる
+
+    Args:
+        records (list): 調べる日記の索引レコード（この順に結果を返す）
+        regex (re.Pattern): compile_pattern() でコンパイルした正規表現
+        title_only (bool): タイトルだけを調べる
+        limit (int): 結果の件数の上限
+        timeout (float): 制限時間（秒）
+        max_workers (int, optional): 使うプロセス数
+
+    Returns:
+        dict: 一致した日記の (索引レコード, 一致した範囲のリスト) のリスト ("matches"、範囲は
+              search_text() の文字列での位置)、
+              件数が上限に達して打ち切ったかどうか ("limited")、制限時間を過ぎたかどうか ("timed_out")
+    """
+    import multiprocessing
+
+    result = {"matches": [], "limited": False, "timed_out": False}
+    if not records or limit <= 0:
+        return result
+
+    tasks = [(start, min(start + REGEX_CHUNK_SIZE, len(records)), limit)
+             for start in range(0, len(records), REGEX_CHUNK_SIZE)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    deadline = time.monotonic() + timeout
+    # 制限時間を過ぎたときに実行中のワーカーを終了させられるように、
+    # concurrent.futures ではなく terminate() を持つ multiprocessing.Pool を使う
+    pool = multiprocessing.Pool(min(max_workers, len(tasks)), _init_regex_worker,
+                                (regex.pattern, regex.flags, records, title_only))
+    try:
+        chunks = pool.imap(_search_chunk, tasks)
+        for _ in tasks:
+            try:
+                found = chunks.next(timeout=max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                result["timed_out"] = True
+                break
+            found = found[:limit - len(result["matches"])]
+            result["matches"].extend((records[index], spans) for index, spans in found)
+            if len(result["matches"]) >= limit:
+                result["limited"] = True
+                break
+    finally:
+        # 打ち切った場合や制限時間を過ぎた場合は、残りのまとまりを調べているワーカーも止める
+        pool.terminate()
+        pool.join()
+    return result
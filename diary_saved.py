@@ -0,0 +1,169 @@
+"""
+保存した検索
+
+よく使う検索式に名前を付けて内部フォルダに保存する（DiaryStore.save_state の SAVED_SEARCHES_STATE）。
+保存した検索ごとに一致する日記の集合（ファイルキー -> 日付）を持ち、最初に使うときに一度だけ
+execute_query で求めた後は、日記の追加・更新・削除のたびに変わった日記だけを各検索の条件で確かめて
+集合を更新する（update()）。そのため、保存した検索を開いたり件数を表示したりするときに、
+日記フォルダ全体を検索し直さない。
+
+次の場合は、集合を使う前に求め直す。
+    days: を含む検索で、日付が変わった（今日から数えた範囲がずれるため）
+    is:favorite を含む検索で、お気に入りが変わった（お気に入りの変更は日記の変更として届かないため）
+"""
+import datetime
+
+from diary_query import parse_query, execute_query, QueryError, FAVORITE
+
+# 保存した検索の一覧を保存する状態の名前（内部フォルダの saved_searches.json）
+SAVED_SEARCHES_STATE = "saved_searches"
+
+
+class SavedSearch:
+    """
+    名前を付けて保存した検索式と、それに一致する日記の集合
+    """
+
+    def __init__(self, name, text, case_sensitive=False, fold=True):
+        """
+        Args:
+            name (str): 名前
+            text (str): 検索式（書き方は diary_query を参照）
+            case_sensitive (bool): キーワードの大文字/小文字を区別する
+            fold (bool): キーワードの全角/半角・ひらがな/カタカナの違いを区別しない
+
+        Raises:
+            diary_query.QueryError: 検索式が正しくない場合
+        """
+        self.name = name
+        self.text = text
+        self.case_sensitive = case_sensitive
+        self.fold = fold
+        self.query = parse_query(text, case_sensitive, fold)
+        self.uses_favorites = any(predicate.kind == FAVORITE for clause in self.query.clauses for predicate in clause)
+        # 一致する日記（ファイルキー -> 日付。まだ求めていない場合はNone）と、求めたときの日付・お気に入り
+        self.matches = None
+        self.built_on = None
+        self.favorites = None
+
+    def to_dict(self):
+        """
+        保存する内容（状態のファイルに書く辞書）を返す
+        """
+        return {"name": self.name, "query": self.text, "case_sensitive": self.case_sensitive, "fold": self.fold}
+
+    def is_stale(self, favorites, today):
+        """
+        集合を求め直す必要があるかどうかを返す
+
+        Args:
+            favorites (list): 現在のお気に入りのファイルキー
+            today (str): 今日の日付（yyyy-MM-dd）
+        """
+        if self.matches is None:
+            return True
+        if self.query.relative and self.built_on != today:
+            return True
+        return self.uses_favorites and self.favorites != set(favorites)
+
+    def build(self, store):
+        """
+        一致する日記の集合を索引から求める（days: の範囲も今日から数え直す）
+        """
+        if self.query.relative:
+            self.query = parse_query(self.text, self.case_sensitive, self.fold)
+        self.favorites = set(store.metadata["favorites"])
+        self.built_on = datetime.date.today().strftime("%Y-%m-%d")
+        self.matches = {record["file_key"]: record["date"] for record in execute_query(store, self.query)[0]}
+
+    def update(self, old_record, new_record):
+        """
+        日記の追加・更新・削除を集合に反映する（まだ求めていない場合は何もしない）
+        """
+        if self.matches is None:
+            return
+        if old_record is not None:
+            self.matches.pop(old_record["file_key"], None)
+        if new_record is not None and self.query.matches(new_record, self.favorites):
+            self.matches[new_record["file_key"]] = new_record["date"]
+
+    def file_keys(self):
+        """
+        一致する日記のファイルキーを日付の新しい順に返す（日付が同じ場合はファイルキーの順）
+        """
+        return sorted(sorted(self.matches), key=self.matches.__getitem__, reverse=True)
+
+
+class SavedSearches:
+    """
+    保存した検索の一覧（DiaryStore が日記の変更を update() で伝える）
+    """
+
+    def __init__(self, definitions=()):
+        """
+        Args:
+            definitions (iterable): SavedSearch.to_dict() の辞書（正しくない検索式のものは読み飛ばす）
+        """
+        self.searches = []
+        for definition in definitions:
+            try:
+                self.searches.append(SavedSearch(definition["name"], definition["query"],
+                                                 definition.get("case_sensitive", False),
+                                                 definition.get("fold", True)))
+            except (KeyError, TypeError, QueryError) as e:
+                print(f"保存した検索を読み込めません: {definition} - {str(e)}")
+
+    def get(self, name):
+        """
+        名前で保存した検索を返す（ない場合はNone）
+        """
+        for search in self.searches:
+            if search.name == name:
+                return search
+        return None
+
+    def put(self, search):
+        """
+        保存した検索を追加する（同じ名前のものがあれば置き換える）
+        """
+        for i, existing in enumerate(self.searches):
+            if existing.name == search.name:
+                self.searches[i] = search
+                return
+        self.searches.append(search)
+
+    def remove(self, name):
+        """
+        保存した検索を削除する
+
+        Returns:
+            bool: 削除した場合はTrue
+        """
+        search = self.get(name)
+        if search is None:
+            return False
+        self.searches.remove(search)
+        return True
+
+    def to_list(self):
+        """
+        保存する内容（状態のファイルに書くリスト）を返す
+        """
+        return [search.to_dict() for search in self.searches]
+
+    def refresh(self, store):
+        """
+        求め直す必要がある検索の集合を求める
+        """
+        favorites = store.metadata["favorites"]
+        today = datetime.date.today().strftime("%Y-%m-%d")
+        for search in self.searches:
+            if search.is_stale(favorites, today):
+                search.build(store)
+
+    def update(self, old_record, new_record):
+        """
+        日記の追加・更新・削除をすべての検索の集合に反映する
+        """
+        for search in self.searches:
+            search.update(old_record, new_record)
@@ -0,0 +1,446 @@
+"""
+全文検索の索引
+
+日記のタイトル・本文・タグを正規化した文字列（fold_text）を、1文字と2文字の組（文字の n-gram）に分けて
+転置索引（文字の組 -> それを含む日記の番号のリスト）を作る。日本語は単語の区切りがないため、
+単語ではなく文字の組を単位にする。
+キーワードを含む日記は、キーワードの文字の組をすべて含む日記に必ず含まれるため、
+索引で候補を絞り込んだ後に、候補だけを実際の文字列で確かめる。
+
+転置索引には日記ごとに文字の組の出現回数と最初の出現位置も持ち、検索結果を BM25 で
+関連度の高い順に並べたり、キーワードの前後の抜粋を作ったりするのに使う。
+
+正規化は、全角と半角（ＡＢＣ と ABC、ｶﾀｶﾅ と カタカナ）、大文字と小文字、ひらがなとカタカナの
+違いをなくす。正規化した文字列は日記を読み込んだときに一度だけ作って索引レコード（"folded"）と
+索引キャッシュに保存し、検索のたびにはキーワードだけを正規化する。
+"""
+import re
+import bisect
+import html
+import math
+import operator
+import unicodedata
+from array import array
+from collections import Counter
+
+# BM25 のパラメータ（出現回数の飽和の度合いと、文書の長さによる補正の度合い）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 検索結果に表示する抜粋の文字数
+SNIPPET_LENGTH = 80
+
+# 出現回数として保存する最大値（出現位置と合わせて1つの整数に入れるため）
+MAX_GRAM_COUNT = 0xFFFF
+
+WHITESPACE_PATTERN = re.compile(r"\s")
+
+# カタカナ -> ひらがな（ァ〜ヶ と ヽヾ。ヷ〜ヺ などの対応するひらがながない文字はそのまま）
+KANA_FOLDING_TABLE = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+KANA_FOLDING_TABLE.update({0x30FD: 0x309D, 0x30FE: 0x309E})
+
+
+def search_text(record):
+    """
+    検索の対象にする文字列（タイトル・本文・タグを空白でつないだもの）を返す
+
+    Args:
+        record (dict): 索引レコード
+    """
+    return f"{record['title']} {record['text']} {' '.join(record['tags'])}"
+
+
+def fold_text(text):
+    """
+    検索で区別しない違いをなくした文字列を返す
+    NFKC で正規化し（全角の英数字・記号と半角のカタカナ、①などの互換文字）、小文字にして、
+    カタカナをひらがなにする
+
+    Args:
+        text (str): 文字列
+    """
+    return unicodedata.normalize("NFKC", text).lower().translate(KANA_FOLDING_TABLE)
+
+
+def _folded_offsets(text):
+    """
+    fold_text(text) の位置から text の位置への対応を返す（抜粋の強調に使う）
+
+    正規化で長さが変わる文字（半角の濁点や互換文字など）がある場合に使う。1文字ずつ（前の文字と
+    合わさる濁点などは前の文字とまとめて）正規化して長さを数える。
+
+    Returns:
+        list: 正規化した文字列の位置ごとの元の位置（末尾に len(text) を付ける）
+    """
+    offsets = []
+    start = 0
+    for position in range(1, len(text) + 1):
+        if position < len(text) and unicodedata.combining(unicodedata.normalize("NFKC", text[position])[0]):
+            continue
+        offsets.extend([start] * len(fold_text(text[start:position])))
+        start = position
+    offsets.append(len(text))
+    return offsets
+
+
+def _text_position(offsets, position):
+    """
+    正規化した文字列の位置を元の文字列の位置にする（offsets がNoneの場合は長さが同じ）
+    """
+    if offsets is None:
+        return position
+    return offsets[min(position, len(offsets) - 1)]
+
+
+def _is_indexed_gram(gram):
+    # 空白を含む組は索引に入れない
+    return not (gram[0].isspace() or gram[-1].isspace())
+
+
+def text_grams(text):
+    """
+    文字列に含まれる文字の組（1文字と、空白を含まない2文字）の集合を返す
+    """
+    grams = set(text)
+    grams.update(map(operator.add, text, text[1:]))
+    return {gram for gram in grams if _is_indexed_gram(gram)}
+
+
+def text_gram_occurrences(text):
+    """
+    文字列に含まれる文字の組ごとの出現回数と最初の出現位置を返す
+
+    Returns:
+        tuple: (文字の組 -> 出現回数, 文字の組 -> 最初の出現位置)
+    """
+    bigrams = list(map(operator.add, text, text[1:]))
+    counts = Counter(text)
+    counts.update(bigrams)
+    # 空白を含む組を除く（空白の位置から、その空白を含む組を求める）
+    for match in WHITESPACE_PATTERN.finditer(text):
+        position = match.start()
+        counts.pop(text[position], None)
+        counts.pop(text[position:position + 2], None)
+        if position:
+            counts.pop(text[position - 1:position + 1], None)
+    # 後ろから順に入れると、同じ組は最初の出現位置で上書きされる
+    first_positions = dict(zip(reversed(bigrams), range(len(bigrams) - 1, -1, -1)))
+    first_positions.update(zip(reversed(text), range(len(text) - 1, -1, -1)))
+    return counts, first_positions
+
+
+def keyword_grams(keyword):
+    """
+    キーワードを含む日記が必ず含む文字の組の集合を返す（索引を使えない場合は空の集合）
+    キーワードは正規化してから分け、2文字以上のキーワードは2文字の組だけを使う
+    """
+    keyword = fold_text(keyword)
+    grams = text_grams(keyword)
+    if len(keyword) >= 2:
+        grams = {gram for gram in grams if len(gram) == 2}
+    return grams
+
+
+def _posting_index(posting, doc_id):
+    """
+    昇順の番号のリストでの doc_id の位置を二分探索で求める（含まれない場合はNone）
+    """
+    position = bisect.bisect_left(posting, doc_id)
+    if position < len(posting) and posting[position] == doc_id:
+        return position
+    return None
+
+
+def highlight_html(text, spans):
+    """
+    抜粋の文字列を、キーワードの部分を強調したHTMLにする
+
+    Args:
+        text (str): 抜粋
+        spans (list): 強調する範囲 (開始, 終了) のリスト（開始の順）
+    """
+    parts = []
+    position = 0
+    for start, end in spans:
+        parts.append(html.escape(text[position:start]))
+        parts.append(f'<b style="background-color: #fff3a0">{html.escape(text[start:end])}</b>')
+        position = end
+    parts.append(html.escape(text[position:]))
+    return "".join(parts)
+
+
+class FullTextIndex:
+    """
+    文字の組の転置索引
+
+    日記には追加した順に番号を振る。日記の更新は古い番号を無効にして新しい番号で追加し、
+    無効な番号が増えたら作り直す（update() がFalseを返す）。
+    postings は文字の組ごとに、それを含む日記の番号の配列を持つ。occurrences は同じ順に、
+    その日記での最初の出現位置（正規化した文字列 record["folded"] での位置）と出現回数を
+    1つの整数（位置 << 16 | 回数）にした配列を持つ。
+    """
+
+    def __init__(self, records=()):
+        """
+        Args:
+            records (iterable): 索引レコード
+        """
+        # 番号 -> ファイルキー（無効な番号はNone）と、ファイルキー -> 番号
+        self.doc_keys = []
+        self.doc_ids = {}
+        # 文字の組 -> その組を含む日記の番号（昇順）と、最初の出現位置・出現回数
+        self.postings = {}
+        self.occurrences = {}
+        # 番号 -> 文字列の長さと、有効な日記の長さの合計（BM25 の文書の長さの補正に使う）
+        self.doc_lengths = array("I")
+        self.total_length = 0
+        # 無効になった番号の数
+        self.stale = 0
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """
+        日記を索引に追加する（読み込みエラーの日記は追加しない）
+        """
+        if record["error"]:
+            return
+        text = record["folded"]
+        doc_id = len(self.doc_keys)
+        self.doc_keys.append(record["file_key"])
+        self.doc_ids[record["file_key"]] = doc_id
+        self.doc_lengths.append(len(text))
+        self.total_length += len(text)
+
+        counts, first_positions = text_gram_occurrences(text)
+        # 日記の数×文字の組の数だけ回るため、属性の参照をループの外に出す
+        postings = self.postings
+        occurrences = self.occurrences
+        for gram, count in counts.items():
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("I")
+                occurrences[gram] = array("Q")
+            if count > MAX_GRAM_COUNT:
+                count = MAX_GRAM_COUNT
+            posting.append(doc_id)
+            occurrences[gram].append(first_positions[gram] << 16 | count)
+
+    def remove(self, file_key):
+        """
+        日記を索引から外す
+        """
+        doc_id = self.doc_ids.pop(file_key, None)
+        if doc_id is not None:
+            self.doc_keys[doc_id] = None
+            self.total_length -= self.doc_lengths[doc_id]
+            self.stale += 1
+
+    def update(self, old_record, new_record):
+        """
+        日記の追加・更新・削除を索引に反映する
+
+        Returns:
+            bool: 無効な番号が増えすぎて作り直したほうがよい場合はFalse
+        """
+        if old_record is not None:
+            self.remove(old_record["file_key"])
+        if new_record is not None:
+            self.add(new_record)
+        return self.stale <= max(len(self.doc_ids), 1000)
+
+    def estimate(self, keyword):
+        """
+        キーワードを含む可能性がある日記の件数の見積もり（最も少ない文字の組の日記数）を返す
+        索引を使えないキーワードの場合はNone
+        """
+        grams = keyword_grams(keyword)
+        if not grams:
+            return None
+        return min(len(self.postings.get(gram, ())) for gram in grams)
+
+    def candidates(self, keyword):
+        """
+        キーワードを含む可能性がある日記のファイルキーを返す
+        （キーワードの文字の組をすべて含む日記。実際に含むかどうかは呼び出し側で確かめる）
+
+        Returns:
+            list or None: ファイルキーのリスト。索引を使えないキーワードの場合はNone
+        """
+        grams = keyword_grams(keyword)
+        if not grams:
+            return None
+        # 日記の少ない組から順に、番号のリストを二分探索で突き合わせる
+        postings = sorted((self.postings.get(gram, array("I")) for gram in grams), key=len)
+        doc_ids = postings[0]
+        for posting in postings[1:]:
+            if not doc_ids:
+                break
+            doc_ids = [doc_id for doc_id in doc_ids if _posting_index(posting, doc_id) is not None]
+        keys = self.doc_keys
+        return [keys[doc_id] for doc_id in doc_ids if keys[doc_id] is not None]
+
+    def scores(self, file_keys, keywords):
+        """
+        日記ごとのキーワードとの関連度（BM25）を求める
+
+        Args:
+            file_keys (list): 関連度を求める日記のファイルキー
+            keywords (list): キーワード
+
+        Returns:
+            list: file_keys と同じ順の関連度（索引にない日記は0）
+        """
+        doc_ids = self.doc_ids
+        ids = [doc_ids.get(file_key) for file_key in file_keys]
+        targets = set(ids)
+        targets.discard(None)
+        totals = {}
+        documents = len(doc_ids)
+        if targets and documents:
+            # norm = k1 * (1 - b + b * 文書の長さ / 平均の長さ) の定数部分
+            norm_base = BM25_K1 * (1 - BM25_B)
+            norm_scale = BM25_K1 * BM25_B / max(self.total_length / documents, 1)
+            lengths = self.doc_lengths
+            grams = set()
+            for keyword in keywords:
+                grams.update(keyword_grams(keyword))
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if not posting:
+                    continue
+                occurrences = self.occurrences[gram]
+                # 更新で無効になった番号も日記の数に含めるが、作り直すまでの近似として扱う
+                idf = math.log(1 + (documents - len(posting) + 0.5) / (len(posting) + 0.5))
+                # 転置索引が対象の日記の数に比べて長すぎなければ辞書にして突き合わせ、長い場合は二分探索する
+                if len(posting) <= len(targets) * 16:
+                    gram_occurrences = dict(zip(posting, occurrences))
+                    matches = [(doc_id, gram_occurrences[doc_id]) for doc_id in gram_occurrences.keys() & targets]
+                else:
+                    matches = []
+                    for doc_id in targets:
+                        position = _posting_index(posting, doc_id)
+                        if position is not None:
+                            matches.append((doc_id, occurrences[position]))
+                for doc_id, occurrence in matches:
+                    frequency = occurrence & MAX_GRAM_COUNT
+                    norm = norm_base + norm_scale * lengths[doc_id]
+                    totals[doc_id] = totals.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return [totals.get(doc_id, 0.0) for doc_id in ids]
+
+    def _first_position(self, gram, file_key):
+        """
+        日記の中で文字の組が最初に現れる位置を返す（索引にない場合はNone）
+        """
+        doc_id = self.doc_ids.get(file_key)
+        posting = self.postings.get(gram)
+        if doc_id is None or posting is None:
+            return None
+        position = _posting_index(posting, doc_id)
+        return None if position is None else self.occurrences[gram][position] >> 16
+
+    def snippet(self, record, keywords, length=SNIPPET_LENGTH):
+        """
+        キーワードが最初に現れる位置の前後の抜粋を作る
+
+        キーワードを探し始める位置は、索引に保存したキーワードの最初の文字の組の出現位置を使う
+        （キーワードがそれより前に現れることはない）。タイトルにだけ現れる場合は本文の先頭を使う。
+        キーワードは正規化した文字列で探し、見つかった位置を元の文字列の位置にする。
+
+        Args:
+            record (dict): 索引レコード
+            keywords (list): キーワード
+            length (int): 抜粋の文字数
+
+        Returns:
+            tuple: (抜粋の文字列, 抜粋の中のキーワードの範囲 (開始, 終了) のリスト)
+        """
+        text = search_text(record)
+        folded = record["folded"]
+        # 正規化で長さが変わった日記だけ、位置の対応を作る（ほとんどの日記は位置が同じ）
+        offsets = None if len(folded) == len(text) else _folded_offsets(text)
+        body_start = len(record["title"]) + 1
+        folded_body_start = body_start if offsets is None else bisect.bisect_left(offsets, body_start)
+        keywords = [fold_text(keyword) for keyword in keywords if keyword.strip()]
+
+        first = None
+        for keyword in keywords:
+            start = self._first_position(keyword[:2], record["file_key"])
+            found = folded.find(keyword, max(start or 0, folded_body_start))
+            if found >= 0 and (first is None or found < first):
+                first = found
+        if first is not None:
+            first = _text_position(offsets, first)
+        begin, end = _snippet_window(text, body_start, first, length)
+
+        spans = []
+        if offsets is None:
+            folded_begin, folded_end = begin, end
+        else:
+            folded_begin, folded_end = bisect.bisect_left(offsets, begin), bisect.bisect_left(offsets, end)
+        window = folded[folded_begin:folded_end]
+        for keyword in keywords:
+            found = window.find(keyword)
+            while found >= 0:
+                start = folded_begin + found
+                spans.append((_text_position(offsets, start), _text_position(offsets, start + len(keyword))))
+                found = window.find(keyword, found + len(keyword))
+        return _format_snippet(text, begin, end, body_start, spans)
+
+
+def span_snippet(record, spans, length=SNIPPET_LENGTH):
+    """
+    一致した範囲（正規表現の検索結果など）が最初に現れる位置の前後の抜粋を作る
+
+    Args:
+        record (dict): 索引レコード
+        spans (list): search_text(record) の中の一致した範囲 (開始, 終了) のリスト
+        length (int): 抜粋の文字数
+
+    Returns:
+        tuple: (抜粋の文字列, 抜粋の中の一致した範囲 (開始, 終了) のリスト)
+    """
+    text = search_text(record)
+    body_start = len(record["title"]) + 1
+    body_spans = [start for start, _ in spans if start >= body_start]
+    begin, end = _snippet_window(text, body_start, min(body_spans) if body_spans else None, length)
+    return _format_snippet(text, begin, end, body_start,
+                           [(max(start, begin), min(stop, end)) for start, stop in spans if start < end and stop > begin])
+
+
+def _snippet_window(text, body_start, first, length):
+    """
+    抜粋にする範囲 (開始, 終了) を返す（first は最初に一致した位置。Noneの場合は本文の先頭から）
+    """
+    begin = body_start if first is None else max(body_start, first - length // 3)
+    return begin, min(len(text), begin + length)
+
+
+def _format_snippet(text, begin, end, body_start, spans):
+    """
+    抜粋の文字列と、抜粋の中の強調する範囲を返す（前後が省略されている場合は … を付ける）
+
+    Args:
+        spans (list): text の中の強調する範囲 (開始, 終了) のリスト
+    """
+    snippet = text[begin:end].replace("\n", " ")
+    spans = [(start - begin, stop - begin) for start, stop in _merge_spans(spans)]
+    if begin > body_start:
+        snippet = "…" + snippet
+        spans = [(start + 1, stop + 1) for start, stop in spans]
+    if end < len(text):
+        snippet += "…"
+    return snippet, spans
+
+
+def _merge_spans(spans):
+    """
+    重なる範囲をまとめて、開始の順に並べる
+    """
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
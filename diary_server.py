@@ -0,0 +1,349 @@
+"""
+日記を読み取り専用のJSON APIとして公開するローカルHTTPサーバー
+
+ダッシュボードやスクリプトから、GUIを使っている間も日記のデータを読めるようにする。
+サーバーは 127.0.0.1 だけで待ち受け、外部のサービスは使わない。
+
+- すべてのリクエストで1つの DiaryStore（索引）を共有し、フォルダの走査は
+  一定の間隔に1回だけ行う
+- レスポンスには ETag を付け、If-None-Match が一致すれば 304 を返す
+  （日記単体は last_modified から、一覧は索引の世代番号から ETag を作る）
+- 一覧は page / per_page でページ分割する
+
+エンドポイント:
+    GET /api/entries                 日記の一覧（from, to, tag, mood で絞り込み）
+    GET /api/entries/<file_key>      日記1件（本文のHTMLとテキストを含む）
+    GET /api/search?q=...            検索（from, to, tag, mood, title_only, case_sensitive, exact）
+    GET /api/search?query=...        検索式での検索（書き方は diary_query を参照）
+    GET /api/tags                    タグごとの件数
+    GET /api/moods                   気分ごとの件数
+    GET /api/stats/month/<yyyy-MM>   月間統計
+    GET /api/stats/year/<yyyy>       年間統計
+    GET /api/changes?cursor=...      変更履歴（cursor は前回のレスポンスの cursor、limit で件数を指定）
+
+単独で起動する場合:
+    python diary_server.py --port 8765
+"""
+import os
+import sys
+import json
+import hashlib
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from diary_core import DiaryStore, is_valid_date
+
+# 待ち受けるアドレス（ローカルからの接続だけを受け付ける）
+SERVER_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# フォルダを走査する最短の間隔（秒）
+DEFAULT_REFRESH_INTERVAL = 1.0
+
+# ページ分割の既定の件数と上限
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+# Hostヘッダーとして受け付けるホスト名（DNSリバインディング対策）
+ALLOWED_HOSTS = ("127.0.0.1", "localhost")
+
+
+class ApiError(Exception):
+    """
+    エラーレスポンスとして返す例外
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def entry_summary(record, favorites):
+    """
+    一覧用に索引レコードから項目を取り出す
+    """
+    return {
+        "file_key": record["file_key"],
+        "date": record["date"],
+        "title": record["title"],
+        "mood": record["mood"],
+        "tags": record["tags"],
+        "last_modified": record["last_modified"],
+        "favorite": record["file_key"] in favorites
+    }
+
+
+def entry_etag(file_key, last_modified, favorite):
+    """
+    日記1件のETagを last_modified から作る
+    """
+    digest = hashlib.sha1(f"{file_key}\n{last_modified}\n{favorite}".encode('utf-8')).hexdigest()
+    return f'"e-{digest[:20]}"'
+
+
+class DiaryApi:
+    """
+    リクエストのパスとクエリからレスポンスのデータを作るクラス
+    すべてのリクエストで同じ DiaryStore を共有し、ロックで排他する
+    """
+
+    def __init__(self, diary_folder="diary_entries", refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self.store = DiaryStore(diary_folder, refresh_interval=refresh_interval)
+        self.lock = threading.Lock()
+        # サーバーを起動するたびに変わる値（再起動後に古いETagと一致しないようにする）
+        self.instance_id = os.urandom(4).hex()
+
+    def handle(self, path, query, if_none_match=()):
+        """
+        リクエストを処理する
+
+        Args:
+            path (str): リクエストのパス
+            query (dict): クエリパラメータ（名前 -> 値）
+            if_none_match (list): If-None-Match ヘッダーのETag
+
+        Returns:
+            tuple: (ETag, レスポンスのデータ)。ETagが if_none_match に含まれる場合、データはNone
+        """
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if len(parts) < 2 or parts[0] != "api":
+            raise ApiError(404, "見つかりません")
+
+        for name in ("from", "to"):
+            if query.get(name) and not is_valid_date(query[name]):
+                raise ApiError(400, f"{name} は yyyy-MM-dd 形式で指定してください")
+
+        with self.lock:
+            self.store.refresh()
+            resource = parts[1]
+
+            if resource == "entries" and len(parts) == 3:
+                etag, build = self._entry(parts[2])
+            else:
+                build = self._collection(parts, query)
+                # 一覧や統計は、索引かメタデータが変わるまで同じ結果になる
+                target = path + "?" + urllib.parse.urlencode(sorted(query.items()))
+                digest = hashlib.sha1(f"{self.instance_id}\n{self.store.generation}\n{target}".encode('utf-8')).hexdigest()
+                etag = f'"c-{digest[:20]}"'
+
+            if etag in if_none_match:
+                return etag, None
+            return etag, build()
+
+    def _collection(self, parts, query):
+        """
+        一覧・検索・集計のデータを作る関数を返す
+        """
+        resource = parts[1]
+        if resource == "entries" and len(parts) == 2:
+            return lambda: self._paginate(self.store.advanced_search(
+                "", query.get("from"), query.get("to"), query.get("tag"), query.get("mood")), query)
+        if resource == "search" and len(parts) == 2 and "query" in query:
+            return lambda: self._paginate(self._query(query), query)
+        if resource == "search" and len(parts) == 2:
+            return lambda: self._paginate(self.store.advanced_search(
+                query.get("q", ""), query.get("from"), query.get("to"), query.get("tag"), query.get("mood"),
+                self._flag(query, "title_only"), self._flag(query, "case_sensitive"),
+                self._flag(query, "exact")), query)
+        if resource == "tags" and len(parts) == 2:
+            return lambda: {"tags": [{"tag": tag, "count": count}
+                                     for tag, count in sorted(self.store.tag_counts().items())]}
+        if resource == "moods" and len(parts) == 2:
+            return lambda: {"moods": [{"mood": mood, "count": count}
+                                      for mood, count in sorted(self.store.mood_counts().items())]}
+        if resource == "changes" and len(parts) == 2:
+            return lambda: self._changes(query)
+        if resource == "stats" and len(parts) == 4:
+            period = parts[3]
+            if parts[2] == "month" and is_valid_date(period + "-01"):
+                return lambda: dict(self.store.month_stats(period), period=period)
+            if parts[2] == "year" and period.isdigit() and len(period) == 4:
+                return lambda: dict(self.store.year_stats(period), period=period)
+        raise ApiError(404, "見つかりません")
+
+    def _entry(self, file_key):
+        """
+        日記1件のETagと、データを作る関数を返す
+        """
+        record = self.store.get_entry(file_key)
+        if record is None or record["error"]:
+            raise ApiError(404, "日記が見つかりません")
+        favorite = self.store.is_favorite(file_key)
+
+        def build():
+            data = self.store.read_entry(file_key)
+            if data is None:
+                raise ApiError(404, "日記が見つかりません")
+            result = entry_summary(record, self.store.metadata["favorites"])
+            result["content"] = data.get("content", "")
+            result["text"] = record["text"]
+            return result
+
+        return entry_etag(file_key, record["last_modified"], favorite), build
+
+    def _changes(self, query):
+        """
+        カーソルより後の変更履歴を返す
+        """
+        try:
+            limit = min(MAX_PER_PAGE, max(1, int(query.get("limit", DEFAULT_PER_PAGE))))
+            events, cursor = self.store.changes_since(query.get("cursor") or None, limit)
+        except ValueError:
+            raise ApiError(400, "cursor または limit の形式が正しくありません")
+        return {"changes": events, "cursor": cursor}
+
+    def _query(self, query):
+        """
+        検索式で検索する
+        """
+        from diary_query import QueryError
+
+        try:
+            return self.store.query(query["query"], self._flag(query, "case_sensitive"))
+        except QueryError as e:
+            raise ApiError(400, str(e))
+
+    def _paginate(self, records, query):
+        """
+        レコードをページ分割して返す
+        """
+        try:
+            page = max(1, int(query.get("page", 1)))
+            per_page = min(MAX_PER_PAGE, max(1, int(query.get("per_page", DEFAULT_PER_PAGE))))
+        except ValueError:
+            raise ApiError(400, "page と per_page は整数で指定してください")
+
+        total = len(records)
+        start = (page - 1) * per_page
+        favorites = set(self.store.metadata["favorites"])
+        return {
+            "entries": [entry_summary(record, favorites) for record in records[start:start + per_page]],
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "pages": (total + per_page - 1) // per_page
+        }
+
+    @staticmethod
+    def _flag(query, name):
+        """
+        クエリの真偽値（1, true, yes）を読み取る
+        """
+        return query.get(name, "").lower() in ("1", "true", "yes")
+
+
+class DiaryRequestHandler(BaseHTTPRequestHandler):
+    """
+    GETリクエストだけを受け付けるハンドラー
+    """
+    server_version = "DiaryApi/1.0"
+
+    def do_GET(self):
+        host = (self.headers.get("Host") or "").rsplit(":", 1)[0].strip("[]")
+        if host and host not in ALLOWED_HOSTS:
+            self._send_json(403, {"error": "ローカルホスト以外からのアクセスは受け付けません"})
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if_none_match = [tag.strip() for tag in (self.headers.get("If-None-Match") or "").split(",")]
+        try:
+            etag, data = self.server.api.handle(url.path, query, if_none_match)
+            if data is None:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send_json(200, data, etag)
+        except ApiError as e:
+            self._send_json(e.status, {"error": e.message})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+
+    def do_POST(self):
+        self._send_json(405, {"error": "読み取り専用です"})
+
+    do_PUT = do_DELETE = do_PATCH = do_POST
+
+    def _send_json(self, status, data, etag=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+            # 毎回ETagで再検証させる
+            self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class DiaryServer(ThreadingHTTPServer):
+    """
+    日記のJSON APIを提供するHTTPサーバー
+    """
+    daemon_threads = True
+
+    def __init__(self, diary_folder="diary_entries", port=DEFAULT_PORT,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL, verbose=False):
+        self.api = DiaryApi(diary_folder, refresh_interval)
+        self.verbose = verbose
+        super().__init__((SERVER_HOST, port), DiaryRequestHandler)
+
+    @property
+    def url(self):
+        """
+        サーバーのURL
+        """
+        return f"http://{SERVER_HOST}:{self.server_address[1]}/api/"
+
+    def start_in_background(self):
+        """
+        別スレッドでサーバーを起動する（GUIから使う）
+        """
+        thread = threading.Thread(target=self.serve_forever, name="diary-api", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+        サーバーを停止して索引キャッシュを保存する
+        """
+        self.shutdown()
+        self.server_close()
+        with self.api.lock:
+            try:
+                self.api.store.save_index_cache()
+            except OSError:
+                pass
+
+
+def serve(diary_folder="diary_entries", port=DEFAULT_PORT, verbose=True):
+    """
+    サーバーを起動し、Ctrl+C で停止するまで待ち受ける
+    """
+    server = DiaryServer(diary_folder, port, verbose=verbose)
+    print(f"日記APIを {server.url} で公開しています（Ctrl+C で停止）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.api.store.save_index_cache()
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="日記の読み取り専用JSON APIサーバー")
+    parser.add_argument("--dir", default="diary_entries", help="日記フォルダ（既定: diary_entries）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"ポート番号（既定: {DEFAULT_PORT}）")
+    args = parser.parse_args()
+    sys.exit(serve(args.dir, args.port))
@@ -0,0 +1,405 @@
+"""
+2つの日記フォルダの双方向同期
+
+ノートPCとデスクトップなど、別々に書いている日記フォルダ（共有フォルダにマウントしたものなど）を
+同じ内容にそろえる。それぞれのフォルダの日記の一覧（マニフェスト: ファイルキー・内容のハッシュ・
+revision・最終更新日時）を比べ、前回の同期から変わった日記と画像だけを転送する。
+
+- 前回の同期の時点の内容（同期ベース）を両方のフォルダに保存し、どちらで変更・削除されたかを判断する
+- 両方で変更された日記は、決まった規則（revision → 最終更新日時 → ハッシュの大きいほう）で
+  どちらを残すかを決め、もう一方は「競合コピー」として両方のフォルダに残す
+- 変更と削除がぶつかった場合は、変更を残す
+- タグ・気分・お気に入りは、追加と削除をそれぞれ反映してマージする
+- 画像は、ない側にコピーする（削除は同期しない）。同じ名前で内容が異なる画像は、決まった規則
+  （更新日時 → ハッシュの大きいほう）で元の名前に残すほうを決め、もう一方は競合コピーとして
+  両方のフォルダに残す
+
+単独で実行する場合:
+    python diary_sync.py diary_entries /mnt/share/diary_entries
+"""
+import os
+import sys
+import json
+import hashlib
+
+from diary_core import DiaryStore, is_entry_file, entry_checksum, merge_metadata
+
+# 同期するメタデータの項目（テーマなど端末ごとの設定は同期しない）
+SYNCED_METADATA_KEYS = ("tags", "moods", "favorites")
+
+# 競合コピーのタイトルに付ける文字列
+CONFLICT_TITLE_SUFFIX = "（競合コピー）"
+
+
+def _folder_path(store):
+    """
+    日記フォルダの実際のパス（シンボリックリンクをたどり、大文字/小文字の違いをそろえたもの）
+    """
+    return os.path.normcase(os.path.realpath(store.diary_folder))
+
+
+def folder_id(store, renew=False):
+    """
+    日記フォルダを識別するIDを返す（最初に呼ばれたときに作って内部フォルダに保存する）
+
+    IDと一緒に日記フォルダのパスを保存し、別のパスで見つかった場合（同期済みのフォルダを
+    コピーして別の端末の日記フォルダにした場合など）は新しいIDを作る。
+    同期ベースは両方のフォルダに保存しているため、IDが変わっても相手側に残っているものを使える。
+
+    Args:
+        renew (bool): Trueの場合は必ず新しいIDを作る
+    """
+    state = store.load_state("instance", {})
+    path = _folder_path(store)
+    if renew or not state.get("id") or state.get("path", path) != path:
+        state = {"id": os.urandom(8).hex(), "path": path}
+        store.save_state("instance", state)
+    elif "path" not in state:
+        state["path"] = path
+        store.save_state("instance", state)
+    return state["id"]
+
+
+def _file_digest(file_path):
+    """
+    ファイルの内容のSHA-256を返す
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(store):
+    """
+    日記フォルダのマニフェストを作る
+    前回作ったときと更新日時・サイズが同じファイルは読み直さない
+
+    Returns:
+        dict: "entries": ファイルキー -> {"hash", "revision", "last_modified"}、
+              "images": 画像のファイル名 -> {"hash", "mtime_ns"}
+    """
+    cache = store.load_state("sync-manifest", {})
+    cached_entries = cache.get("entries", {})
+    cached_images = cache.get("images", {})
+    entries = {}
+    images = {}
+    new_cache = {"entries": {}, "images": {}}
+
+    with os.scandir(store.diary_folder) as it:
+        for dir_entry in it:
+            if not is_entry_file(dir_entry.name) or not dir_entry.is_file():
+                continue
+            file_key = dir_entry.name[:-5]
+            stat = dir_entry.stat()
+            cached = cached_entries.get(file_key)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                row = cached
+            else:
+                data = store.read_entry(file_key)
+                if data is None:
+                    # 読み込めない日記は同期しない
+                    continue
+                row = [stat.st_mtime_ns, stat.st_size, entry_checksum(data),
+                       data.get("revision", 0), data.get("last_modified", "")]
+            new_cache["entries"][file_key] = row
+            entries[file_key] = {"hash": row[2], "revision": row[3], "last_modified": row[4]}
+
+    if os.path.isdir(store.images_folder):
+        with os.scandir(store.images_folder) as it:
+            for dir_entry in it:
+                if not dir_entry.is_file() or dir_entry.name.endswith(".tmp"):
+                    continue
+                stat = dir_entry.stat()
+                cached = cached_images.get(dir_entry.name)
+                if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                    row = cached
+                else:
+                    row = [stat.st_mtime_ns, stat.st_size, _file_digest(dir_entry.path)]
+                new_cache["images"][dir_entry.name] = row
+                images[dir_entry.name] = {"hash": row[2], "mtime_ns": row[0]}
+
+    store.save_state("sync-manifest", new_cache)
+    return {"entries": entries, "images": images}
+
+
+def conflict_winner(first, second):
+    """
+    両方で変更された日記のうち、残すほうを決める
+    revision、最終更新日時、内容のハッシュの順に比べて大きいほうを残すため、
+    どちらのフォルダから同期しても同じ結果になる
+
+    Args:
+        first (dict), second (dict): マニフェストの項目
+
+    Returns:
+        dict: 残すほうの項目
+    """
+    def rank(item):
+        return (item["revision"], item["last_modified"], item["hash"])
+    return first if rank(first) >= rank(second) else second
+
+
+def conflict_copy_key(file_key, item):
+    """
+    競合コピーのファイルキー（両方のフォルダで同じになるように、内容のハッシュから作る）
+    """
+    return f"{file_key}-conflict-{item['hash'].split(':')[-1][:8]}"
+
+
+def image_conflict_winner(first, second):
+    """
+    同じ名前で内容が異なる画像のうち、元の名前に残すほうを決める
+    更新日時、内容のハッシュの順に比べて大きいほうを残す（コピーでは更新日時を引き継ぐため、
+    どちらのフォルダから同期しても同じ結果になる）
+
+    Args:
+        first (dict), second (dict): マニフェストの画像の項目
+
+    Returns:
+        dict: 残すほうの項目
+    """
+    def rank(item):
+        return (item["mtime_ns"], item["hash"])
+    return first if rank(first) >= rank(second) else second
+
+
+def conflict_image_name(name, item):
+    """
+    画像の競合コピーのファイル名（両方のフォルダで同じになるように、内容のハッシュから作る）
+    """
+    stem, ext = os.path.splitext(name)
+    return f"{stem}-conflict-{item['hash'][:8]}{ext}"
+
+
+def plan_sync(local, remote, base):
+    """
+    2つのマニフェストと同期ベースから、行う操作を決める
+
+    Args:
+        local (dict), remote (dict): build_manifest() の "entries"
+        base (dict): 前回の同期の時点のファイルキー -> ハッシュ
+
+    Returns:
+        list: (操作, ファイルキー, 補足) のリスト。操作は
+              "to_local"・"to_remote"（コピー）、"delete_local"・"delete_remote"（削除）、
+              "conflict"（補足は (残す側, 競合コピーにする側)。側は "local" か "remote"）
+    """
+    actions = []
+    for file_key in sorted(set(local) | set(remote) | set(base)):
+        mine = local.get(file_key)
+        theirs = remote.get(file_key)
+        base_hash = base.get(file_key)
+        mine_hash = mine["hash"] if mine else None
+        theirs_hash = theirs["hash"] if theirs else None
+
+        if mine_hash == theirs_hash:
+            continue
+        if mine_hash == base_hash:
+            # 相手側だけが変わった
+            actions.append(("to_local", file_key, None) if theirs else ("delete_local", file_key, None))
+        elif theirs_hash == base_hash:
+            # こちら側だけが変わった
+            actions.append(("to_remote", file_key, None) if mine else ("delete_remote", file_key, None))
+        elif mine is None:
+            # こちらで削除、相手で変更: 変更を残す
+            actions.append(("to_local", file_key, None))
+        elif theirs is None:
+            actions.append(("to_remote", file_key, None))
+        else:
+            winner = "local" if conflict_winner(mine, theirs) is mine else "remote"
+            actions.append(("conflict", file_key, (winner, "remote" if winner == "local" else "local")))
+    return actions
+
+
+def sync_folders(local_store, remote_store, dry_run=False, progress_callback=None):
+    """
+    2つの日記フォルダを双方向に同期する
+
+    Args:
+        local_store (DiaryStore): こちら側の日記フォルダ
+        remote_store (DiaryStore): 相手側の日記フォルダ
+        dry_run (bool): Trueの場合は何も書き込まず、行う操作だけを返す
+        progress_callback (callable, optional): progress_callback(処理済み数, 総数) の形で呼ばれる
+
+    Returns:
+        dict: こちらへのコピー ("to_local")、相手へのコピー ("to_remote")、こちらでの削除 ("delete_local")、
+              相手での削除 ("delete_remote")、競合 ("conflicts")、競合コピーのファイルキー ("conflict_copies")
+              のそれぞれのファイルキーのリストと、コピーした画像の数 ("images_to_local", "images_to_remote")、
+              両方にあって内容の異なる画像 ("image_conflicts") とその競合コピーのファイル名 ("image_conflict_copies")
+    """
+    if os.path.samefile(local_store.diary_folder, remote_store.diary_folder):
+        raise ValueError("同じ日記フォルダどうしは同期できません")
+    local_id = folder_id(local_store)
+    remote_id = folder_id(remote_store)
+    if local_id == remote_id:
+        # 別のフォルダが同じIDを持っている（コピーしたフォルダ）
+        local_id = folder_id(local_store, renew=True)
+
+    # 2つの同期が同時に動いても止まらないように、ロックは決まった順に取る
+    stores = sorted([local_store, remote_store], key=lambda store: os.path.abspath(store.diary_folder))
+    with stores[0].write_lock, stores[1].write_lock:
+        local_manifest = build_manifest(local_store)
+        remote_manifest = build_manifest(remote_store)
+        # 同期ベースは両方のフォルダに同じものを保存する（どちらが新しいかは同期の回数で判断する）
+        base = max(local_store.load_state(f"sync-{remote_id}", {}), remote_store.load_state(f"sync-{local_id}", {}),
+                   key=lambda state: state.get("count", 0))
+        actions = plan_sync(local_manifest["entries"], remote_manifest["entries"], base.get("entries", {}))
+
+        result = {"to_local": [], "to_remote": [], "delete_local": [], "delete_remote": [],
+                  "conflicts": [], "conflict_copies": [],
+                  "images_to_local": 0, "images_to_remote": 0, "image_conflicts": [], "image_conflict_copies": []}
+        sides = {"local": local_store, "remote": remote_store}
+        for done, (action, file_key, detail) in enumerate(actions, 1):
+            if action == "conflict":
+                result["conflicts"].append(file_key)
+                copy_key = conflict_copy_key(file_key, (local_manifest if detail[1] == "local" else
+                                                        remote_manifest)["entries"][file_key])
+                result["conflict_copies"].append(copy_key)
+                if not dry_run:
+                    _resolve_conflict(sides[detail[0]], sides[detail[1]], file_key, copy_key)
+            else:
+                result[action].append(file_key)
+                if not dry_run:
+                    _apply_action(action, file_key, local_store, remote_store)
+            if progress_callback:
+                progress_callback(done, len(actions))
+
+        for name, theirs in sorted(remote_manifest["images"].items()):
+            mine = local_manifest["images"].get(name)
+            if mine is None:
+                result["images_to_local"] += 1
+                if not dry_run:
+                    _copy_file(os.path.join(remote_store.images_folder, name), os.path.join(local_store.images_folder, name))
+            elif mine["hash"] != theirs["hash"]:
+                loser = theirs if image_conflict_winner(mine, theirs) is mine else mine
+                copy_name = conflict_image_name(name, loser)
+                result["image_conflicts"].append(name)
+                result["image_conflict_copies"].append(copy_name)
+                if not dry_run:
+                    if loser is mine:
+                        _resolve_image_conflict(remote_store, local_store, name, copy_name)
+                    else:
+                        _resolve_image_conflict(local_store, remote_store, name, copy_name)
+        for name in sorted(local_manifest["images"]):
+            if name not in remote_manifest["images"]:
+                result["images_to_remote"] += 1
+                if not dry_run:
+                    _copy_file(os.path.join(local_store.images_folder, name), os.path.join(remote_store.images_folder, name))
+
+        if dry_run:
+            return result
+
+        merged_metadata = _sync_metadata(local_store, remote_store, base.get("metadata"))
+
+        # 同期後の内容を次回の同期ベースとして両方に保存する
+        entries = build_manifest(local_store)["entries"]
+        state = {"count": base.get("count", 0) + 1,
+                 "entries": {file_key: item["hash"] for file_key, item in entries.items()},
+                 "metadata": merged_metadata}
+        local_store.save_state(f"sync-{remote_id}", state)
+        remote_store.save_state(f"sync-{local_id}", state)
+    return result
+
+
+def _apply_action(action, file_key, local_store, remote_store):
+    """
+    コピーまたは削除を行う
+    """
+    if action in ("to_local", "to_remote"):
+        source, target = (remote_store, local_store) if action == "to_local" else (local_store, remote_store)
+        data = source.read_entry(file_key)
+        if data is None:
+            raise ValueError(f"日記を読み込めませんでした: {source.entry_path(file_key)}")
+        target.write_entry_data(file_key, data)
+    else:
+        target = local_store if action == "delete_local" else remote_store
+        if os.path.exists(target.entry_path(file_key)):
+            target.delete_entry(file_key)
+
+
+def _resolve_conflict(winner_store, loser_store, file_key, copy_key):
+    """
+    残す側の日記を両方に書き込み、もう一方の日記を競合コピーとして両方に残す
+    """
+    winner = winner_store.read_entry(file_key)
+    loser = loser_store.read_entry(file_key)
+    if winner is None or loser is None:
+        raise ValueError(f"日記を読み込めませんでした: {file_key}")
+
+    loser = dict(loser, title=loser.get("title", "無題") + CONFLICT_TITLE_SUFFIX)
+    for store in (winner_store, loser_store):
+        store.write_entry_data(copy_key, loser)
+    loser_store.write_entry_data(file_key, winner)
+
+
+def _resolve_image_conflict(winner_store, loser_store, name, copy_name):
+    """
+    残す側の画像を両方の元の名前に置き、もう一方の画像を競合コピーとして両方に残す
+    """
+    loser_path = os.path.join(loser_store.images_folder, name)
+    for store in (winner_store, loser_store):
+        _copy_file(loser_path, os.path.join(store.images_folder, copy_name))
+    _copy_file(os.path.join(winner_store.images_folder, name), loser_path)
+
+
+def _copy_file(source_path, target_path):
+    """
+    ファイルを一時ファイル経由でコピーする
+    """
+    import shutil
+    folder = os.path.dirname(target_path)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    temp_path = f"{target_path}.{os.getpid()}.tmp"
+    shutil.copy2(source_path, temp_path)
+    os.replace(temp_path, target_path)
+
+
+def _sync_metadata(local_store, remote_store, base):
+    """
+    タグ・気分・お気に入りをマージして両方に保存し、マージした内容を返す
+    """
+    def synced(metadata):
+        return {key: list(metadata.get(key, [])) for key in SYNCED_METADATA_KEYS}
+
+    local_metadata = synced(local_store.metadata)
+    remote_metadata = synced(remote_store.metadata)
+    merged = merge_metadata(base or {key: [] for key in SYNCED_METADATA_KEYS}, local_metadata, remote_metadata)
+
+    # 削除された日記はお気に入りから外す
+    merged["favorites"] = [file_key for file_key in merged["favorites"]
+                           if os.path.exists(local_store.entry_path(file_key))]
+    for store, current in ((local_store, local_metadata), (remote_store, remote_metadata)):
+        if current != merged:
+            store.metadata.update(json.loads(json.dumps(merged)))
+            store.save_metadata()
+    return merged
+
+
+def sync(local_folder, remote_folder, dry_run=False):
+    """
+    2つの日記フォルダのパスを指定して同期する（sync_folders を参照）
+    """
+    local_store = DiaryStore(local_folder)
+    remote_store = DiaryStore(remote_folder)
+    try:
+        return sync_folders(local_store, remote_store, dry_run)
+    finally:
+        for store in (local_store, remote_store):
+            try:
+                store.save_index_cache()
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="2つの日記フォルダを双方向に同期する")
+    parser.add_argument("local", help="こちら側の日記フォルダ")
+    parser.add_argument("remote", help="相手側の日記フォルダ")
+    parser.add_argument("--dry-run", action="store_true", help="何も書き込まず、行う操作だけを表示する")
+    args = parser.parse_args()
+    json.dump(sync(args.local, args.remote, args.dry_run), sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
@@ -1,17 +1,226 @@
 import sys
 import os
 import json
+import time
 import datetime
 import re
-import calendar
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QTextEdit, QPushButton, QLabel, QCalendarWidget, QComboBox, 
                             QLineEdit, QMessageBox, QTabWidget, QGridLayout, QListWidget,
                             QListWidgetItem, QFileDialog, QColorDialog, QFontDialog, QMenu,
-                            QAction, QToolBar, QStatusBar, QSplitter, QDialog, QCheckBox)
-from PyQt5.QtGui import QFont, QIcon, QTextCharFormat, QColor, QTextCursor, QTextListFormat, QTextBlockFormat, QImage, QTextImageFormat, QPen
-from PyQt5.QtCore import Qt, QDate, QTimer, QSize, QUrl
-from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
+                            QAction, QToolBar, QStatusBar, QSplitter, QDialog, QCheckBox,
+                            QDateEdit, QProgressDialog, QStyledItemDelegate, QStyleOptionViewItem, QStyle,
+                            QInputDialog)
+from PyQt5.QtGui import (QFont, QIcon, QTextCharFormat, QColor, QTextCursor, QTextListFormat, QTextBlockFormat, QImage,
+                         QTextImageFormat, QPen, QTextDocument, QFontMetrics)
+from PyQt5.QtCore import Qt, QDate, QTimer, QSize, QUrl, QThread, QFileSystemWatcher, pyqtSignal
+from diary_core import (DiaryStore, ConflictError, ZipImageWriter, IMAGE_EXPORT_STYLE, build_export_html, find_image_sources,
+                        format_jp_date, is_entry_file, entry_date_str, convert_image_paths_to_relative,
+                        convert_image_paths_to_absolute)
+
+# 起動時の各段階の経過時間を表示するかどうか（環境変数 DIARY_STARTUP_TRACE=1 で有効）
+STARTUP_TRACE = bool(os.environ.get("DIARY_STARTUP_TRACE"))
+_startup_begin = time.perf_counter()
+
+
+def startup_trace(label):
+    """
+    起動時の計測: モジュールを読み込んでからの経過時間を標準エラー出力に表示する
+    """
+    if STARTUP_TRACE:
+        print(f"[startup] {(time.perf_counter() - _startup_begin) * 1000:7.1f} ms  {label}", file=sys.stderr)
+
+
+# 日記フォルダを走査する最短の間隔（秒）
+STORE_REFRESH_INTERVAL = 1.0
+
+# ファイルの変更通知をまとめて反映するまでの待ち時間（ミリ秒）
+# 通知が続く間は待ち続けるが、最初の通知から FILE_WATCH_MAX_DELAY_MS たったら反映する
+FILE_WATCH_DELAY_MS = 500
+FILE_WATCH_MAX_DELAY_MS = 3000
+
+# クイック検索で、入力が止まってから検索を始めるまでの待ち時間（ミリ秒）
+QUICK_SEARCH_DELAY_MS = 200
+
+# 起動用スナップショット（前回終了時の画面の状態）の形式のバージョン
+STARTUP_SNAPSHOT_VERSION = 2
+
+# PDFワーカーで読み込んだ画像のキャッシュの上限（バイト）
+PDF_IMAGE_CACHE_LIMIT = 256 * 1024 * 1024
+
+# PDFワーカープロセスごとに使い回すオブジェクト
+_pdf_worker_state = {}
+
+
+def _init_pdf_worker():
+    """
+    PDFワーカープロセスを初期化する（画面を使わないQtアプリケーションを作る）
+    """
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    if QApplication.instance() is None:
+        _pdf_worker_state["app"] = QApplication(["diary-pdf"])
+    _pdf_worker_state.setdefault("fonts", {})
+    _pdf_worker_state.setdefault("images", {})
+    _pdf_worker_state.setdefault("image_bytes", 0)
+
+
+def _pdf_font(family, point_size):
+    """
+    ワーカー内で使い回すフォントを返す
+    """
+    fonts = _pdf_worker_state["fonts"]
+    key = (family, point_size)
+    if key not in fonts:
+        fonts[key] = QFont(family, point_size)
+    return fonts[key]
+
+
+def _pdf_image(abs_path):
+    """
+    ワーカー内で使い回す画像を返す（上限を超えたら古いものから捨てる）
+    """
+    images = _pdf_worker_state["images"]
+    image = images.pop(abs_path, None)
+    if image is None:
+        image = QImage(abs_path)
+        _pdf_worker_state["image_bytes"] += image.sizeInBytes()
+        while images and _pdf_worker_state["image_bytes"] > PDF_IMAGE_CACHE_LIMIT:
+            old_image = images.pop(next(iter(images)))
+            _pdf_worker_state["image_bytes"] -= old_image.sizeInBytes()
+    # 最近使ったものを末尾に置く
+    images[abs_path] = image
+    return image
+
+
+def _render_pdf_job(job):
+    """
+    日記のまとまりを1つのPDFに描画する（PDFワーカープロセスで実行）
+
+    Args:
+        job (dict): output（出力パス）、files（日記ファイルのパス）、diary_folder、title、font_family、font_size
+
+    Returns:
+        tuple: (出力パス, 日記の件数)
+    """
+    import html
+    from PyQt5.QtGui import QTextDocument
+    from PyQt5.QtPrintSupport import QPrinter
+
+    if "app" not in _pdf_worker_state and QApplication.instance() is None:
+        _init_pdf_worker()
+
+    diary_folder = os.path.abspath(job["diary_folder"])
+    document = QTextDocument()
+    document.setDefaultFont(_pdf_font(job["font_family"], job["font_size"]))
+    document.setDefaultStyleSheet("p, li { white-space: pre-wrap; }")
+    document.setBaseUrl(QUrl.fromLocalFile(diary_folder + os.sep))
+
+    parts = [f'<h1 align="center">{html.escape(job["title"])}</h1>']
+    for file_path in job["files"]:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ファイル読み込みエラー: {file_path} - {str(e)}")
+            continue
+
+        content = data.get("content", "")
+        # 画像はキャッシュから文書のリソースとして登録する
+        for src, abs_path in find_image_sources(content, diary_folder):
+            document.addResource(QTextDocument.ImageResource, document.baseUrl().resolved(QUrl(src)), _pdf_image(abs_path))
+
+        body_match = re.search(r'<body[^>]*>(.*)</body>', content, re.S)
+        body = body_match.group(1) if body_match else content
+        date_str = data.get("date", entry_date_str(os.path.basename(file_path)[:-5]))
+        # 日記ごとに改ページする
+        parts.append(f'<h2 style="page-break-before: always">{html.escape(data.get("title", "無題"))}</h2>'
+                     f'<p style="color: #555">{format_jp_date(date_str)}　{html.escape(data.get("mood", ""))}</p>'
+                     f'{body}')
+    document.setHtml("".join(parts))
+
+    printer = _pdf_worker_state.get("printer")
+    if printer is None:
+        printer = _pdf_worker_state["printer"] = QPrinter(QPrinter.HighResolution)
+        printer.setOutputFormat(QPrinter.PdfFormat)
+        printer.setPageSize(QPrinter.A4)
+    printer.setOutputFileName(job["output"])
+    printer.setDocName(job["title"])
+    document.print_(printer)
+    return job["output"], len(job["files"])
+
+
+def export_pdf_batch(diary_folder, output, date_from=None, date_to=None, per_month=False,
+                     progress_callback=None, max_workers=None, font_family="Yu Gothic", font_size=11):
+    """
+    期間内の日記をPDFにまとめて出力する
+
+    保存されているHTMLを画面を使わないQTextDocument/QPrinterで描画する。
+    月ごとのPDFはワーカープロセスに分散して描画し、各ワーカーはフォントと画像を
+    キャッシュして使い回す。1つのPDFにまとめる場合は1つのワーカーで描画する。
+
+    Args:
+        diary_folder (str): 日記フォルダ
+        output (str): 1つのPDFの場合は出力ファイルのパス、月ごとの場合は出力フォルダ
+        date_from (str, optional): 開始日（yyyy-MM-dd、この日を含む）
+        date_to (str, optional): 終了日（yyyy-MM-dd、この日を含む）
+        per_month (bool): Trueの場合は月ごとにPDFを分ける
+        progress_callback (callable, optional): progress_callback(出力済みPDF数, PDFの総数) の形で呼ばれる
+        max_workers (int, optional): 描画に使うプロセス数
+
+    Returns:
+        list: 出力したPDFのパス
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # 日付順に対象の日記を集める
+    entries = []
+    for file_name in os.listdir(diary_folder):
+        if is_entry_file(file_name):
+            date_str = entry_date_str(file_name[:-5])
+            if (date_from and date_str < date_from) or (date_to and date_str > date_to):
+                continue
+            entries.append((date_str, file_name))
+    entries.sort()
+    if not entries:
+        return []
+
+    def make_job(output_path, title, group):
+        return {
+            "output": output_path,
+            "files": [os.path.join(diary_folder, file_name) for _, file_name in group],
+            "diary_folder": diary_folder,
+            "title": title,
+            "font_family": font_family,
+            "font_size": font_size
+        }
+
+    if per_month:
+        os.makedirs(output, exist_ok=True)
+        months = {}
+        for entry in entries:
+            months.setdefault(entry[0][:7], []).append(entry)
+        jobs = [make_job(os.path.join(output, f"diary_{month_str}.pdf"), f"{month_str[:4]}年{int(month_str[5:7])}月の日記", group)
+                for month_str, group in sorted(months.items())]
+    else:
+        title = f"{format_jp_date(entries[0][0])} ～ {format_jp_date(entries[-1][0])}の日記"
+        jobs = [make_job(output, title, entries)]
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # GUIプロセスをforkしないよう、ワーカーは新しいプロセスとして起動する
+    context = multiprocessing.get_context("spawn")
+    outputs = []
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs)), mp_context=context,
+                             initializer=_init_pdf_worker) as executor:
+        futures = [executor.submit(_render_pdf_job, job) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            output_path, _ = future.result()
+            outputs.append(output_path)
+            if progress_callback:
+                progress_callback(done, len(jobs))
+    return sorted(outputs)
+
 
 class CustomCalendar(QCalendarWidget):
     """
@@ -25,39 +234,33 @@ class CustomCalendar(QCalendarWidget):
         self.setVerticalHeaderFormat(QCalendarWidget.NoVerticalHeader)
         self.setHorizontalHeaderFormat(QCalendarWidget.SingleLetterDayNames)
         
-        # 日記のある日付のリスト
-        self.diary_dates = []
-        
-        # お気に入りの日付のリスト
-        self.favorite_dates = []
+        # 日記のある日付（yyyy-MM-dd -> {"count": 件数, "favorite": お気に入りがあるか}）
+        self.diary_dates = {}
         
     def updateCells(self):
         """
         カレンダーのセルを更新する
         """
-        # 日記のある日付を取得
-        self.diary_dates = []
-        self.favorite_dates = []
-        
-        # 親ウィンドウからメタデータを取得
-        if hasattr(self.parent, 'metadata') and hasattr(self.parent, 'diary_folder'):
-            # 日記ファイルから日付を抽出
-            for file_name in os.listdir(self.parent.diary_folder):
-                if file_name.endswith('.json') and file_name != "metadata.json":
-                    try:
-                        # ファイル名から日付部分を抽出（yyyy-MM-dd_title-slug.json）
-                        date_part = file_name.split('_')[0]
-                        date = QDate.fromString(date_part, 'yyyy-MM-dd')
-                        if date.isValid():
-                            if date not in self.diary_dates:
-                                self.diary_dates.append(date)
-                            
-                            # お気に入りかどうかチェック
-                            file_key = file_name[:-5]  # .jsonを除去
-                            if file_key in self.parent.metadata["favorites"] and date not in self.favorite_dates:
-                                self.favorite_dates.append(date)
-                    except:
-                        continue
+        # 親ウィンドウの日記データから日付ごとの件数を取得
+        # （起動直後で索引をまだ読み込んでいない間はスナップショットの内容を使う）
+        if getattr(self.parent, 'index_ready', False):
+            self.diary_dates = self.parent.store.diary_dates()
+        
+        super().updateCells()
+    
+    def update_dates(self, diary_dates, date_strs):
+        """
+        指定した日付の印だけを更新する（変わった日付が分かっている場合に使う）
+        
+        Args:
+            diary_dates (dict): DiaryStore.diary_dates(date_strs) の結果
+            date_strs (list): 更新する日付（yyyy-MM-dd）
+        """
+        for date_str in date_strs:
+            if date_str in diary_dates:
+                self.diary_dates[date_str] = diary_dates[date_str]
+            else:
+                self.diary_dates.pop(date_str, None)
         
         super().updateCells()
     
@@ -74,17 +277,10 @@ class CustomCalendar(QCalendarWidget):
             painter.drawRect(rect.adjusted(1, 1, -1, -1))
         
         # 日記がある日付の場合は背景色を変える
-        if date in self.diary_dates:
-            # 日記の数を数える
-            diary_count = 0
-            date_str = date.toString('yyyy-MM-dd')
-            
-            for file_name in os.listdir(self.parent.diary_folder):
-                if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                    diary_count += 1
-            
+        info = self.diary_dates.get(date.toString('yyyy-MM-dd'))
+        if info:
             # 背景色を設定
-            if date in self.favorite_dates:
+            if info["favorite"]:
                 # お気に入りがある日付
                 painter.fillRect(rect.adjusted(2, 2, -2, -2), QColor(255, 182, 193, 150))  # 薄いピンク
             else:
@@ -92,11 +288,11 @@ class CustomCalendar(QCalendarWidget):
                 painter.fillRect(rect.adjusted(2, 2, -2, -2), QColor(173, 216, 230, 150))  # 薄い青
             
             # 複数の日記がある場合は数を表示
-            if diary_count > 1:
+            if info["count"] > 1:
                 painter.setPen(QPen(QColor(0, 0, 255)))
                 painter.drawText(rect.adjusted(0, 0, -2, -int(rect.height() / 2)), 
                                 Qt.AlignRight | Qt.AlignBottom, 
-                                f"{diary_count}")
+                                f"{info['count']}")
 
 class CustomTextEdit(QTextEdit):
     """
@@ -139,39 +335,165 @@ class CustomTextEdit(QTextEdit):
             # その他のキーイベントは通常通り処理
             super().keyPressEvent(event)
 
+class SearchResultDelegate(QStyledItemDelegate):
+    """
+    検索結果の一覧で、日付とタイトルの下にキーワード（正規表現の検索では一致した範囲）の前後の抜粋を
+    強調して表示するデリゲート
+    抜粋は表示される行の分だけ作り、ファイルキーごとに覚えておく
+    （項目の Qt.UserRole に "file_key" を持つ辞書がない行は通常どおり表示する）
+    """
+    def __init__(self, store, keywords, parent=None):
+        """
+        Args:
+            store (DiaryStore): 検索した日記の保存先
+            keywords (list): 強調するキーワード
+        """
+        super().__init__(parent)
+        self.store = store
+        self.keywords = keywords
+        # ファイルキー -> 一致した範囲（正規表現の検索結果の場合）
+        self.spans = {}
+        self.snippets = {}
+    
+    def set_keywords(self, keywords, spans=None):
+        """
+        強調するキーワードを変える（覚えておいた抜粋は捨てる）
+        
+        Args:
+            keywords (list): 強調するキーワード
+            spans (dict, optional): ファイルキー -> 強調する範囲（search_text() の文字列での位置）
+        """
+        self.keywords = keywords
+        self.spans = spans or {}
+        self.snippets = {}
+    
+    def _snippet_html(self, file_key):
+        if file_key not in self.snippets:
+            record = self.store.get_entry(file_key)
+            if record is None:
+                self.snippets[file_key] = ""
+            elif file_key in self.spans:
+                from diary_search import highlight_html, span_snippet
+                self.snippets[file_key] = highlight_html(*span_snippet(record, self.spans[file_key]))
+            else:
+                from diary_search import highlight_html
+                self.snippets[file_key] = highlight_html(*self.store.entry_snippet(record, self.keywords))
+        return self.snippets[file_key]
+    
+    def _document(self, option, data):
+        import html
+        
+        document = QTextDocument()
+        document.setDefaultFont(option.font)
+        document.setDocumentMargin(2)
+        document.setTextWidth(option.rect.width())
+        document.setHtml(f"<b>{html.escape(option.text)}</b><br>"
+                         f"<span style=\"color: gray\">{self._snippet_html(data['file_key'])}</span>")
+        return document
+    
+    def paint(self, painter, option, index):
+        data = index.data(Qt.UserRole)
+        if not isinstance(data, dict) or "file_key" not in data:
+            super().paint(painter, option, index)
+            return
+        
+        option = QStyleOptionViewItem(option)
+        self.initStyleOption(option, index)
+        document = self._document(option, data)
+        
+        # 背景と選択状態だけを描画してから、抜粋を含む文書を重ねる
+        option.text = ""
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, option, painter, option.widget)
+        painter.save()
+        painter.translate(option.rect.topLeft())
+        painter.setClipRect(option.rect.translated(-option.rect.topLeft()))
+        document.drawContents(painter)
+        painter.restore()
+    
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        data = index.data(Qt.UserRole)
+        if isinstance(data, dict) and "file_key" in data:
+            # タイトルと抜粋の2行分の高さ
+            size.setHeight(QFontMetrics(option.font).lineSpacing() * 2 + 6)
+        return size
+
+class IndexLoader(QThread):
+    """
+    日記の索引を別スレッドで読み込む（起動時に画面を止めないために使う）
+    読み込みが終わると、索引を持つ DiaryStore を loaded シグナルで渡す（失敗した場合はNone）
+    """
+    loaded = pyqtSignal(object)
+    
+    def __init__(self, diary_folder, parent=None):
+        super().__init__(parent)
+        self.diary_folder = diary_folder
+    
+    def run(self):
+        try:
+            store = DiaryStore(self.diary_folder)
+            store.refresh()
+            # 検索用の索引もこのスレッドで作っておく（最初の検索で画面が止まらないように）
+            store.bitmap_index()
+            store.full_text_index()
+            store.fuzzy_index()
+            store.saved_searches()
+        except (OSError, ValueError) as e:
+            print(f"索引の読み込みに失敗しました: {str(e)}")
+            store = None
+        self.loaded.emit(store)
+
 class DiaryApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("PyQt5 日記アプリ")
         self.setGeometry(100, 100, 1000, 700)
         
-        # データの保存先
-        self.diary_folder = "diary_entries"
-        if not os.path.exists(self.diary_folder):
-            os.makedirs(self.diary_folder)
-        
-        # 画像保存フォルダ
-        self.images_folder = os.path.join(self.diary_folder, "images")
-        if not os.path.exists(self.images_folder):
-            os.makedirs(self.images_folder)
-            
-        # メタデータファイル
-        self.metadata_file = os.path.join(self.diary_folder, "metadata.json")
-        if os.path.exists(self.metadata_file):
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                self.metadata = json.load(f)
-        else:
-            self.metadata = {
-                "tags": [],
-                "moods": ["楽しい", "普通", "悲しい", "疲れた", "興奮", "不安", "満足"],
-                "favorites": [],
-                "theme": "light"
-            }
-            self.save_metadata()
-        
-        # 現在の日付と選択された日付
+        # データの保存先（日記の読み書き・検索・統計は DiaryStore が行う）
+        # 自分で保存した日記は索引にすぐ反映されるため、フォルダの走査は1秒に1回までにする
+        self.store = DiaryStore("diary_entries", refresh_interval=STORE_REFRESH_INTERVAL)
+        self.diary_folder = self.store.diary_folder
+        self.images_folder = self.store.images_folder
+        self.metadata_file = self.store.metadata_file
+        
+        # ローカルAPIサーバー（起動していない場合はNone）
+        self.api_server = None
+        
+        # 編集中の日記のファイルキー（新規作成中の場合はNone）と、読み込んだ時点の最終更新日時・revision
+        # （revision は、他のウィンドウやツールで保存された日記を上書きしないための確認に使う）
+        self.current_file_key = None
+        self.open_entry_modified = None
+        self.open_entry_revision = None
+        
+        # 他のツール（同期ツールなど）による日記フォルダの変更を監視する（索引の読み込み後に始める）
+        # 続けて届いた通知は file_change_timer でまとめ、変わった日記・日付・一覧だけを更新する
+        self.file_watcher = None
+        self.pending_entry_keys = set()
+        self.pending_folder_scan = False
+        self.pending_images = False
+        self.pending_since = 0.0
+        self.file_change_timer = QTimer(self)
+        self.file_change_timer.setSingleShot(True)
+        self.file_change_timer.setInterval(FILE_WATCH_DELAY_MS)
+        self.file_change_timer.timeout.connect(self.apply_external_changes)
+        
+        # 起動を速くするため、日記の索引はウィンドウを表示した後に別スレッドで読み込む
+        # それまでは前回終了時のスナップショットから、開いていた日記・タグ・お気に入り・
+        # カレンダーの印を表示し、索引の読み込み後に照合する
+        self.index_ready = False
+        self.index_loader = None
+        self.startup_snapshot = self.store.load_state("startup", {})
+        if self.startup_snapshot.get("version") != STARTUP_SNAPSHOT_VERSION:
+            self.startup_snapshot = {}
+        startup_trace("データフォルダの準備")
+        
+        # 現在の日付と選択された日付（前回終了時に選択していた日付を復元する）
         self.current_date = QDate.currentDate()
         self.selected_date = self.current_date
+        restored_date = QDate.fromString(self.startup_snapshot.get("selected_date", ""), 'yyyy-MM-dd')
+        if restored_date.isValid():
+            self.selected_date = restored_date
         
         # フォント設定
         self.current_font = QFont("Yu Gothic", 11)
@@ -192,7 +514,11 @@ class DiaryApp(QMainWindow):
         
         # カレンダーの設定
         self.calendar = CustomCalendar(self)
-        self.calendar.setSelectedDate(self.current_date)
+        self.calendar.diary_dates = {date_str: {"count": count, "favorite": favorite}
+                                     for date_str, (count, favorite) in self.startup_snapshot.get("diary_dates", {}).items()}
+        self.calendar.setSelectedDate(self.selected_date)
+        if self.startup_snapshot.get("page"):
+            self.calendar.setCurrentPage(*self.startup_snapshot["page"])
         self.calendar.selectionChanged.connect(self.date_selected)
         self.left_layout.addWidget(self.calendar)
         
@@ -211,16 +537,31 @@ class DiaryApp(QMainWindow):
         self.left_layout.addWidget(QLabel("タグ一覧"))
         self.tag_list = QListWidget()
         self.tag_list.itemClicked.connect(self.filter_by_tag)
-        self.update_tag_list()
+        if "tags" in self.startup_snapshot:
+            self.tag_list.addItems(self.startup_snapshot["tags"])
+        else:
+            self.update_tag_list()
         self.left_layout.addWidget(self.tag_list)
         
         # お気に入りリスト
         self.left_layout.addWidget(QLabel("お気に入り"))
         self.favorites_list = QListWidget()
         self.favorites_list.itemClicked.connect(self.open_favorite)
-        self.update_favorites_list()
+        for file_key, display_text in self.startup_snapshot.get("favorites", []):
+            item = QListWidgetItem(display_text)
+            item.setData(Qt.UserRole, file_key)
+            self.favorites_list.addItem(item)
         self.left_layout.addWidget(self.favorites_list)
         
+        # 保存した検索（件数は日記の変更のたびに更新している集合の大きさ）
+        self.left_layout.addWidget(QLabel("保存した検索"))
+        self.saved_search_list = QListWidget()
+        self.saved_search_list.itemClicked.connect(self.open_saved_search)
+        self.saved_search_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.saved_search_list.customContextMenuRequested.connect(self.show_saved_search_menu)
+        self.set_saved_search_items(self.startup_snapshot.get("saved_searches", []))
+        self.left_layout.addWidget(self.saved_search_list)
+        
         # 右側のウィジェット
         self.right_widget = QWidget()
         self.right_layout = QVBoxLayout(self.right_widget)
@@ -374,11 +715,292 @@ class DiaryApp(QMainWindow):
         self.autosave_timer.timeout.connect(self.auto_save)
         self.autosave_timer.start(60000)  # 1分ごとに自動保存
         
-        # 初期表示
-        self.load_entry(self.selected_date)
+        # 前回終了時に開いていた日記を開く
+        self.restore_open_entry()
         
         # テーマ適用
         self.apply_theme()
+        startup_trace("ウィンドウの構築")
+    
+    def showEvent(self, event):
+        """
+        最初に表示された後で、日記の索引の読み込みを別スレッドで始める
+        """
+        super().showEvent(event)
+        if not self.index_ready and self.index_loader is None:
+            startup_trace("最初の表示")
+            self.index_loader = IndexLoader(self.diary_folder, self)
+            self.index_loader.loaded.connect(self.finish_startup)
+            self.index_loader.start()
+    
+    def restore_open_entry(self):
+        """
+        前回終了時に開いていた日記を開き、カーソル位置とスクロール位置を戻す
+        """
+        file_key = self.startup_snapshot.get("open_entry")
+        if not file_key or not os.path.exists(self.store.entry_path(file_key)):
+            return
+        if not self.load_entry(self.store.entry_path(file_key)):
+            return
+        
+        cursor = self.text_edit.textCursor()
+        cursor.setPosition(min(self.startup_snapshot.get("cursor", 0), self.text_edit.document().characterCount() - 1))
+        self.text_edit.setTextCursor(cursor)
+        scroll = self.startup_snapshot.get("scroll", 0)
+        # スクロール範囲はレイアウト後に決まるため、表示後に設定する
+        QTimer.singleShot(0, lambda: self.text_edit.verticalScrollBar().setValue(scroll))
+    
+    def finish_startup(self, loaded_store):
+        """
+        別スレッドで読み込んだ索引を引き継ぎ、スナップショットで表示していた内容を照合する
+        
+        Args:
+            loaded_store (DiaryStore): 索引を読み込んだストア（読み込みに失敗した場合はNone）
+        """
+        startup_trace("索引の読み込み")
+        if loaded_store is not None:
+            self.store.adopt_index(loaded_store)
+        else:
+            self.store.refresh(force=True)
+        self.index_ready = True
+        self.index_loader = None
+        self.start_file_watcher()
+        
+        self.update_tag_list()
+        self.update_favorites_list()
+        self.update_saved_search_list()
+        self.update_calendar_marks()
+        self.update_date_label()
+        self.validate_open_entry()
+        startup_trace("起動完了")
+    
+    def validate_open_entry(self):
+        """
+        スナップショットから開いた日記が、その後に変更・削除されていないか確認する
+        何も開いていない場合は、今日の日記が1件だけあれば開く
+        """
+        if self.text_edit.document().isModified():
+            return
+        
+        if self.current_file_key is not None:
+            record = self.store.get_entry(self.current_file_key)
+            if record is None:
+                # 他のツールで削除された
+                self.new_entry()
+                self.statusBar().showMessage("前回開いていた日記が見つかりませんでした", 5000)
+            elif record["last_modified"] != self.startup_snapshot.get("open_entry_modified"):
+                # 他のツールで変更された場合は、カーソル位置を保って読み直す
+                self.reload_open_entry()
+            return
+        
+        if not self.title_edit.text():
+            records = [record for record in self.store.entries_on_date(self.selected_date.toString('yyyy-MM-dd'))
+                       if not record["error"]]
+            if len(records) == 1:
+                self.load_entry(self.store.entry_path(records[0]["file_key"]))
+    
+    def reload_open_entry(self):
+        """
+        開いている日記をファイルから読み直す（カーソル位置とスクロール位置は保つ）
+        """
+        position = self.text_edit.textCursor().position()
+        scroll = self.text_edit.verticalScrollBar().value()
+        if not self.load_entry(self.store.entry_path(self.current_file_key)):
+            return
+        
+        cursor = self.text_edit.textCursor()
+        cursor.setPosition(min(position, self.text_edit.document().characterCount() - 1))
+        self.text_edit.setTextCursor(cursor)
+        self.text_edit.verticalScrollBar().setValue(scroll)
+    
+    def start_file_watcher(self):
+        """
+        日記フォルダ・画像フォルダ・メタデータ・開いている日記の変更の監視を始める
+        日記フォルダを監視できた場合は、問い合わせのたびにフォルダを走査するのをやめ、
+        変更の通知を受けたときだけ索引を更新する
+        """
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.directoryChanged.connect(self.on_directory_changed)
+        self.file_watcher.fileChanged.connect(self.on_file_changed)
+        
+        failed = self.file_watcher.addPaths([self.diary_folder, self.images_folder, self.metadata_file])
+        self.store.auto_refresh = self.diary_folder in failed
+        self.watch_open_entry()
+    
+    def watch_open_entry(self):
+        """
+        開いている日記のファイルを監視の対象にする
+        （ファイルを直接書き換える変更は、日記フォルダの通知だけでは分からないため）
+        """
+        if self.file_watcher is None:
+            return
+        
+        watched = [path for path in self.file_watcher.files() if path != self.metadata_file]
+        if watched:
+            self.file_watcher.removePaths(watched)
+        if self.current_file_key is not None and os.path.exists(self.store.entry_path(self.current_file_key)):
+            self.file_watcher.addPath(self.store.entry_path(self.current_file_key))
+    
+    def on_directory_changed(self, path):
+        """
+        日記フォルダか画像フォルダでファイルが追加・削除・置き換えされた
+        """
+        if os.path.normpath(path) == os.path.normpath(self.images_folder):
+            self.pending_images = True
+        else:
+            self.pending_folder_scan = True
+        self.schedule_external_changes()
+    
+    def on_file_changed(self, path):
+        """
+        監視しているファイル（メタデータ・開いている日記）が書き換えられた
+        """
+        # 置き換えで保存されたファイルは監視から外れるため、監視し直す
+        if os.path.exists(path) and path not in self.file_watcher.files():
+            self.file_watcher.addPath(path)
+        
+        file_name = os.path.basename(path)
+        if is_entry_file(file_name):
+            self.pending_entry_keys.add(file_name[:-5])
+        self.schedule_external_changes()
+    
+    def schedule_external_changes(self):
+        """
+        変更の反映を予約する（続けて届いた通知は1回の反映にまとめる）
+        """
+        if not self.file_change_timer.isActive():
+            self.pending_since = time.monotonic()
+        elif (time.monotonic() - self.pending_since) * 1000 >= FILE_WATCH_MAX_DELAY_MS:
+            # 通知が続いていても、最初の通知から一定時間たったら予約どおりに反映する
+            return
+        self.file_change_timer.start()
+    
+    def apply_external_changes(self):
+        """
+        まとめた変更の通知を索引・カレンダー・タグ一覧・お気に入り・開いている日記に反映する
+        フォルダ全体の走査は、日記フォルダでファイルが追加・削除・置き換えされた場合だけ行い、
+        読み直すのは更新日時かサイズが変わった日記だけにする
+        """
+        metadata = self.store.metadata
+        if self.pending_folder_scan:
+            changes = self.store.refresh(force=True)
+        else:
+            changes = self.store.refresh_entries(self.pending_entry_keys)
+        images_changed = self.pending_images
+        self.pending_entry_keys = set()
+        self.pending_folder_scan = False
+        self.pending_images = False
+        
+        metadata_changed = self.store.metadata is not metadata
+        if not (changes["added"] or changes["updated"] or changes["removed"] or metadata_changed or images_changed):
+            return
+        
+        self.update_tag_list()
+        self.update_favorites_list()
+        self.update_saved_search_list()
+        if metadata_changed:
+            # お気に入りが変わると印の色も変わるため、すべての日付を更新する
+            self.update_calendar_marks()
+        elif changes["dates"]:
+            self.calendar.update_dates(self.store.diary_dates(changes["dates"]), changes["dates"])
+        if self.selected_date.toString('yyyy-MM-dd') in changes["dates"]:
+            self.update_date_label()
+        
+        self.apply_external_open_entry_change(changes, images_changed)
+    
+    def apply_external_open_entry_change(self, changes, images_changed):
+        """
+        開いている日記が他のツールで変更・削除された場合に、画面の内容を合わせる
+        編集中（未保存の変更がある）の場合は内容を変えず、ステータスバーで知らせる
+        """
+        file_key = self.current_file_key
+        if file_key is None:
+            return
+        
+        self.favorite_button.setText("お気に入り解除" if self.store.is_favorite(file_key) else "お気に入り登録")
+        modified = self.text_edit.document().isModified()
+        
+        if file_key in changes["removed"]:
+            if modified:
+                self.statusBar().showMessage("開いている日記が他のツールで削除されました（保存すると作り直します）", 10000)
+            else:
+                self.new_entry()
+                self.statusBar().showMessage("開いていた日記が他のツールで削除されました", 10000)
+            return
+        
+        record = self.store.get_entry(file_key)
+        entry_changed = file_key in changes["updated"] and record is not None and \
+            record["last_modified"] != self.open_entry_modified
+        # 画像フォルダが変わった場合は、画像を含む日記を表示し直す
+        images_shown = images_changed and "<img" in self.text_edit.toHtml()
+        if not (entry_changed or images_shown):
+            return
+        if modified:
+            if entry_changed:
+                self.statusBar().showMessage("開いている日記が他のツールで変更されました（保存時に上書きするか確認します）", 10000)
+            return
+        
+        self.reload_open_entry()
+        if entry_changed:
+            self.statusBar().showMessage("他のツールでの変更を読み込みました", 5000)
+    
+    def save_startup_snapshot(self):
+        """
+        次回の起動ですぐに表示できるように、画面の状態を保存する
+        （開いている日記・カーソル位置・表示中の月のカレンダーの印・タグ・お気に入り）
+        """
+        favorites = []
+        for row in range(self.favorites_list.count()):
+            item = self.favorites_list.item(row)
+            favorites.append([item.data(Qt.UserRole), item.text()])
+        
+        # カレンダーの印は表示中の月の分だけを保存する
+        month_prefix = f"{self.calendar.yearShown():04d}-{self.calendar.monthShown():02d}"
+        diary_dates = {date_str: [info["count"], info["favorite"]]
+                       for date_str, info in self.store.diary_dates(period=month_prefix).items()}
+        
+        open_entry = self.store.get_entry(self.current_file_key) if self.current_file_key else None
+        
+        self.store.save_state("startup", {
+            "version": STARTUP_SNAPSHOT_VERSION,
+            "selected_date": self.selected_date.toString('yyyy-MM-dd'),
+            "page": [self.calendar.yearShown(), self.calendar.monthShown()],
+            "open_entry": open_entry["file_key"] if open_entry else None,
+            "open_entry_modified": open_entry["last_modified"] if open_entry else None,
+            "cursor": self.text_edit.textCursor().position(),
+            "scroll": self.text_edit.verticalScrollBar().value(),
+            "tags": [self.tag_list.item(row).text() for row in range(self.tag_list.count())],
+            "favorites": favorites,
+            "saved_searches": [self.saved_search_list.item(row).data(Qt.UserRole)
+                               for row in range(self.saved_search_list.count())],
+            "diary_dates": diary_dates
+        })
+    
+    def closeEvent(self, event):
+        """
+        終了時に起動用のスナップショットと索引キャッシュを保存する
+        （索引の読み込み前に閉じた場合は、前回のスナップショットをそのまま残す）
+        """
+        if self.api_server is not None:
+            self.api_server.stop()
+            self.api_server = None
+        self.file_change_timer.stop()
+        if self.index_loader is not None:
+            self.index_loader.wait()
+        if self.index_ready:
+            try:
+                self.save_startup_snapshot()
+                self.store.save_index_cache()
+            except OSError as e:
+                print(f"起動用データの保存に失敗しました: {str(e)}")
+        super().closeEvent(event)
+    
+    @property
+    def metadata(self):
+        """
+        メタデータ（タグ、気分、お気に入り、テーマ）
+        """
+        return self.store.metadata
     
     def create_menu_bar(self):
         menu_bar = self.menuBar()
@@ -400,10 +1022,45 @@ class DiaryApp(QMainWindow):
         export_action.triggered.connect(self.export_entry)
         file_menu.addAction(export_action)
         
+        bulk_export_action = QAction("一括エクスポート", self)
+        bulk_export_action.triggered.connect(self.show_bulk_export)
+        file_menu.addAction(bulk_export_action)
+        
+        site_export_action = QAction("静的サイトとしてエクスポート", self)
+        site_export_action.triggered.connect(self.export_site)
+        file_menu.addAction(site_export_action)
+        
+        jsonl_export_action = QAction("JSON Linesでエクスポート", self)
+        jsonl_export_action.triggered.connect(self.export_jsonl_file)
+        file_menu.addAction(jsonl_export_action)
+        
+        pdf_export_action = QAction("PDFとして一括エクスポート", self)
+        pdf_export_action.triggered.connect(self.show_pdf_export)
+        file_menu.addAction(pdf_export_action)
+        
         import_action = QAction("インポート", self)
         import_action.triggered.connect(self.import_entry)
         file_menu.addAction(import_action)
         
+        jsonl_import_action = QAction("JSON Linesからインポート", self)
+        jsonl_import_action.triggered.connect(self.import_jsonl_file)
+        file_menu.addAction(jsonl_import_action)
+        
+        bulk_import_action = QAction("ファイルから一括インポート", self)
+        bulk_import_action.triggered.connect(self.bulk_import_files)
+        file_menu.addAction(bulk_import_action)
+        
+        folder_import_action = QAction("フォルダから一括インポート", self)
+        folder_import_action.triggered.connect(self.bulk_import_folder)
+        file_menu.addAction(folder_import_action)
+        
+        file_menu.addSeparator()
+        
+        self.api_server_action = QAction("ローカルAPIサーバーを公開", self)
+        self.api_server_action.setCheckable(True)
+        self.api_server_action.toggled.connect(self.toggle_api_server)
+        file_menu.addAction(self.api_server_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction("終了", self)
@@ -459,6 +1116,28 @@ class DiaryApp(QMainWindow):
         quick_search_action.triggered.connect(self.search_entries)
         history_menu.addAction(quick_search_action)
         
+        go_to_entry_action = QAction("日記へ移動", self)
+        go_to_entry_action.setShortcut("Ctrl+G")
+        go_to_entry_action.triggered.connect(self.show_go_to_entry)
+        history_menu.addAction(go_to_entry_action)
+        
+        entry_history_action = QAction("過去の版", self)
+        entry_history_action.setShortcut("Ctrl+H")
+        entry_history_action.triggered.connect(self.show_entry_history)
+        history_menu.addAction(entry_history_action)
+        
+        history_menu.addSeparator()
+        
+        previous_entry_action = QAction("前の日記", self)
+        previous_entry_action.setShortcut("Ctrl+PgUp")
+        previous_entry_action.triggered.connect(lambda: self.open_adjacent_entry(-1))
+        history_menu.addAction(previous_entry_action)
+        
+        next_entry_action = QAction("次の日記", self)
+        next_entry_action.setShortcut("Ctrl+PgDown")
+        next_entry_action.triggered.connect(lambda: self.open_adjacent_entry(1))
+        history_menu.addAction(next_entry_action)
+        
         # 表示メニュー
         view_menu = menu_bar.addMenu("表示")
         
@@ -500,11 +1179,11 @@ class DiaryApp(QMainWindow):
             
             # 選択された日付の日記数を表示
             date_str_iso = self.selected_date.toString('yyyy-MM-dd')
-            entry_count = 0
-            
-            for file_name in os.listdir(self.diary_folder):
-                if file_name.startswith(date_str_iso) and file_name.endswith('.json') and file_name != "metadata.json":
-                    entry_count += 1
+            if self.index_ready:
+                entry_count = len(self.store.entries_on_date(date_str_iso))
+            else:
+                # 索引の読み込み前はスナップショットのカレンダーの情報を使う
+                entry_count = self.calendar.diary_dates.get(date_str_iso, {}).get("count", 0)
             
             if entry_count > 0:
                 self.entry_count_label.setText(f"この日付の日記: {entry_count}件")
@@ -534,20 +1213,14 @@ class DiaryApp(QMainWindow):
         
         # 同じ日付で複数の日記がある場合は選択ダイアログを表示
         diary_files = []
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                try:
-                    file_path = os.path.join(self.diary_folder, file_name)
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        title = data.get("title", "無題")
-                        diary_files.append({
-                            "file_path": file_path,
-                            "title": title,
-                            "file_name": file_name
-                        })
-                except:
-                    continue
+        for record in self.store.entries_on_date(date_str):
+            if record["error"]:
+                continue
+            diary_files.append({
+                "file_path": self.store.entry_path(record["file_key"]),
+                "title": record["title"],
+                "file_name": f"{record['file_key']}.json"
+            })
         
         if diary_files:
             if len(diary_files) == 1:
@@ -600,6 +1273,50 @@ class DiaryApp(QMainWindow):
             self.mood_combo.setCurrentIndex(0)
             self.statusBar().showMessage(f"{date.toString('yyyy年MM月dd日')}の日記はありません。新規作成できます。", 3000)
     
+    def open_adjacent_entry(self, step):
+        """
+        開いている日記（保存前の場合は選択中の日付）から日付順で前または次の日記を開く
+        
+        Args:
+            step (int): -1 の場合は前の日記、1 の場合は次の日記
+        """
+        if not self.index_ready:
+            return
+        
+        file_key = self.store.adjacent_entry(self.current_file_key, step, self.selected_date.toString('yyyy-MM-dd'))
+        if file_key is None:
+            self.statusBar().showMessage("これより前の日記はありません。" if step < 0 else "これより後の日記はありません。", 3000)
+            return
+        self.open_entry_by_key(file_key)
+    
+    def open_entry_by_key(self, file_key):
+        """
+        ファイルキーで指定した日記を開き、カレンダーをその日付に移す
+        
+        Args:
+            file_key (str): 日記のファイルキー
+        """
+        # 未保存の変更がある場合は確認
+        if self.text_edit.document().isModified():
+            reply = QMessageBox.question(self,
+                                         '確認',
+                                         '未保存の変更があります。保存しますか？',
+                                         QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+            
+            if reply == QMessageBox.Yes:
+                self.save_entry()
+            elif reply == QMessageBox.Cancel:
+                return
+        
+        # 日付の選択で日記の選択ダイアログが開かないように、カレンダーのシグナルを止めて日付を移す
+        date = QDate.fromString(self.store.get_entry(file_key)["date"], 'yyyy-MM-dd')
+        self.calendar.blockSignals(True)
+        self.calendar.setSelectedDate(date)
+        self.calendar.blockSignals(False)
+        self.selected_date = date
+        self.update_date_label()
+        self.load_entry(self.store.entry_path(file_key))
+    
     def load_entry_and_close_dialog(self, file_path, dialog):
         """
         日記を読み込んでダイアログを閉じる
@@ -641,6 +1358,10 @@ class DiaryApp(QMainWindow):
                 file_key = file_name[:-5]  # .jsonを除去
                 is_favorite = file_key in self.metadata["favorites"]
                 self.favorite_button.setText("お気に入り解除" if is_favorite else "お気に入り登録")
+                self.current_file_key = file_key
+                self.open_entry_modified = data.get("last_modified", "")
+                self.open_entry_revision = data.get("revision", 0)
+                self.watch_open_entry()
                 
                 # 変更フラグをリセット
                 self.text_edit.document().setModified(False)
@@ -672,6 +1393,10 @@ class DiaryApp(QMainWindow):
         self.text_edit.clear()
         self.mood_combo.setCurrentText("普通")
         self.tag_edit.clear()
+        self.current_file_key = None
+        self.open_entry_modified = None
+        self.open_entry_revision = None
+        self.watch_open_entry()
         
         # 変更フラグをリセット
         self.text_edit.document().setModified(False)
@@ -712,74 +1437,40 @@ class DiaryApp(QMainWindow):
         if tags_text:
             tags = [tag.strip() for tag in tags_text.split(",") if tag.strip()]
         
-        # メタデータに追加
-        for tag in tags:
-            if tag not in self.metadata["tags"]:
-                self.metadata["tags"].append(tag)
-        
         # 日付形式の文字列を取得
         date_str = self.selected_date.toString('yyyy-MM-dd')
         
-        # スラグの作成（タイトルをURL安全な形式に変換）
-        # スペースをハイフンに、特殊文字を削除
-        title_slug = re.sub(r'[^\w\s-]', '', title.lower())
-        title_slug = re.sub(r'[\s]+', '-', title_slug)
-        
-        # ファイル名を決定（重複を避けるため）
-        base_file_key = f"{date_str}_{title_slug}"
-        file_key = base_file_key
-        counter = 1
-        
-        # 既存のファイルをチェック
-        existing_file_path = None
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.endswith('.json') and file_name != "metadata.json":
-                if file_name.startswith(date_str):
-                    file_path = os.path.join(self.diary_folder, file_name)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            # 同じタイトルが見つかった場合、上書きする
-                            if data.get("title") == title:
-                                existing_file_path = file_path
-                                file_key = file_name[:-5]  # .jsonを除去
-                                break
-                    except:
-                        continue
-        
-        # 同じタイトルがない場合かつ同じslugのファイルが存在する場合、連番を付ける
-        if not existing_file_path:
-            while os.path.exists(os.path.join(self.diary_folder, f"{file_key}.json")):
-                file_key = f"{base_file_key}-{counter}"
-                counter += 1
-                
-        # 保存するデータを構築
-        data = {
-            "title": title,
-            "content": content,
-            "mood": mood,
-            "tags": tags,
-            "date": date_str,
-            "last_modified": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        # ファイルパスを構築
-        file_path = os.path.join(self.diary_folder, f"{file_key}.json")
+        # 開いている日記を上書きする場合は、読み込んだ後に他で保存されていないか確認する
+        expected_revision = None
+        if self.current_file_key is not None and self.store.find_entry(date_str, title) == self.current_file_key:
+            expected_revision = self.open_entry_revision
         
-        # ファイルに保存
+        # ファイルに保存（同じタイトルがあれば上書き、なければ新規作成）
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=4)
+            try:
+                file_key = self.store.save_entry(date_str, title, content, mood, tags, expected_revision)
+            except ConflictError:
+                title = self.resolve_save_conflict(title)
+                if title is None:
+                    self.statusBar().showMessage("保存を中止しました", 5000)
+                    return False
+                file_key = self.store.save_entry(date_str, title, content, mood, tags)
+            
+            record = self.store.get_entry(file_key)
+            self.current_file_key = file_key
+            self.open_entry_modified = record["last_modified"]
+            self.open_entry_revision = record["revision"]
+            self.watch_open_entry()
             
             # メタデータを更新
-            self.save_metadata()
             self.update_tag_list()
+            self.update_saved_search_list()
             
             # 変更フラグをリセット
             self.text_edit.document().setModified(False)
             
             # お気に入りボタンの更新
-            is_favorite = file_key in self.metadata["favorites"]
+            is_favorite = self.store.is_favorite(file_key)
             self.favorite_button.setText("お気に入り解除" if is_favorite else "お気に入り登録")
             
             self.statusBar().showMessage(f"日記を保存しました: {title}", 5000)
@@ -788,6 +1479,28 @@ class DiaryApp(QMainWindow):
             self.statusBar().showMessage(f"日記の保存に失敗しました: {str(e)}", 5000)
             return False
     
+    def resolve_save_conflict(self, title):
+        """
+        保存しようとした日記が他のウィンドウやツールで変更されていた場合に、どう保存するかを尋ねる
+        
+        Returns:
+            str or None: 保存に使うタイトル（上書きする場合は同じタイトル、別の日記として
+                保存する場合は新しいタイトル）。中止する場合はNone
+        """
+        reply = QMessageBox.question(self,
+                                     '競合',
+                                     'この日記は、開いた後に別のウィンドウやツールで変更されています。\n'
+                                     '上書きしますか？\n\n'
+                                     '「いいえ」を選ぶと、編集中の内容を別の日記として保存します。',
+                                     QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                                     QMessageBox.No)
+        if reply == QMessageBox.Cancel:
+            return None
+        if reply == QMessageBox.No:
+            title = f"{title}（競合 {datetime.datetime.now().strftime('%H-%M-%S')}）"
+            self.title_edit.setText(title)
+        return title
+    
     def delete_entry(self):
         """
         現在の日記を削除する
@@ -804,35 +1517,22 @@ class DiaryApp(QMainWindow):
             date_str = self.selected_date.toString('yyyy-MM-dd')
             title = self.title_edit.text().strip()
             
-            # 該当タイトルの日記ファイルを検索
-            found = False
-            for file_name in os.listdir(self.diary_folder):
-                if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                    file_path = os.path.join(self.diary_folder, file_name)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            if data.get("title") == title:
-                                # ファイルを削除
-                                os.remove(file_path)
-                                
-                                # お気に入りから削除
-                                file_key = file_name[:-5]
-                                if file_key in self.metadata["favorites"]:
-                                    self.metadata["favorites"].remove(file_key)
-                                    self.save_metadata()
-                                    self.update_favorites_list()
-                                
-                                found = True
-                                break
-                    except:
-                        continue
-            
-            if found:
-                self.new_entry()
-                self.statusBar().showMessage("日記を削除しました", 5000)
-            else:
+            # 該当タイトルの日記を検索
+            file_key = self.store.find_entry(date_str, title)
+            if file_key is None:
                 self.statusBar().showMessage("削除する日記が見つかりませんでした", 5000)
+                return
+            
+            try:
+                self.store.delete_entry(file_key)
+            except OSError as e:
+                self.statusBar().showMessage(f"日記の削除に失敗しました: {str(e)}", 5000)
+                return
+            
+            self.update_favorites_list()
+            self.update_saved_search_list()
+            self.new_entry()
+            self.statusBar().showMessage("日記を削除しました", 5000)
     
     def toggle_favorite(self):
         """
@@ -844,30 +1544,19 @@ class DiaryApp(QMainWindow):
         if not title:
             return
             
-        # 該当タイトルの日記ファイルを検索
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if data.get("title") == title:
-                            file_key = file_name[:-5]  # .jsonを除去
-                            
-                            if file_key in self.metadata["favorites"]:
-                                self.metadata["favorites"].remove(file_key)
-                                self.favorite_button.setText("お気に入り登録")
-                                self.statusBar().showMessage("お気に入りから削除しました", 5000)
-                            else:
-                                self.metadata["favorites"].append(file_key)
-                                self.favorite_button.setText("お気に入り解除")
-                                self.statusBar().showMessage("お気に入りに追加しました", 5000)
-                            
-                            self.save_metadata()
-                            self.update_favorites_list()
-                            return
-                except:
-                    continue
+        # 該当タイトルの日記を検索
+        file_key = self.store.find_entry(date_str, title)
+        if file_key is not None:
+            if self.store.toggle_favorite(file_key):
+                self.favorite_button.setText("お気に入り解除")
+                self.statusBar().showMessage("お気に入りに追加しました", 5000)
+            else:
+                self.favorite_button.setText("お気に入り登録")
+                self.statusBar().showMessage("お気に入りから削除しました", 5000)
+            
+            self.update_favorites_list()
+            self.update_saved_search_list()
+            return
         
         # 保存されていない場合、保存してからお気に入りに追加
         if self.save_entry():
@@ -892,24 +1581,7 @@ class DiaryApp(QMainWindow):
         Returns:
             str: 変換後のHTML文字列
         """
-        import re
-        
-        # 画像フォルダの絶対パス
-        images_abs_path = os.path.abspath(self.images_folder)
-        
-        # src="[絶対パス]" のパターンを検索
-        def replace_path(match):
-            path = match.group(1)
-            # 絶対パスが画像フォルダ内を指している場合は相対パスに変換
-            if os.path.abspath(path).startswith(images_abs_path):
-                return f'src="{os.path.relpath(path, os.path.abspath(self.diary_folder))}"'
-            return match.group(0)
-        
-        # 正規表現で置換
-        pattern = r'src="([^"]+)"'
-        result = re.sub(pattern, replace_path, html_content)
-        
-        return result
+        return convert_image_paths_to_relative(html_content, self.diary_folder, self.images_folder)
     
     def convert_image_paths_to_absolute(self, html_content):
         """
@@ -921,28 +1593,7 @@ class DiaryApp(QMainWindow):
         Returns:
             str: 変換後のHTML文字列
         """
-        import re
-        
-        # 日記フォルダの絶対パス
-        diary_abs_path = os.path.abspath(self.diary_folder)
-        
-        # src="[相対パス]" のパターンを検索
-        def replace_path(match):
-            path = match.group(1)
-            # 相対パスの場合は絶対パスに変換
-            if not os.path.isabs(path) and not path.startswith(("http:", "https:")):
-                # URIエンコーディングされたパスを戻す場合もある
-                import urllib.parse
-                path = urllib.parse.unquote(path)
-                abs_path = os.path.join(diary_abs_path, path)
-                return f'src="{abs_path}"'
-            return match.group(0)
-        
-        # 正規表現で置換
-        pattern = r'src="([^"]+)"'
-        result = re.sub(pattern, replace_path, html_content)
-        
-        return result
+        return convert_image_paths_to_absolute(html_content, self.diary_folder)
     
     def auto_save(self):
         if self.text_edit.document().isModified():
@@ -950,6 +1601,8 @@ class DiaryApp(QMainWindow):
             self.status_bar.showMessage("自動保存しました", 2000)
     
     def export_entry(self):
+        import html
+
         # 保存ダイアログを表示
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getSaveFileName(self, "日記をエクスポート", 
@@ -964,24 +1617,7 @@ class DiaryApp(QMainWindow):
                 content = self.text_edit.toHtml()
                 date_str = self.selected_date.toString('yyyy年MM月dd日')
                 
-                html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>{title}</title>
-    <style>
-        body {{ font-family: "Yu Gothic", sans-serif; margin: 20px; }}
-        .diary-date {{ color: #555; }}
-        .diary-title {{ font-size: 1.5em; margin: 10px 0; }}
-        .diary-content {{ margin-top: 20px; }}
-    </style>
-</head>
-<body>
-    <div class="diary-date">{date_str}</div>
-    <h1 class="diary-title">{title}</h1>
-    <div class="diary-content">{content}</div>
-</body>
-</html>"""
+                html_content = build_export_html(html.escape(title), date_str, content)
                 
                 with open(file_name, 'w', encoding='utf-8') as f:
                     f.write(html_content)
@@ -1034,96 +1670,391 @@ class DiaryApp(QMainWindow):
     def export_with_images(self, zip_file_path):
         """
         日記を画像付きでZIPファイルにエクスポートする
+        画像は一時フォルダを経由せずに直接ZIPへ書き込み、同じ画像は1回だけ格納する
         
         Args:
             zip_file_path (str): 出力するZIPファイルのパス
         """
+        import html
         import zipfile
-        import tempfile
-        import re
         
         try:
-            # 一時ディレクトリを作成
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # 画像を保存するディレクトリを作成
-                images_dir = os.path.join(temp_dir, "images")
-                os.makedirs(images_dir)
-                
-                # 日記のタイトルと内容を取得
-                title = self.title_edit.text()
-                content = self.text_edit.toHtml()
-                date_str = self.selected_date.toString('yyyy年MM月dd日')
-                
-                # HTML内の画像パスを抽出
-                image_paths = []
-                pattern = r'src="([^"]+)"'
-                for match in re.finditer(pattern, content):
-                    path = match.group(1)
-                    # 絶対パスを処理（相対パスは日記フォルダからの相対パス）
-                    if not os.path.isabs(path) and not path.startswith(("http:", "https:")):
-                        # 相対パスを絶対パスに変換
-                        abs_path = os.path.join(os.path.abspath(self.diary_folder), path)
-                        if os.path.exists(abs_path):
-                            image_paths.append((path, abs_path))
-                    elif os.path.exists(path) and not path.startswith(("http:", "https:")):
-                        image_paths.append((os.path.basename(path), path))
-                
-                # 画像をコピーしてHTMLを更新
-                for rel_path, abs_path in image_paths:
-                    # 画像ファイル名だけを取得
-                    img_filename = os.path.basename(rel_path)
-                    # 一時ディレクトリにコピー
-                    dest_path = os.path.join(images_dir, img_filename)
-                    import shutil
-                    shutil.copy2(abs_path, dest_path)
-                    
-                    # HTMLのパスを更新
-                    content = content.replace(f'src="{abs_path}"', f'src="images/{img_filename}"')
-                    if 'images/' in rel_path:  # 既に相対パスの場合
-                        content = content.replace(f'src="{rel_path}"', f'src="images/{img_filename}"')
+            # 日記のタイトルと内容を取得
+            title = self.title_edit.text()
+            content = self.text_edit.toHtml()
+            date_str = self.selected_date.toString('yyyy年MM月dd日')
+            
+            with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                # 画像を追加してHTMLのパスを更新
+                images = ZipImageWriter(zipf)
+                for src, abs_path in find_image_sources(content, self.diary_folder):
+                    arcname = images.add(abs_path)
+                    content = content.replace(f'src="{src}"', f'src="{arcname}"')
                 
-                # HTMLファイルを作成
-                html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>{title}</title>
-    <style>
-        body {{ font-family: "Yu Gothic", sans-serif; margin: 20px; }}
-        .diary-date {{ color: #555; }}
-        .diary-title {{ font-size: 1.5em; margin: 10px 0; }}
-        .diary-content {{ margin-top: 20px; }}
-        img {{ max-width: 100%; height: auto; }}
-    </style>
-</head>
-<body>
-    <div class="diary-date">{date_str}</div>
-    <h1 class="diary-title">{title}</h1>
-    <div class="diary-content">{content}</div>
-</body>
-</html>"""
-                
-                html_path = os.path.join(temp_dir, "index.html")
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
-                
-                # ZIPファイルを作成
-                with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    # HTMLファイルを追加
-                    zipf.write(html_path, arcname="index.html")
-                    
-                    # 画像ファイルを追加
-                    for root, _, files in os.walk(images_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arcname = os.path.join("images", file)
-                            zipf.write(file_path, arcname=arcname)
-                
-                self.status_bar.showMessage(f"画像付き日記を {zip_file_path} にエクスポートしました", 3000)
+                # HTMLファイルを追加
+                html_content = build_export_html(html.escape(title), date_str, content, IMAGE_EXPORT_STYLE)
+                zipf.writestr("index.html", html_content)
+            
+            self.status_bar.showMessage(f"画像付き日記を {zip_file_path} にエクスポートしました", 3000)
         
         except Exception as e:
             QMessageBox.warning(self, "エクスポートエラー", f"画像付きエクスポート中にエラーが発生しました: {str(e)}")
     
+    def ask_export_scope(self, window_title):
+        """
+        一括エクスポートの対象（期間・タグ）を選択するダイアログを表示する
+        
+        Args:
+            window_title (str): ダイアログのタイトル
+            
+        Returns:
+            tuple or None: (開始日, 終了日, タグ)。指定しない条件はNone。キャンセル時はNone
+        """
+        dialog = QDialog(self)
+        dialog.setWindowTitle(window_title)
+        dialog.setMinimumWidth(400)
+        
+        layout = QGridLayout(dialog)
+        layout.addWidget(QLabel("条件を指定しない場合はすべての日記が対象になります。"), 0, 0, 1, 4)
+        
+        # 期間
+        date_check = QCheckBox("期間:")
+        layout.addWidget(date_check, 1, 0)
+        date_from = QDateEdit(self.selected_date.addMonths(-1))
+        date_from.setCalendarPopup(True)
+        date_from.setDisplayFormat('yyyy-MM-dd')
+        layout.addWidget(date_from, 1, 1)
+        layout.addWidget(QLabel("～"), 1, 2, Qt.AlignCenter)
+        date_to = QDateEdit(self.selected_date)
+        date_to.setCalendarPopup(True)
+        date_to.setDisplayFormat('yyyy-MM-dd')
+        layout.addWidget(date_to, 1, 3)
+        
+        # タグ
+        tag_check = QCheckBox("タグ:")
+        layout.addWidget(tag_check, 2, 0)
+        tag_combo = QComboBox()
+        tag_combo.addItems(sorted(self.metadata["tags"]))
+        layout.addWidget(tag_combo, 2, 1, 1, 3)
+        
+        def update_enabled():
+            date_from.setEnabled(date_check.isChecked())
+            date_to.setEnabled(date_check.isChecked())
+            tag_combo.setEnabled(tag_check.isChecked())
+        
+        date_check.toggled.connect(update_enabled)
+        tag_check.toggled.connect(update_enabled)
+        update_enabled()
+        
+        # ボタン
+        button_layout = QHBoxLayout()
+        export_button = QPushButton("エクスポート")
+        export_button.setDefault(True)
+        export_button.clicked.connect(dialog.accept)
+        button_layout.addWidget(export_button)
+        cancel_button = QPushButton("キャンセル")
+        cancel_button.clicked.connect(dialog.reject)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout, 3, 0, 1, 4)
+        
+        if dialog.exec_() != QDialog.Accepted:
+            return None
+        
+        from_str = date_from.date().toString('yyyy-MM-dd') if date_check.isChecked() else None
+        to_str = date_to.date().toString('yyyy-MM-dd') if date_check.isChecked() else None
+        tag = tag_combo.currentText() if tag_check.isChecked() else None
+        return from_str, to_str, tag or None
+    
+    def show_bulk_export(self):
+        """
+        期間・タグ・すべてを対象にした一括エクスポートを行う
+        """
+        scope = self.ask_export_scope("一括エクスポート")
+        if scope is None:
+            return
+        from_str, to_str, tag = scope
+        
+        options = QFileDialog.Options()
+        zip_file_path, _ = QFileDialog.getSaveFileName(self, "一括エクスポート", 
+                                                       f"diary_export_{QDate.currentDate().toString('yyyyMMdd')}.zip", 
+                                                       "ZIPファイル (*.zip)", 
+                                                       options=options)
+        if not zip_file_path:
+            return
+        
+        # 進捗ダイアログ
+        progress = QProgressDialog("日記をエクスポートしています...", "中止", 0, 100, self)
+        progress.setWindowTitle("一括エクスポート")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+        
+        def on_progress(done, total):
+            progress.setMaximum(max(total, 1))
+            progress.setValue(done)
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+        
+        try:
+            result = self.store.export_zip(zip_file_path, from_str, to_str, tag, on_progress)
+        except Exception as e:
+            progress.close()
+            QMessageBox.warning(self, "エクスポートエラー", f"一括エクスポート中にエラーが発生しました: {str(e)}")
+            return
+        progress.close()
+        
+        if result["cancelled"]:
+            # 中断した場合は不完全なファイルを残さない
+            try:
+                os.remove(zip_file_path)
+            except OSError:
+                pass
+            self.status_bar.showMessage("一括エクスポートを中止しました", 3000)
+        else:
+            self.status_bar.showMessage(f"{result['entries']}件の日記と{result['images']}枚の画像を {zip_file_path} にエクスポートしました", 5000)
+    
+    def export_site(self):
+        """
+        すべての日記を静的なHTMLサイトとしてフォルダに書き出す
+        前回と同じフォルダを選ぶと、変更があったページだけを書き直す
+        """
+        output_dir = QFileDialog.getExistingDirectory(self, "静的サイトの出力先を選択", "")
+        if not output_dir:
+            return
+        
+        progress = QProgressDialog("ページを生成しています...", None, 0, 100, self)
+        progress.setWindowTitle("静的サイトとしてエクスポート")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+        
+        def on_progress(done, total):
+            progress.setMaximum(max(total, 1))
+            progress.setValue(done)
+            QApplication.processEvents()
+        
+        try:
+            result = self.store.export_site(output_dir, on_progress)
+        except Exception as e:
+            progress.close()
+            QMessageBox.warning(self, "エクスポートエラー", f"静的サイトの生成中にエラーが発生しました: {str(e)}")
+            return
+        progress.close()
+        
+        self.status_bar.showMessage(f"静的サイトを {output_dir} に書き出しました"
+                                    f"（更新 {result['rendered']}ページ / 変更なし {result['unchanged']}ページ）", 5000)
+    
+    def export_jsonl_file(self):
+        """
+        日記をJSON Lines形式でエクスポートする（期間・タグで絞り込み可能）
+        """
+        scope = self.ask_export_scope("JSON Linesでエクスポート")
+        if scope is None:
+            return
+        from_str, to_str, tag = scope
+        
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getSaveFileName(self, "JSON Linesでエクスポート", 
+                                                   f"diary_{QDate.currentDate().toString('yyyyMMdd')}.jsonl", 
+                                                   "JSON Linesファイル (*.jsonl)", 
+                                                   options=options)
+        if not file_name:
+            return
+        
+        try:
+            count = self.store.export_jsonl(file_name, from_str, to_str, tag)
+            self.status_bar.showMessage(f"{count}件の日記を {file_name} にエクスポートしました", 5000)
+        except Exception as e:
+            QMessageBox.warning(self, "エクスポートエラー", f"JSON Linesのエクスポート中にエラーが発生しました: {str(e)}")
+    
+    def import_jsonl_file(self):
+        """
+        JSON Lines形式の日記をインポートして保存する（変更のない日記はスキップ）
+        """
+        options = QFileDialog.Options()
+        file_name, _ = QFileDialog.getOpenFileName(self, "JSON Linesからインポート", "", 
+                                                   "JSON Linesファイル (*.jsonl);;すべてのファイル (*)", 
+                                                   options=options)
+        if not file_name:
+            return
+        
+        try:
+            result = self.store.import_jsonl(file_name)
+        except Exception as e:
+            QMessageBox.warning(self, "インポートエラー", f"JSON Linesのインポート中にエラーが発生しました: {str(e)}")
+            return
+        
+        self.update_tag_list()
+        self.update_favorites_list()
+        self.update_saved_search_list()
+        self.update_calendar_marks()
+        
+        QMessageBox.information(self, "インポート結果", 
+                                f"インポート: {result['imported']}件\n"
+                                f"変更なし: {result['skipped']}件\n"
+                                f"エラー: {result['errors']}件")
+    
+    def bulk_import_files(self):
+        """
+        ZIP・JSON Lines・JSON・HTML・テキストファイルをまとめてインポートする
+        """
+        options = QFileDialog.Options()
+        file_names, _ = QFileDialog.getOpenFileNames(self, "ファイルから一括インポート", "", 
+                                                     "インポート可能なファイル (*.zip *.jsonl *.json *.html *.htm *.txt)", 
+                                                     options=options)
+        if file_names:
+            self.run_bulk_import(file_names)
+    
+    def bulk_import_folder(self):
+        """
+        フォルダ内の日記ファイルをまとめてインポートする
+        """
+        folder = QFileDialog.getExistingDirectory(self, "フォルダから一括インポート", "")
+        if folder:
+            self.run_bulk_import([folder])
+    
+    def run_bulk_import(self, paths):
+        """
+        一括インポートを実行し、進捗と結果を表示する
+        
+        Args:
+            paths (list): インポートするファイルまたはフォルダのパス
+        """
+        progress = QProgressDialog("日記をインポートしています...", "中止", 0, 100, self)
+        progress.setWindowTitle("一括インポート")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(300)
+        
+        def on_progress(done, total):
+            progress.setMaximum(max(total, 1))
+            progress.setValue(done)
+            QApplication.processEvents()
+            return not progress.wasCanceled()
+        
+        try:
+            result = self.store.bulk_import(paths, on_progress)
+        except Exception as e:
+            progress.close()
+            QMessageBox.warning(self, "インポートエラー", f"一括インポート中にエラーが発生しました: {str(e)}")
+            return
+        progress.close()
+        
+        self.update_tag_list()
+        self.update_favorites_list()
+        self.update_saved_search_list()
+        self.update_calendar_marks()
+        
+        QMessageBox.information(self, "インポート結果", 
+                                f"インポート: {result['imported']}件\n"
+                                f"重複のためスキップ: {result['duplicates']}件\n"
+                                f"画像: {result['images']}枚\n"
+                                f"エラー: {result['errors']}件" + 
+                                ("\n（途中で中止しました）" if result["cancelled"] else ""))
+    
+    def toggle_api_server(self, checked):
+        """
+        日記を読み取り専用のJSON APIとして公開するローカルHTTPサーバーを起動/停止する
+        """
+        from diary_server import DiaryServer, DEFAULT_PORT
+        
+        if not checked:
+            if self.api_server is not None:
+                self.api_server.stop()
+                self.api_server = None
+                self.status_bar.showMessage("ローカルAPIサーバーを停止しました", 3000)
+            return
+        
+        if self.api_server is not None:
+            return
+        try:
+            self.api_server = DiaryServer(self.diary_folder, DEFAULT_PORT)
+        except OSError as e:
+            QMessageBox.warning(self, "サーバーエラー", f"ローカルAPIサーバーを起動できませんでした: {str(e)}")
+            self.api_server_action.setChecked(False)
+            return
+        self.api_server.start_in_background()
+        self.status_bar.showMessage(f"ローカルAPIサーバーを {self.api_server.url} で公開しています", 5000)
+    
+    def show_pdf_export(self):
+        """
+        期間内の日記をPDFとして一括エクスポートするダイアログを表示する
+        """
+        dialog = QDialog(self)
+        dialog.setWindowTitle("PDFとして一括エクスポート")
+        dialog.setMinimumWidth(400)
+        
+        layout = QGridLayout(dialog)
+        
+        # 期間
+        layout.addWidget(QLabel("期間:"), 0, 0)
+        date_from = QDateEdit(QDate(self.selected_date.year(), 1, 1))
+        date_from.setCalendarPopup(True)
+        date_from.setDisplayFormat('yyyy-MM-dd')
+        layout.addWidget(date_from, 0, 1)
+        layout.addWidget(QLabel("～"), 0, 2, Qt.AlignCenter)
+        date_to = QDateEdit(QDate(self.selected_date.year(), 12, 31))
+        date_to.setCalendarPopup(True)
+        date_to.setDisplayFormat('yyyy-MM-dd')
+        layout.addWidget(date_to, 0, 3)
+        
+        # 出力形式
+        layout.addWidget(QLabel("出力:"), 1, 0)
+        mode_combo = QComboBox()
+        mode_combo.addItems(["1つのPDFにまとめる", "月ごとにPDFを分ける"])
+        layout.addWidget(mode_combo, 1, 1, 1, 3)
+        
+        # ボタン
+        button_layout = QHBoxLayout()
+        export_button = QPushButton("エクスポート")
+        export_button.setDefault(True)
+        export_button.clicked.connect(dialog.accept)
+        button_layout.addWidget(export_button)
+        cancel_button = QPushButton("キャンセル")
+        cancel_button.clicked.connect(dialog.reject)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout, 2, 0, 1, 4)
+        
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        
+        from_str = date_from.date().toString('yyyy-MM-dd')
+        to_str = date_to.date().toString('yyyy-MM-dd')
+        per_month = mode_combo.currentIndex() == 1
+        
+        if per_month:
+            output = QFileDialog.getExistingDirectory(self, "PDFの出力先を選択", "")
+        else:
+            options = QFileDialog.Options()
+            output, _ = QFileDialog.getSaveFileName(self, "PDFとして一括エクスポート", 
+                                                    f"diary_{from_str}_{to_str}.pdf", 
+                                                    "PDFファイル (*.pdf)", 
+                                                    options=options)
+        if not output:
+            return
+        
+        progress = QProgressDialog("PDFを作成しています...", None, 0, 100, self)
+        progress.setWindowTitle("PDFとして一括エクスポート")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.setValue(0)
+        QApplication.processEvents()
+        
+        def on_progress(done, total):
+            progress.setMaximum(max(total, 1))
+            progress.setValue(done)
+            QApplication.processEvents()
+        
+        try:
+            outputs = export_pdf_batch(self.diary_folder, output, from_str, to_str, per_month, on_progress)
+        except Exception as e:
+            progress.close()
+            QMessageBox.warning(self, "エクスポートエラー", f"PDFの作成中にエラーが発生しました: {str(e)}")
+            return
+        progress.close()
+        
+        if outputs:
+            self.status_bar.showMessage(f"{len(outputs)}個のPDFを作成しました", 5000)
+        else:
+            QMessageBox.information(self, "PDFとして一括エクスポート", "指定した期間に日記がありません。")
+    
     def import_entry(self):
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(self, "日記をインポート", "", 
@@ -1180,113 +2111,121 @@ class DiaryApp(QMainWindow):
         """
         メタデータからタグリストを更新する
         """
-        self.tag_list.clear()
-        
         # タグを追加（アルファベット順）
-        for tag in sorted(self.metadata["tags"]):
-            self.tag_list.addItem(tag)
+        # 表示中の内容と同じであれば作り直さない（選択位置とスクロール位置を保つ）
+        tags = sorted(self.metadata["tags"])
+        if tags == [self.tag_list.item(row).text() for row in range(self.tag_list.count())]:
+            return
+        
+        self.tag_list.clear()
+        self.tag_list.addItems(tags)
     
     def update_favorites_list(self):
-        self.favorites_list.clear()
+        favorites = []
+        for record in self.store.favorite_entries():
+            # 日付部分を抽出（yyyy-MM-dd）
+            display_date = record["date"].replace('-', '/')
+            favorites.append((record["file_key"], f"{display_date}: {record['title']}"))
+        
+        # 表示中の内容（起動時のスナップショットなど）と同じであれば作り直さない
+        current = [(self.favorites_list.item(row).data(Qt.UserRole), self.favorites_list.item(row).text())
+                   for row in range(self.favorites_list.count())]
+        if current == favorites:
+            return
         
-        for date_title_str in sorted(self.metadata["favorites"], reverse=True):
-            # ファイル名を構築
-            file_path = os.path.join(self.diary_folder, f"{date_title_str}.json")
-            
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    title = data.get("title", "無題")
-                    
-                    # 日付部分を抽出（yyyy-MM-dd）
-                    date_str = date_title_str.split('_')[0]
-                    date_obj = QDate.fromString(date_str, 'yyyy-MM-dd')
-                    display_date = date_obj.toString('yyyy/MM/dd')
-                    
-                    item = QListWidgetItem(f"{display_date}: {title}")
-                    item.setData(Qt.UserRole, date_title_str)
-                    self.favorites_list.addItem(item)
+        self.favorites_list.clear()
+        for file_key, display_text in favorites:
+            item = QListWidgetItem(display_text)
+            item.setData(Qt.UserRole, file_key)
+            self.favorites_list.addItem(item)
     
     def open_favorite(self, item):
-        date_title_str = item.data(Qt.UserRole)
-        # 日付部分のみを抽出
-        date_str = date_title_str.split('_')[0]
-        date = QDate.fromString(date_str, 'yyyy-MM-dd')
+        file_key = item.data(Qt.UserRole)
+        record = self.store.get_entry(file_key)
+        if record is None:
+            return
         
         # カレンダーの日付を変更
-        self.calendar.setSelectedDate(date)
+        self.calendar.setSelectedDate(QDate.fromString(record["date"], 'yyyy-MM-dd'))
         
-        # 特定のタイトルの日記を開く
-        file_path = os.path.join(self.diary_folder, f"{date_title_str}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                title = data.get("title", "")
-                
-                # load_entry で日記を読み込む
-                for file_name in os.listdir(self.diary_folder):
-                    if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                        diary_file_path = os.path.join(self.diary_folder, file_name)
-                        try:
-                            with open(diary_file_path, 'r', encoding='utf-8') as f:
-                                diary_data = json.load(f)
-                                if diary_data.get("title", "") == title:
-                                    # カレンダーを更新した後、ロード処理を手動で行う
-                                    self.title_edit.setText(title)
-                                    
-                                    # HTMLコンテンツ内の画像パスを絶対パスに変換
-                                    content = diary_data.get("content", "")
-                                    content = self.convert_image_paths_to_absolute(content)
-                                    self.text_edit.setHtml(content)
-                                    
-                                    self.mood_combo.setCurrentText(diary_data.get("mood", "普通"))
-                                    self.tag_edit.setText(", ".join(diary_data.get("tags", [])))
-                                    
-                                    # お気に入りボタンの更新
-                                    is_favorite = file_name[:-5] in self.metadata["favorites"]
-                                    self.favorite_button.setText("お気に入り解除" if is_favorite else "お気に入り登録")
-                                    
-                                    # 変更フラグをリセット
-                                    self.text_edit.document().setModified(False)
-                                    return
-                        except:
-                            continue
+        # 日付選択で別の日記が読み込まれることがあるため、お気に入りの日記を読み込み直す
+        self.load_entry(self.store.entry_path(file_key))
 
+    def set_saved_search_items(self, saved_searches):
+        """
+        保存した検索のリストを作り直す（表示中の内容と同じであれば何もしない）
+        
+        Args:
+            saved_searches (list): [名前, 件数] のリスト
+        """
+        current = [self.saved_search_list.item(row).data(Qt.UserRole) for row in range(self.saved_search_list.count())]
+        if current == saved_searches:
+            return
+        
+        self.saved_search_list.clear()
+        for name, count in saved_searches:
+            item = QListWidgetItem(f"{name} ({count}件)")
+            item.setData(Qt.UserRole, [name, count])
+            self.saved_search_list.addItem(item)
+    
+    def update_saved_search_list(self):
+        """
+        保存した検索の件数を更新する（件数は索引とともに更新されているため、検索し直さない）
+        """
+        saved_searches = self.store.saved_searches()
+        self.set_saved_search_items([[search["name"], search["count"]] for search in saved_searches])
+        for row, search in enumerate(saved_searches):
+            self.saved_search_list.item(row).setToolTip(search["query"])
+    
+    def open_saved_search(self, item):
+        name = item.data(Qt.UserRole)[0]
+        matching_entries = self.store.saved_search_entries(name)
+        if matching_entries is None:
+            # 他のウィンドウなどで削除されていた場合
+            self.update_saved_search_list()
+            return
+        self.show_entry_list_dialog(f"保存した検索 '{name}' の検索結果", matching_entries,
+                                    f"保存した検索 '{name}' に一致する日記はありません。")
+    
+    def show_saved_search_menu(self, position):
+        """
+        保存した検索の右クリックメニューを表示する
+        """
+        item = self.saved_search_list.itemAt(position)
+        if item is None:
+            return
+        name = item.data(Qt.UserRole)[0]
+        
+        menu = QMenu(self)
+        delete_action = menu.addAction("削除")
+        if menu.exec_(self.saved_search_list.viewport().mapToGlobal(position)) != delete_action:
+            return
+        reply = QMessageBox.question(self, '確認', f"保存した検索 '{name}' を削除しますか？",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            self.store.delete_saved_search(name)
+            self.update_saved_search_list()
+    
     def filter_by_tag(self, item):
         selected_tag = item.text()
         
-        matching_entries = []
-        
-        # すべての日記ファイルを検索
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    try:
-                        data = json.load(f)
-                        if selected_tag in data.get("tags", []):
-                            # 日付とタイトル情報を保持
-                            file_key = file_name[:-5]  # .jsonを除去
-                            title = data.get("title", "無題")
-                            
-                            # 日付部分を抽出
-                            date_str = file_key.split('_')[0]
-                            date_obj = QDate.fromString(date_str, 'yyyy-MM-dd')
-                            
-                            matching_entries.append({
-                                "file_key": file_key,
-                                "title": title,
-                                "date": date_obj,
-                                "date_str": date_str
-                            })
-                    except:
-                        continue
+        matching_entries = self.store.entries_with_tag(selected_tag)
+        self.show_entry_list_dialog(f"タグ '{selected_tag}' の検索結果", matching_entries,
+                                    f"タグ '{selected_tag}' が付いた日記はありません。")
+    
+    def show_entry_list_dialog(self, title, matching_entries, empty_message):
+        """
+        日記の一覧をダイアログで表示する（ダブルクリックで日記を開く）
         
+        Args:
+            title (str): ダイアログのタイトル
+            matching_entries (list): 索引レコード（この順に表示する）
+            empty_message (str): 日記がない場合に表示するメッセージ
+        """
         if matching_entries:
             # 結果表示ダイアログ
             result_dialog = QDialog(self)
-            result_dialog.setWindowTitle(f"タグ '{selected_tag}' の検索結果")
+            result_dialog.setWindowTitle(title)
             result_dialog.setMinimumWidth(500)
             
             layout = QVBoxLayout(result_dialog)
@@ -1295,12 +2234,12 @@ class DiaryApp(QMainWindow):
             layout.addWidget(result_list)
             
             # 結果をリストに追加（日付の新しい順）
-            for entry in sorted(matching_entries, key=lambda x: x["date"], reverse=True):
-                display_date = entry["date"].toString('yyyy/MM/dd')
+            for entry in matching_entries:
+                display_date = QDate.fromString(entry["date"], 'yyyy-MM-dd').toString('yyyy/MM/dd')
                 title = entry["title"]
                 
                 item = QListWidgetItem(f"{display_date}: {title}")
-                item.setData(Qt.UserRole, {"date_str": entry["date_str"], "title": title})
+                item.setData(Qt.UserRole, {"date_str": entry["date"], "title": title})
                 result_list.addItem(item)
             
             # アイテムクリック時の処理
@@ -1312,7 +2251,7 @@ class DiaryApp(QMainWindow):
             
             result_dialog.exec_()
         else:
-            QMessageBox.information(self, "検索結果", f"タグ '{selected_tag}' が付いた日記はありません。")
+            QMessageBox.information(self, "検索結果", empty_message)
     
     def open_tag_search_result(self, item, dialog):
         data = item.data(Qt.UserRole)
@@ -1336,34 +2275,9 @@ class DiaryApp(QMainWindow):
         """
         date_str = self.selected_date.toString('yyyy-MM-dd')
         
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.startswith(date_str) and file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        if data.get("title", "") == title:
-                            # 日記を読み込む
-                            self.title_edit.setText(title)
-                            
-                            # HTMLコンテンツ内の画像パスを絶対パスに変換
-                            content = data.get("content", "")
-                            content = self.convert_image_paths_to_absolute(content)
-                            self.text_edit.setHtml(content)
-                            
-                            self.mood_combo.setCurrentText(data.get("mood", "普通"))
-                            self.tag_edit.setText(", ".join(data.get("tags", [])))
-                            
-                            # お気に入りボタンの更新
-                            file_key = file_name[:-5]
-                            is_favorite = file_key in self.metadata["favorites"]
-                            self.favorite_button.setText("お気に入り解除" if is_favorite else "お気に入り登録")
-                            
-                            # 変更フラグをリセット
-                            self.text_edit.document().setModified(False)
-                            return
-                except:
-                    continue
+        file_key = self.store.find_entry(date_str, title)
+        if file_key is not None:
+            self.load_entry(self.store.entry_path(file_key))
     
     def show_diary_list(self):
         """
@@ -1415,105 +2329,41 @@ class DiaryApp(QMainWindow):
         """)
         layout.addWidget(diary_list)
         
-        # 全ての日記ファイルを取得
+        # 全ての日記の索引を取得
         diary_entries = []
         
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        file_key = file_name[:-5]  # .jsonを除去
-                        
-                        # 日付情報を取得
-                        date = None
-                        date_str = ""
-                        jp_date = ""
-                        
-                        # ファイル名から日付を抽出
-                        if '_' in file_key:
-                            date_parts = file_key.split('_')[0]
-                            date = QDate.fromString(date_parts, 'yyyy-MM-dd')
-                            if date.isValid():
-                                date_str = date_parts
-                                jp_date = date.toString('yyyy年MM月dd日(ddd)')
-                        
-                        # ファイル名が直接日付形式の場合（旧形式）
-                        if not date or not date.isValid():
-                            date = QDate.fromString(file_key, 'yyyy-MM-dd')
-                            if date.isValid():
-                                date_str = file_key
-                                jp_date = date.toString('yyyy年MM月dd日(ddd)')
-                        
-                        # 日付が取得できなかった場合はファイルの更新日時を使用
-                        if not date or not date.isValid():
-                            if "last_modified" in data:
-                                try:
-                                    modified_str = data["last_modified"]
-                                    modified_date = datetime.datetime.strptime(modified_str, "%Y-%m-%d %H:%M:%S")
-                                    date = QDate(modified_date.year, modified_date.month, modified_date.day)
-                                    date_str = date.toString('yyyy-MM-dd')
-                                    jp_date = date.toString('yyyy年MM月dd日(ddd)')
-                                except:
-                                    # 現在の日付を使用
-                                    date = QDate.currentDate()
-                                    date_str = date.toString('yyyy-MM-dd')
-                                    jp_date = date.toString('yyyy年MM月dd日(ddd)')
-                            else:
-                                # 現在の日付を使用
-                                date = QDate.currentDate()
-                                date_str = date.toString('yyyy-MM-dd')
-                                jp_date = date.toString('yyyy年MM月dd日(ddd)')
-                        
-                        title = data.get("title", "無題")
-                        # タイトルが空の場合
-                        if title.strip() == "":
-                            title = "無題"
-                        
-                        # 気分、タグなどの情報取得
-                        mood = data.get("mood", "")
-                        tags = data.get("tags", [])
-                        tags_str = ", ".join(tags) if tags else "タグなし"
-                        modified = data.get("last_modified", "")
-                        
-                        # テキスト内容のプレビュー
-                        content = data.get("content", "")
-                        plain_content = self.html_to_plain(content)
-                        preview = plain_content[:100] + "..." if len(plain_content) > 100 else plain_content
-                        
-                        # 日記エントリを追加
-                        diary_entries.append({
-                            "date": date,
-                            "date_str": date_str,
-                            "jp_date": jp_date,
-                            "title": title,
-                            "mood": mood,
-                            "tags": tags,
-                            "tags_str": tags_str,
-                            "modified": modified,
-                            "preview": preview,
-                            "file_key": file_key,
-                            "file_path": file_path
-                        })
-                except Exception as e:
-                    # 読み込みエラーの場合でも最低限の情報を表示
-                    print(f"ファイル読み込みエラー: {file_name} - {str(e)}")
-                    file_key = file_name[:-5]
-                    date = QDate.currentDate()
-                    diary_entries.append({
-                        "date": date,
-                        "date_str": date.toString('yyyy-MM-dd'),
-                        "jp_date": date.toString('yyyy年MM月dd日(ddd)'),
-                        "title": f"[読み込みエラー] {file_key}",
-                        "mood": "",
-                        "tags": [],
-                        "tags_str": "タグなし",
-                        "modified": "",
-                        "preview": "ファイルの読み込みに失敗しました。",
-                        "file_key": file_key,
-                        "file_path": file_path
-                    })
+        for record in self.store.entries():
+            file_key = record["file_key"]
+            
+            # 日付が取得できなかった場合は現在の日付を使用
+            date = QDate.fromString(record["date"], 'yyyy-MM-dd')
+            if not date.isValid():
+                date = QDate.currentDate()
+            
+            if record["error"]:
+                # 読み込みエラーの場合でも最低限の情報を表示
+                preview = "ファイルの読み込みに失敗しました。"
+            else:
+                # テキスト内容のプレビュー
+                plain_content = record["text"]
+                preview = plain_content[:100] + "..." if len(plain_content) > 100 else plain_content
+            
+            tags = record["tags"]
+            
+            # 日記エントリを追加
+            diary_entries.append({
+                "date": date,
+                "date_str": date.toString('yyyy-MM-dd'),
+                "jp_date": date.toString('yyyy年MM月dd日(ddd)'),
+                "title": record["title"].strip() or "無題",
+                "mood": record["mood"],
+                "tags": tags,
+                "tags_str": ", ".join(tags) if tags else "タグなし",
+                "modified": record["last_modified"],
+                "preview": preview,
+                "file_key": file_key,
+                "file_path": self.store.entry_path(file_key)
+            })
         
         # 日付順に並べ替え（新しい順）
         diary_entries.sort(key=lambda x: x["date"], reverse=True)
@@ -1665,17 +2515,6 @@ class DiaryApp(QMainWindow):
         # ダイアログを表示
         diary_list_dialog.exec_()
 
-    def html_to_plain(self, html_content):
-        """
-        HTMLコンテンツをプレーンテキストに変換する
-        """
-        from PyQt5.QtCore import Qt
-        from PyQt5.QtGui import QTextDocument
-        
-        doc = QTextDocument()
-        doc.setHtml(html_content)
-        return doc.toPlainText()
-    
     def change_font(self):
         """
         フォント選択ダイアログを表示し、選択されたフォントをテキストエディタに適用する
@@ -1903,7 +2742,16 @@ class DiaryApp(QMainWindow):
     def search_entries(self):
         """
         クイック検索ダイアログを表示する
+        入力が止まってから QUICK_SEARCH_DELAY_MS たつと検索し、結果を関連度の高い順に少しずつ一覧に追加する
+        （検索中に入力が変わった場合は、前の検索を打ち切る）
         """
+        # 索引の読み込み前に開くと、全文索引をUIスレッドで作ることになるため待ってもらう
+        if not self.index_ready:
+            self.statusBar().showMessage("日記の索引を読み込み中です。しばらくしてからもう一度お試しください。", 3000)
+            return
+        
+        from diary_query import IncrementalSearch
+        
         # 検索ダイアログの作成
         search_dialog = QDialog(self)
         search_dialog.setWindowTitle("クイック検索")
@@ -1914,16 +2762,15 @@ class DiaryApp(QMainWindow):
         # 検索ボックス
         layout.addWidget(QLabel("検索キーワード:"))
         keyword_edit = QLineEdit()
-        keyword_edit.setPlaceholderText("検索キーワードを入力...")
+        keyword_edit.setPlaceholderText("入力すると検索します...")
         layout.addWidget(keyword_edit)
         
-        # 検索ボタン
-        search_button = QPushButton("検索")
-        layout.addWidget(search_button)
-        
         # 結果リスト
-        layout.addWidget(QLabel("検索結果:"))
+        result_label = QLabel("検索結果:")
+        layout.addWidget(result_label)
         result_list = QListWidget()
+        result_delegate = SearchResultDelegate(self.store, [], result_list)
+        result_list.setItemDelegate(result_delegate)
         layout.addWidget(result_list)
         
         # 閉じるボタン
@@ -1931,68 +2778,63 @@ class DiaryApp(QMainWindow):
         close_button.clicked.connect(search_dialog.accept)
         layout.addWidget(close_button)
         
+        incremental_search = IncrementalSearch(self.store)
+        # 実行中の検索（IncrementalSearch.run() のジェネレータ）
+        state = {"search": None, "count": 0}
+        
+        # 入力が止まるまで待つタイマーと、実行中の検索を少しずつ進めるタイマー
+        delay_timer = QTimer(search_dialog)
+        delay_timer.setSingleShot(True)
+        delay_timer.setInterval(QUICK_SEARCH_DELAY_MS)
+        step_timer = QTimer(search_dialog)
+        step_timer.setInterval(0)
+        
+        def cancel_search():
+            step_timer.stop()
+            if state["search"] is not None:
+                state["search"].close()
+                state["search"] = None
+        
         # 検索実行関数
         def perform_search():
-            keyword = keyword_edit.text().strip().lower()
+            delay_timer.stop()
+            cancel_search()
+            result_list.clear()
+            
+            keyword = keyword_edit.text().strip()
             if not keyword:
+                result_label.setText("検索結果:")
                 return
-                
-            result_list.clear()
-            matching_entries = []
             
-            # 全ての日記ファイルを検索
-            for file_name in os.listdir(self.diary_folder):
-                if file_name.endswith('.json') and file_name != "metadata.json":
-                    file_path = os.path.join(self.diary_folder, file_name)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            
-                            # 日付部分を抽出
-                            file_key = file_name[:-5]  # .jsonを除去
-                            date_str = ""
-                            
-                            # 新しいファイル命名形式 (yyyy-MM-dd_title-slug.json)
-                            if '_' in file_key:
-                                date_str = file_key.split('_')[0]
-                            else:
-                                # 旧形式 (yyyy-MM-dd.json)
-                                date_str = file_key
-                                
-                            # 有効な日付かチェック
-                            date = QDate.fromString(date_str, 'yyyy-MM-dd')
-                            if not date.isValid():
-                                continue
-                                
-                            title = data.get("title", "無題")
-                            content = self.html_to_plain(data.get("content", ""))
-                            tags = ", ".join(data.get("tags", []))
-                            
-                            # キーワードが含まれているかチェック
-                            if (keyword in title.lower() or 
-                                keyword in content.lower() or 
-                                keyword in tags.lower()):
-                                matching_entries.append({
-                                    "date": date,
-                                    "title": title,
-                                    "date_str": date_str
-                                })
-                    except:
-                        continue
-            
-            # 日付で降順にソート
-            matching_entries.sort(key=lambda x: x["date"], reverse=True)
+            # 索引からキーワードが含まれる日記を検索し、関連度の高い順に並べる
+            result_delegate.set_keywords([keyword])
+            result_label.setText("検索中...")
+            state["search"] = incremental_search.run(keyword)
+            state["count"] = 0
+            step_timer.start()
+        
+        # 検索を1段階進め、結果があれば一覧に追加する
+        def continue_search():
+            try:
+                batch = next(state["search"])
+            except StopIteration:
+                cancel_search()
+                if state["count"]:
+                    result_label.setText(f"検索結果: {state['count']}件")
+                else:
+                    result_label.setText("検索結果:")
+                    result_list.addItem("検索結果がありません")
+                return
             
-            if matching_entries:
-                # 結果リストに追加
-                for entry in matching_entries:
-                    display_date = entry["date"].toString('yyyy/MM/dd')
-                    item = QListWidgetItem(f"{display_date}: {entry['title']}")
-                    item.setData(Qt.UserRole, {"date_str": entry["date_str"], "title": entry["title"]})
-                    result_list.addItem(item)
-            else:
-                result_list.addItem("検索結果がありません")
+            for entry in batch:
+                display_date = QDate.fromString(entry["date"], 'yyyy-MM-dd').toString('yyyy/MM/dd')
+                item = QListWidgetItem(f"{display_date}: {entry['title']}")
+                item.setData(Qt.UserRole, {"date_str": entry["date"], "title": entry["title"],
+                                           "file_key": entry["file_key"]})
+                result_list.addItem(item)
+            state["count"] += len(batch)
+            if batch:
+                result_label.setText(f"検索結果: {state['count']}件...")
         
         # 検索結果アイテムがダブルクリックされた時の処理
         def open_search_result(item):
@@ -2014,13 +2856,157 @@ class DiaryApp(QMainWindow):
             QTimer.singleShot(100, lambda: self.select_diary_by_title(title))
         
         # イベント接続
-        search_button.clicked.connect(perform_search)
+        keyword_edit.textChanged.connect(lambda: delay_timer.start())
         keyword_edit.returnPressed.connect(perform_search)
+        delay_timer.timeout.connect(perform_search)
+        step_timer.timeout.connect(continue_search)
         result_list.itemDoubleClicked.connect(open_search_result)
+        search_dialog.finished.connect(cancel_search)
         
         # ダイアログを表示
         search_dialog.exec_()
     
+    def show_go_to_entry(self):
+        """
+        日付・タイトル・タグのあいまい検索で日記を選んで開くダイアログ（「日記へ移動」）
+        入力のたびに候補を更新し、Enter またはダブルクリックで選んだ日記を開く
+        """
+        if not self.index_ready:
+            self.statusBar().showMessage("日記の索引を読み込み中です。しばらくしてからもう一度お試しください。", 3000)
+            return
+        
+        palette_dialog = QDialog(self)
+        palette_dialog.setWindowTitle("日記へ移動")
+        palette_dialog.setMinimumSize(500, 400)
+        
+        layout = QVBoxLayout(palette_dialog)
+        palette_edit = QLineEdit()
+        palette_edit.setPlaceholderText("日付・タイトル・タグの一部を入力（例: 2024-05 旅行）")
+        layout.addWidget(palette_edit)
+        candidate_list = QListWidget()
+        layout.addWidget(candidate_list)
+        
+        def update_candidates():
+            candidate_list.clear()
+            for record in self.store.find_entries(palette_edit.text()):
+                item = QListWidgetItem(f"{format_jp_date(record['date'])}  {record['title'] or '無題'}")
+                if record["tags"]:
+                    item.setToolTip("タグ: " + ", ".join(record["tags"]))
+                item.setData(Qt.UserRole, record["file_key"])
+                candidate_list.addItem(item)
+            candidate_list.setCurrentRow(0)
+        
+        def open_candidate():
+            item = candidate_list.currentItem()
+            if item is None:
+                return
+            palette_dialog.accept()
+            self.open_entry_by_key(item.data(Qt.UserRole))
+        
+        def move_selection(step):
+            if candidate_list.count():
+                candidate_list.setCurrentRow((candidate_list.currentRow() + step) % candidate_list.count())
+        
+        # 入力欄にフォーカスを置いたまま、上下キーで候補を選べるようにする
+        for key, step in (("Up", -1), ("Down", 1)):
+            move_action = QAction(palette_edit)
+            move_action.setShortcut(key)
+            move_action.setShortcutContext(Qt.WidgetShortcut)
+            move_action.triggered.connect(lambda checked=False, step=step: move_selection(step))
+            palette_edit.addAction(move_action)
+        
+        palette_edit.textChanged.connect(update_candidates)
+        palette_edit.returnPressed.connect(open_candidate)
+        candidate_list.itemDoubleClicked.connect(lambda item: open_candidate())
+        
+        # 入力する前は新しい日記を表示する
+        update_candidates()
+        palette_dialog.exec_()
+    
+    def show_entry_history(self):
+        """
+        開いている日記の過去の版を一覧し、選んだ版に戻すダイアログ
+        """
+        if self.current_file_key is None:
+            QMessageBox.information(self, "過去の版", "日記を開いてから過去の版を表示してください。")
+            return
+        
+        file_key = self.current_file_key
+        versions = self.store.entry_versions(file_key)
+        if not versions:
+            QMessageBox.information(self, "過去の版", "この日記にはまだ過去の版がありません。")
+            return
+        
+        history_dialog = QDialog(self)
+        history_dialog.setWindowTitle("過去の版")
+        history_dialog.setMinimumSize(700, 500)
+        
+        layout = QVBoxLayout(history_dialog)
+        layout.addWidget(QLabel(f"<h2>過去の版 ({len(versions)}版)</h2>"))
+        
+        splitter = QSplitter(Qt.Horizontal)
+        
+        # 版の一覧（新しい順）
+        version_list = QListWidget()
+        for index, version in enumerate(versions):
+            item = QListWidgetItem(f"{version['last_modified']}  {version['title'] or '無題'}  (版 {version['revision']})")
+            item.setData(Qt.UserRole, index)
+            version_list.addItem(item)
+        splitter.addWidget(version_list)
+        
+        # 選んだ版の内容
+        preview = QTextEdit()
+        preview.setReadOnly(True)
+        splitter.addWidget(preview)
+        splitter.setSizes([250, 450])
+        layout.addWidget(splitter)
+        
+        def show_version():
+            item = version_list.currentItem()
+            if item is None:
+                return
+            version = self.store.entry_version(file_key, item.data(Qt.UserRole))
+            preview.setHtml(self.convert_image_paths_to_absolute(version["content"]))
+        
+        version_list.currentItemChanged.connect(show_version)
+        
+        # ボタン
+        button_layout = QHBoxLayout()
+        restore_button = QPushButton("この版に戻す")
+        close_button = QPushButton("閉じる")
+        button_layout.addStretch()
+        button_layout.addWidget(restore_button)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        
+        def restore_version():
+            item = version_list.currentItem()
+            if item is None:
+                return
+            if self.text_edit.document().isModified():
+                reply = QMessageBox.question(history_dialog,
+                                             '確認',
+                                             '未保存の変更があります。変更を破棄してこの版に戻しますか？',
+                                             QMessageBox.Yes | QMessageBox.No)
+                if reply != QMessageBox.Yes:
+                    return
+            
+            try:
+                self.store.restore_version(file_key, item.data(Qt.UserRole))
+            except (OSError, TimeoutError) as e:
+                QMessageBox.critical(history_dialog, "エラー", f"過去の版に戻せませんでした: {e}")
+                return
+            history_dialog.accept()
+            if self.current_file_key == file_key:
+                self.reload_open_entry()
+            self.statusBar().showMessage("日記を過去の版に戻しました（戻す前の内容も過去の版に残っています）", 5000)
+        
+        restore_button.clicked.connect(restore_version)
+        close_button.clicked.connect(history_dialog.reject)
+        
+        version_list.setCurrentRow(0)
+        history_dialog.exec_()
+    
     def show_advanced_search(self):
         """
         詳細検索ダイアログを表示する
@@ -2032,6 +3018,22 @@ class DiaryApp(QMainWindow):
         
         layout = QVBoxLayout(search_dialog)
         
+        # 検索式（入力した場合は、下の検索条件の代わりに使う）
+        query_layout = QHBoxLayout()
+        query_layout.addWidget(QLabel("検索式:"))
+        query_edit = QLineEdit()
+        query_edit.setPlaceholderText('例: tag:旅行 mood:楽しい after:2024-01 "海の家" -雨 海 OR 山')
+        query_edit.setToolTip("入力した場合は、下の検索条件の代わりに検索式で検索します。\n"
+                              "tag: mood: title: after: before: date: days: is:favorite、- で除外、OR でいずれか")
+        query_layout.addWidget(query_edit)
+        explain_button = QPushButton("実行計画")
+        explain_button.setToolTip("検索式の実行計画（使った索引と件数・時間）を表示します")
+        query_layout.addWidget(explain_button)
+        save_query_button = QPushButton("保存")
+        save_query_button.setToolTip("検索式に名前を付けて保存し、左側の「保存した検索」から開けるようにします")
+        query_layout.addWidget(save_query_button)
+        layout.addLayout(query_layout)
+        
         # 検索条件グループ
         search_group = QWidget()
         search_layout = QGridLayout(search_group)
@@ -2081,6 +3083,17 @@ class DiaryApp(QMainWindow):
         exact_match_check = QCheckBox("完全一致")
         search_layout.addWidget(exact_match_check, 3, 3)
         
+        regex_check = QCheckBox("正規表現")
+        regex_check.setToolTip("キーワードを正規表現として検索します（完全一致は使いません）")
+        search_layout.addWidget(regex_check, 4, 1)
+        regex_check.toggled.connect(lambda checked: exact_match_check.setEnabled(not checked))
+        
+        fold_check = QCheckBox("かな・全角/半角を区別しない")
+        fold_check.setToolTip("ひらがなとカタカナ、全角と半角の違いを無視して検索します")
+        fold_check.setChecked(True)
+        search_layout.addWidget(fold_check, 4, 2, 1, 2)
+        case_sensitive_check.toggled.connect(lambda checked: fold_check.setEnabled(not checked))
+        
         layout.addWidget(search_group)
         
         # 検索ボタン
@@ -2090,6 +3103,8 @@ class DiaryApp(QMainWindow):
         # 結果リスト
         layout.addWidget(QLabel("検索結果:"))
         result_list = QListWidget()
+        result_delegate = SearchResultDelegate(self.store, [], result_list)
+        result_list.setItemDelegate(result_delegate)
         layout.addWidget(result_list)
         
         # 閉じるボタン
@@ -2108,98 +3123,77 @@ class DiaryApp(QMainWindow):
             title_only = title_only_check.isChecked()
             case_sensitive = case_sensitive_check.isChecked()
             exact_match = exact_match_check.isChecked()
+            fold = fold_check.isChecked()
             
             result_list.clear()
-            matching_entries = []
             
-            # キーワード処理
-            if not case_sensitive and keyword:
-                keyword = keyword.lower()
-            
-            # 全ての日記ファイルを検索
-            for file_name in os.listdir(self.diary_folder):
-                if file_name.endswith('.json') and file_name != "metadata.json":
-                    file_path = os.path.join(self.diary_folder, file_name)
-                    
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            
-                            # 日付部分を抽出
-                            file_key = file_name[:-5]  # .jsonを除去
-                            date_str = ""
-                            
-                            # 新しいファイル命名形式 (yyyy-MM-dd_title-slug.json)
-                            if '_' in file_key:
-                                date_str = file_key.split('_')[0]
-                            else:
-                                # 旧形式 (yyyy-MM-dd.json)
-                                date_str = file_key
-                            
-                            # 有効な日付かチェック
-                            date = QDate.fromString(date_str, 'yyyy-MM-dd')
-                            if not date.isValid():
-                                continue
-                            
-                            # 日付範囲チェック
-                            if date < from_date or date > to_date:
-                                continue
-                            
-                            title = data.get("title", "無題")
-                            content = self.html_to_plain(data.get("content", ""))
-                            tags = data.get("tags", [])
-                            mood = data.get("mood", "")
-                            
-                            # タグフィルター
-                            if selected_tag != "すべて" and selected_tag not in tags:
-                                continue
-                            
-                            # 気分フィルター
-                            if selected_mood != "すべて" and selected_mood != mood:
-                                continue
-                            
-                            # キーワード検索
-                            if keyword:
-                                # 検索対象の文字列
-                                if title_only:
-                                    search_text = title
-                                else:
-                                    search_text = f"{title} {content} {' '.join(tags)}"
-                                
-                                if not case_sensitive:
-                                    search_text = search_text.lower()
-                                
-                                # 検索方法
-                                if exact_match:
-                                    if keyword not in search_text.split():
-                                        continue
-                                else:
-                                    if keyword not in search_text:
-                                        continue
-                            
-                            # 条件に一致
-                            matching_entries.append({
-                                "date": date,
-                                "title": title,
-                                "date_str": date_str
-                            })
-                    except:
-                        continue
-            
-            # 日付で降順にソート
-            matching_entries.sort(key=lambda x: x["date"], reverse=True)
+            # 索引から条件に一致する日記を検索（キーワードがある場合は関連度の高い順、ない場合は日付の新しい順）
+            regex_spans = {}
+            limited = False
+            if query_edit.text().strip():
+                from diary_query import parse_query, query_keywords
+                
+                try:
+                    keywords = query_keywords(parse_query(query_edit.text(), case_sensitive))
+                    matching_entries = self.store.query(query_edit.text(), case_sensitive=case_sensitive, fold=fold)
+                except ValueError as e:
+                    QMessageBox.warning(search_dialog, "検索式", str(e))
+                    return
+            elif regex_check.isChecked() and keyword:
+                # 正規表現は別のプロセスで調べる（日付の新しい順、件数と時間に上限あり）
+                QApplication.setOverrideCursor(Qt.WaitCursor)
+                try:
+                    result = self.store.regex_search(
+                        keyword,
+                        date_from=from_date.toString('yyyy-MM-dd'),
+                        date_to=to_date.toString('yyyy-MM-dd'),
+                        tag=None if selected_tag == "すべて" else selected_tag,
+                        mood=None if selected_mood == "すべて" else selected_mood,
+                        title_only=title_only,
+                        case_sensitive=case_sensitive)
+                except ValueError as e:
+                    QMessageBox.warning(search_dialog, "正規表現", str(e))
+                    return
+                finally:
+                    QApplication.restoreOverrideCursor()
+                keywords = []
+                matching_entries = [record for record, _ in result["matches"]]
+                regex_spans = {record["file_key"]: spans for record, spans in result["matches"]}
+                limited = result["limited"]
+                if result["timed_out"]:
+                    QMessageBox.warning(search_dialog, "正規表現",
+                                        "制限時間を過ぎたため検索を打ち切りました。"
+                                        f"それまでに見つかった{len(matching_entries)}件を表示します。")
+            else:
+                keywords = [keyword] if keyword else []
+                matching_entries = self.store.advanced_search(
+                    keyword,
+                    date_from=from_date.toString('yyyy-MM-dd'),
+                    date_to=to_date.toString('yyyy-MM-dd'),
+                    tag=None if selected_tag == "すべて" else selected_tag,
+                    mood=None if selected_mood == "すべて" else selected_mood,
+                    title_only=title_only,
+                    case_sensitive=case_sensitive,
+                    exact_match=exact_match,
+                    fold=fold)
+                matching_entries = self.store.rank_entries(matching_entries, keywords)
+            result_delegate.set_keywords(keywords, regex_spans)
             
             if matching_entries:
                 # 結果リストに追加
                 for entry in matching_entries:
-                    display_date = entry["date"].toString('yyyy/MM/dd')
+                    display_date = QDate.fromString(entry["date"], 'yyyy-MM-dd').toString('yyyy/MM/dd')
                     item = QListWidgetItem(f"{display_date}: {entry['title']}")
-                    item.setData(Qt.UserRole, {"date_str": entry["date_str"], "title": entry["title"]})
+                    item.setData(Qt.UserRole, {"date_str": entry["date"], "title": entry["title"],
+                                               "file_key": entry["file_key"]})
                     result_list.addItem(item)
                 
                 # 結果数を表示
                 result_count = len(matching_entries)
-                result_list.insertItem(0, f"-- 検索結果: {result_count}件 --")
+                if limited:
+                    result_list.insertItem(0, f"-- 検索結果: {result_count}件（上限に達したため打ち切り） --")
+                else:
+                    result_list.insertItem(0, f"-- 検索結果: {result_count}件 --")
             else:
                 result_list.addItem("検索結果がありません")
         
@@ -2227,8 +3221,61 @@ class DiaryApp(QMainWindow):
             # 少し遅延を入れて確実に日付選択処理が完了してから実行
             QTimer.singleShot(100, lambda: self.select_diary_by_title(title))
         
+        # 検索式の実行計画を表示する
+        def show_plan():
+            if not query_edit.text().strip():
+                QMessageBox.information(search_dialog, "実行計画", "検索式を入力してください。")
+                return
+            try:
+                plan = self.store.explain(query_edit.text(), case_sensitive=case_sensitive_check.isChecked(),
+                                          fold=fold_check.isChecked())
+            except ValueError as e:
+                QMessageBox.warning(search_dialog, "検索式", str(e))
+                return
+            
+            plan_dialog = QDialog(search_dialog)
+            plan_dialog.setWindowTitle("実行計画")
+            plan_dialog.setMinimumSize(600, 300)
+            plan_layout = QVBoxLayout(plan_dialog)
+            plan_text = QTextEdit()
+            plan_text.setReadOnly(True)
+            plan_text.setFont(QFont("Monospace"))
+            plan_text.setPlainText(plan)
+            plan_layout.addWidget(plan_text)
+            plan_close_button = QPushButton("閉じる")
+            plan_close_button.clicked.connect(plan_dialog.accept)
+            plan_layout.addWidget(plan_close_button)
+            plan_dialog.exec_()
+        
+        # 検索式に名前を付けて保存する
+        def save_query():
+            text = query_edit.text().strip()
+            if not text:
+                QMessageBox.information(search_dialog, "検索の保存", "保存する検索式を入力してください。")
+                return
+            name, ok = QInputDialog.getText(search_dialog, "検索の保存", "名前:", text=text)
+            name = name.strip()
+            if not ok or not name:
+                return
+            if any(search["name"] == name for search in self.store.saved_searches()):
+                reply = QMessageBox.question(search_dialog, '確認', f"保存した検索 '{name}' を置き換えますか？",
+                                             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+                if reply != QMessageBox.Yes:
+                    return
+            try:
+                count = self.store.save_search(name, text, case_sensitive=case_sensitive_check.isChecked(),
+                                               fold=fold_check.isChecked())
+            except ValueError as e:
+                QMessageBox.warning(search_dialog, "検索式", str(e))
+                return
+            self.update_saved_search_list()
+            self.statusBar().showMessage(f"検索を保存しました: {name}（{count}件）", 5000)
+        
         # イベント接続
         search_button.clicked.connect(perform_search)
+        query_edit.returnPressed.connect(perform_search)
+        explain_button.clicked.connect(show_plan)
+        save_query_button.clicked.connect(save_query)
         result_list.itemDoubleClicked.connect(open_search_result)
         
         # ダイアログを表示
@@ -2241,52 +3288,10 @@ class DiaryApp(QMainWindow):
         current_month = self.calendar.selectedDate().toString('yyyy-MM')
         
         # データ収集
-        diary_count = 0
-        mood_counts = {}
-        tag_counts = {}
-        
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                
-                try:
-                    # 日付チェック
-                    file_key = file_name[:-5]  # .jsonを除去
-                    date_str = ""
-                    
-                    # 新しいファイル命名形式 (yyyy-MM-dd_title-slug.json)
-                    if '_' in file_key:
-                        date_str = file_key.split('_')[0]
-                    else:
-                        # 旧形式 (yyyy-MM-dd.json)
-                        date_str = file_key
-                    
-                    # 月が一致するかチェック
-                    if not date_str.startswith(current_month):
-                        continue
-                    
-                    # ファイルを読み込む
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                        # 日記数をカウント
-                        diary_count += 1
-                        
-                        # 気分をカウント
-                        mood = data.get("mood", "不明")
-                        if mood in mood_counts:
-                            mood_counts[mood] += 1
-                        else:
-                            mood_counts[mood] = 1
-                        
-                        # タグをカウント
-                        for tag in data.get("tags", []):
-                            if tag in tag_counts:
-                                tag_counts[tag] += 1
-                            else:
-                                tag_counts[tag] = 1
-                except:
-                    continue
+        stats = self.store.month_stats(current_month)
+        diary_count = stats["count"]
+        mood_counts = stats["moods"]
+        tag_counts = stats["tags"]
         
         # 統計ダイアログの作成
         stats_dialog = QDialog(self)
@@ -2340,58 +3345,11 @@ class DiaryApp(QMainWindow):
         current_year = self.calendar.selectedDate().toString('yyyy')
         
         # データ収集
-        diary_count = 0
-        month_counts = {f"{current_year}-{str(month).zfill(2)}": 0 for month in range(1, 13)}
-        mood_counts = {}
-        tag_counts = {}
-        
-        for file_name in os.listdir(self.diary_folder):
-            if file_name.endswith('.json') and file_name != "metadata.json":
-                file_path = os.path.join(self.diary_folder, file_name)
-                
-                try:
-                    # 日付チェック
-                    file_key = file_name[:-5]  # .jsonを除去
-                    date_str = ""
-                    
-                    # 新しいファイル命名形式 (yyyy-MM-dd_title-slug.json)
-                    if '_' in file_key:
-                        date_str = file_key.split('_')[0]
-                    else:
-                        # 旧形式 (yyyy-MM-dd.json)
-                        date_str = file_key
-                    
-                    # 年が一致するかチェック
-                    if not date_str.startswith(current_year):
-                        continue
-                    
-                    # ファイルを読み込む
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                        # 日記数をカウント
-                        diary_count += 1
-                        
-                        # 月別カウント
-                        month_str = date_str[:7]  # yyyy-MM
-                        if month_str in month_counts:
-                            month_counts[month_str] += 1
-                        
-                        # 気分をカウント
-                        mood = data.get("mood", "不明")
-                        if mood in mood_counts:
-                            mood_counts[mood] += 1
-                        else:
-                            mood_counts[mood] = 1
-                        
-                        # タグをカウント
-                        for tag in data.get("tags", []):
-                            if tag in tag_counts:
-                                tag_counts[tag] += 1
-                            else:
-                                tag_counts[tag] = 1
-                except:
-                    continue
+        stats = self.store.year_stats(current_year)
+        diary_count = stats["count"]
+        month_counts = stats["months"]
+        mood_counts = stats["moods"]
+        tag_counts = stats["tags"]
         
         # 統計ダイアログの作成
         stats_dialog = QDialog(self)
@@ -2479,8 +3437,7 @@ class DiaryApp(QMainWindow):
         """
         メタデータをJSONファイルに保存する
         """
-        with open(self.metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=4)
+        self.store.save_metadata()
     
     def change_theme(self, theme):
         """
@@ -2548,6 +3505,7 @@ class DiaryApp(QMainWindow):
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
+    startup_trace("QApplicationの作成")
     window = DiaryApp()
     window.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+エクスポート（export_static_site など）の回帰テスト
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diary_core import DiaryStore, bulk_export_zip, export_static_site  # noqa: E402
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.root = self._temp_dir.name
+        self.diary_folder = os.path.join(self.root, "diary")
+        self.store = DiaryStore(self.diary_folder)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def write_entry_file(self, file_key, data):
+        with open(os.path.join(self.diary_folder, f"{file_key}.json"), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def read_output(self, output_dir, page_path):
+        with open(os.path.join(output_dir, *page_path.split('/')), 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+class BulkExportZipTest(ExportTestCase):
+
+    def test_titles_are_escaped(self):
+        file_key = self.store.save_entry("2024-03-01", "A & B <b>", "<p>x</p>", "普通", [])
+        zip_path = os.path.join(self.root, "export.zip")
+
+        bulk_export_zip(self.diary_folder, zip_path)
+
+        with zipfile.ZipFile(zip_path) as zipf:
+            index_html = zipf.read("index.html").decode('utf-8')
+            entry_html = zipf.read(f"entries/{file_key}.html").decode('utf-8')
+        for page in (index_html, entry_html):
+            self.assertIn("A &amp; B &lt;b&gt;", page)
+            self.assertNotIn("<b>", page)
+
+
+class StaticSiteTest(ExportTestCase):
+
+    def test_invalid_dates_fall_back_to_file_key(self):
+        self.store.save_entry("2024-03-01", "正しい日付", "<p>x</p>", "普通", [])
+        self.write_entry_file("2024-03-02_空", {"date": "", "title": "空の日付", "content": "<p>a</p>"})
+        self.write_entry_file("2024-03-05_形式", {"date": "2024-3-5", "title": "形式違い", "content": "<p>b</p>"})
+        output_dir = os.path.join(self.root, "site")
+
+        export_static_site(self.diary_folder, output_dir, max_workers=1)
+
+        month_page = self.read_output(output_dir, "2024/03/index.html")
+        self.assertIn("空の日付", month_page)
+        self.assertIn("形式違い", month_page)
+        self.assertFalse(os.path.exists(os.path.join(output_dir, "undated")))
+
+    def test_entries_without_any_date_are_listed_separately(self):
+        self.write_entry_file("メモ", {"title": "日付なし", "content": "<p>c</p>", "tags": ["覚え書き"]})
+        output_dir = os.path.join(self.root, "site")
+
+        export_static_site(self.diary_folder, output_dir, max_workers=1)
+
+        self.assertIn("undated/index.html", self.read_output(output_dir, "index.html"))
+        self.assertIn("日付なし", self.read_output(output_dir, "undated/index.html"))
+        self.assertIn("../undated/index.html", self.read_output(output_dir, "entries/メモ.html"))
+        self.assertIn("日付なし", self.read_output(output_dir, "tags/覚え書き.html"))
+        self.assertEqual(sorted(name for name in os.listdir(output_dir) if not name.startswith(".")),
+                         ["entries", "index.html", "tags", "undated"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,283 @@
+"""
+インポート（import_jsonl・bulk_import）の回帰テスト
+"""
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import diary_core  # noqa: E402
+from diary_core import DiaryStore  # noqa: E402
+
+
+class ImportTestCase(unittest.TestCase):
+    """
+    一時フォルダの中に日記フォルダを作り、その外に書き込まれていないことも確かめる
+    """
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.root = self._temp_dir.name
+        self.diary_folder = os.path.join(self.root, "diary")
+        self.store = DiaryStore(self.diary_folder)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def write_file(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def write_jsonl(self, name, records):
+        return self.write_file(name, "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    def export_jsonl(self):
+        output = io.StringIO()
+        self.store.export_jsonl(output)
+        return self.write_file("export.jsonl", output.getvalue())
+
+    def root_files(self):
+        return sorted(name for name in os.listdir(self.root) if name != "diary")
+
+
+class ImportJsonlTest(ImportTestCase):
+
+    def test_round_trip_skips_unchanged_entries(self):
+        self.store.save_entry("2024-01-02", "散歩", "<p>公園まで歩いた</p>", "良い", ["外出"])
+        self.store.save_entry("2024-01-03", "", "<p>タイトルなし</p>", "普通", [])
+        path = self.export_jsonl()
+
+        result = self.store.import_jsonl(path)
+
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["imported"], 0)
+        self.assertEqual(result["skipped"], 2)
+
+    def test_round_trip_into_empty_folder(self):
+        self.store.save_entry("2024-01-03", "", "<p>タイトルなし</p>", "普通", ["メモ"])
+        path = self.export_jsonl()
+        other = DiaryStore(os.path.join(self.root, "other"))
+
+        self.assertEqual(other.import_jsonl(path), {"imported": 1, "skipped": 0, "errors": 0})
+        self.assertEqual(other.import_jsonl(path), {"imported": 0, "skipped": 1, "errors": 0})
+        entry = other.read_entry(other.entries_on_date("2024-01-03")[0]["file_key"])
+        self.assertEqual(entry["title"], "無題")
+        self.assertIn("メモ", other.metadata["tags"])
+
+    def test_rejects_invalid_dates(self):
+        path = self.write_jsonl("bad.jsonl", [
+            {"date": "../../escaped", "title": "pwn"},
+            {"date": "2024-13-01", "title": "月がない"},
+            {"date": 20240101, "title": "数値"},
+            {"date": None, "title": "空"},
+        ])
+
+        result = self.store.import_jsonl(path)
+
+        self.assertEqual(result, {"imported": 0, "skipped": 0, "errors": 4})
+        self.assertEqual(self.root_files(), ["bad.jsonl"])
+        self.assertEqual(self.store.entries(), [])
+
+    def test_rejects_malformed_fields(self):
+        path = self.write_jsonl("fields.jsonl", [
+            {"date": "2024-01-04", "title": 5},
+            {"date": "2024-01-04", "title": "本文", "content": ["<p>x</p>"]},
+            {"date": "2024-01-04", "title": "タグ", "tags": "旅行"},
+            ["2024-01-04"],
+            {"date": "2024-01-04", "title": "正しい行"},
+        ])
+
+        result = self.store.import_jsonl(path)
+
+        self.assertEqual(result, {"imported": 1, "skipped": 0, "errors": 4})
+
+    def test_non_string_id_gets_new_file_key(self):
+        path = self.write_jsonl("ids.jsonl", [
+            {"id": 5, "date": "2024-01-04", "title": "数値のID"},
+            {"id": "../2024-01-04_x", "date": "2024-01-04", "title": "パスのID"},
+        ])
+
+        result = self.store.import_jsonl(path)
+
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(len(self.store.entries_on_date("2024-01-04")), 2)
+        self.assertEqual(len(self.store.entries()), 2)
+        self.assertEqual(self.root_files(), ["ids.jsonl"])
+
+    def test_overwrite_raises_revision(self):
+        file_key = self.store.save_entry("2024-01-05", "書き直し", "<p>元の内容</p>", "普通", [])
+        self.store.save_entry("2024-01-05", "書き直し", "<p>二回目</p>", "普通", [])
+        path = self.write_jsonl("changed.jsonl", [
+            {"id": file_key, "date": "2024-01-05", "title": "書き直し", "content": "<p>インポート</p>"},
+        ])
+
+        self.assertEqual(self.store.import_jsonl(path)["imported"], 1)
+
+        entry = self.store.read_entry(file_key)
+        self.assertEqual(entry["content"], "<p>インポート</p>")
+        self.assertEqual(entry["revision"], 3)
+
+    def test_overwrite_keeps_previous_version(self):
+        file_key = self.store.save_entry("2024-01-05", "書き直し", "<p>元の内容</p>", "普通", [])
+        path = self.write_jsonl("changed.jsonl", [
+            {"id": file_key, "date": "2024-01-05", "title": "書き直し", "content": "<p>インポート</p>"},
+        ])
+
+        self.store.import_jsonl(path)
+
+        versions = self.store.entry_versions(file_key)
+        self.assertEqual(len(versions), 1)
+        self.assertEqual(self.store.entry_version(file_key, 0)["content"], "<p>元の内容</p>")
+
+    def test_change_log_records_only_imported_changes(self):
+        self.store.entries()
+        DiaryStore(self.diary_folder).save_entry("2024-01-07", "別のインスタンス", "<p>先に保存</p>", "普通", [])
+        cursor = self.store.changes_cursor()
+        path = self.write_jsonl("log.jsonl", [
+            {"id": "2024-01-08_インポート", "date": "2024-01-08", "title": "インポート", "tags": ["新しいタグ"],
+             "favorite": True},
+        ])
+
+        self.store.import_jsonl(path)
+
+        events, _ = self.store.changes_since(cursor)
+        self.assertEqual([(event["op"], event.get("file_key") or event.get("tag")) for event in events], [
+            ("entry_created", "2024-01-08_インポート"),
+            ("favorite_added", "2024-01-08_インポート"),
+            ("tag_added", "新しいタグ"),
+        ])
+
+
+class WriteImportedEntriesTest(ImportTestCase):
+
+    def test_new_entry_does_not_replace_file_created_meanwhile(self):
+        file_key = self.store.save_entry("2024-01-06", "予定", "<p>他のインスタンス</p>", "普通", [])
+        data = {"date": "2024-01-06", "title": "予定", "content": "<p>インポート</p>", "mood": "普通", "tags": []}
+
+        written = self.store.write_imported_entries([(file_key, data, False)])
+
+        self.assertNotEqual(written, [file_key])
+        self.assertEqual(self.store.read_entry(file_key)["content"], "<p>他のインスタンス</p>")
+        self.assertEqual(self.store.read_entry(written[0])["content"], "<p>インポート</p>")
+
+
+class BulkImportTest(ImportTestCase):
+
+    def test_skips_entries_already_in_folder(self):
+        self.store.save_entry("2024-02-01", "既存", "<p>もうある</p>", "普通", ["旅行"])
+        path = self.export_jsonl()
+        with open(path, 'a', encoding='utf-8') as f:
+            new_record = {"date": "2024-02-02", "title": "新規", "content": "<p>新しい</p>"}
+            f.write(json.dumps(new_record, ensure_ascii=False) + "\n")
+            f.write(json.dumps(new_record, ensure_ascii=False) + "\n")
+
+        result = self.store.bulk_import([path])
+
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(result["duplicates"], 2)
+        self.assertEqual([record["file_key"] for record in self.store.entries()],
+                         ["2024-02-01_既存", "2024-02-02_新規"])
+
+    def test_existing_file_key_is_not_overwritten(self):
+        self.store.save_entry("2024-02-01", "同じ名前", "<p>元の内容</p>", "普通", [])
+        path = self.write_jsonl("same-id.jsonl", [
+            {"id": "2024-02-01_同じ名前", "date": "2024-02-01", "title": "同じ名前", "content": "<p>別の内容</p>"},
+        ])
+
+        result = self.store.bulk_import([path])
+
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(self.store.read_entry("2024-02-01_同じ名前")["content"], "<p>元の内容</p>")
+        self.assertEqual(len(self.store.entries_on_date("2024-02-01")), 2)
+
+    def test_round_trip_from_export(self):
+        self.store.save_entry("2024-05-01", "区切り", "<p>行\u2028段落\u2029改行\x85終わり</p>", "普通", ["タグ"])
+        self.store.save_entry("2024-05-02", "普通の日記", "<p>本文</p>", "良い", [])
+        path = self.export_jsonl()
+        other = DiaryStore(os.path.join(self.root, "other"))
+
+        result = other.bulk_import([path])
+
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(other.read_entry("2024-05-01_区切り")["content"], "<p>行\u2028段落\u2029改行\x85終わり</p>")
+        self.assertEqual(other.bulk_import([path])["duplicates"], 2)
+        self.assertEqual(self.store.bulk_import([path])["duplicates"], 2)
+
+    def test_bad_lines_do_not_drop_other_entries(self):
+        records = [{"date": "2024-04-%02d" % day, "title": f"日記{day}"} for day in range(1, 10)]
+        text = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records[:5])
+        text += "[1, 2]\n{壊れた行\n"
+        text += "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records[5:])
+        path = self.write_file("partly-broken.jsonl", text)
+
+        result = self.store.bulk_import([path])
+
+        self.assertEqual(result["errors"], 2)
+        self.assertEqual(result["imported"], 9)
+
+    def test_rejects_malformed_fields(self):
+        path = self.write_jsonl("fields.jsonl", [
+            {"date": "2024-04-01", "title": "本文なし", "content": None},
+            {"date": "2024-04-01", "title": "タグ", "tags": "work"},
+            {"date": "2024-04-01", "title": "気分", "mood": 3},
+            {"date": "2024-04-01", "title": "更新日時", "last_modified": 0},
+            {"date": "2024-04-01", "title": 5},
+            {"date": "2024-04-01", "title": "正しい行", "content": "<p>x</p>", "tags": ["work"]},
+        ])
+
+        result = self.store.bulk_import([path])
+
+        self.assertEqual(result["errors"], 5)
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(self.store.read_entry("2024-04-01_正しい行")["tags"], ["work"])
+
+    def test_metadata_reloaded_during_import_keeps_imported_tags(self):
+        first = self.write_jsonl("first.jsonl", [{"date": "2024-07-01", "title": "一件目", "tags": ["一件目のタグ"]}])
+        second = self.write_jsonl("second.jsonl", [{"date": "2024-07-02", "title": "二件目", "tags": ["二件目のタグ"],
+                                                    "id": "2024-07-02_二件目", "favorite": True}])
+        other = DiaryStore(self.diary_folder)
+
+        def on_progress(done, total):
+            # インポート中に他のインスタンスがメタデータを保存し、GUIのイベント処理で索引を読み直す
+            if done == 1:
+                other.metadata["tags"].append("他のタグ")
+                other.save_metadata()
+                self.store.refresh(force=True)
+
+        batch_size = diary_core.BULK_IMPORT_BATCH_SIZE
+        diary_core.BULK_IMPORT_BATCH_SIZE = 1
+        try:
+            self.store.bulk_import([first, second], on_progress)
+        finally:
+            diary_core.BULK_IMPORT_BATCH_SIZE = batch_size
+
+        saved = DiaryStore(self.diary_folder).metadata
+        for tag in ("一件目のタグ", "他のタグ", "二件目のタグ"):
+            self.assertIn(tag, saved["tags"])
+        self.assertIn("2024-07-02_二件目", saved["favorites"])
+
+    def test_invalid_dates_fall_back_to_file_date(self):
+        path = self.write_jsonl("2024年3月4日.jsonl", [
+            {"date": "../../escaped", "title": "pwn"},
+            {"date": 20240101, "title": "数値の日付"},
+        ])
+
+        result = self.store.bulk_import([path])
+
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(len(self.store.entries_on_date("2024-03-04")), 2)
+        self.assertEqual(self.root_files(), ["2024年3月4日.jsonl"])
+
+
+if __name__ == '__main__':
+    unittest.main()
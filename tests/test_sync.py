@@ -0,0 +1,100 @@
+"""
+日記フォルダの同期（diary_sync）の回帰テスト
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diary_core import DiaryStore  # noqa: E402
+from diary_sync import sync_folders, folder_id  # noqa: E402
+
+
+class SyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.root = self._temp_dir.name
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def open_store(self, name):
+        return DiaryStore(os.path.join(self.root, name))
+
+    def entry_keys(self, store):
+        return [record["file_key"] for record in store.entries()]
+
+
+class FolderIdentityTest(SyncTestCase):
+
+    def test_folder_copied_from_synced_folder_can_sync(self):
+        desk = self.open_store("desk")
+        nas = self.open_store("nas")
+        desk.save_entry("2024-06-01", "机", "<p>デスクトップ</p>", "普通", [])
+        sync_folders(desk, nas)
+        shutil.copytree(nas.diary_folder, os.path.join(self.root, "laptop"))
+        laptop = self.open_store("laptop")
+        laptop.save_entry("2024-06-02", "ノート", "<p>ノートPC</p>", "普通", [])
+
+        result = sync_folders(laptop, nas)
+
+        self.assertEqual(result["to_remote"], ["2024-06-02_ノート"])
+        self.assertEqual(result["conflicts"], [])
+        self.assertNotEqual(folder_id(laptop), folder_id(nas))
+        nas = self.open_store("nas")
+        self.assertEqual(self.entry_keys(nas), ["2024-06-01_机", "2024-06-02_ノート"])
+
+        result = sync_folders(desk, nas)
+        self.assertEqual(result["to_local"], ["2024-06-02_ノート"])
+        self.assertEqual(result["conflicts"], [])
+
+    def test_same_folder_through_symlink_is_rejected(self):
+        desk = self.open_store("desk")
+        os.symlink(desk.diary_folder, os.path.join(self.root, "link"))
+        link = self.open_store("link")
+
+        with self.assertRaises(ValueError):
+            sync_folders(desk, link)
+
+
+class ImageSyncTest(SyncTestCase):
+
+    def write_image(self, store, name, content, mtime):
+        os.makedirs(store.images_folder, exist_ok=True)
+        path = os.path.join(store.images_folder, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def read_images(self, store):
+        images = {}
+        for name in sorted(os.listdir(store.images_folder)):
+            with open(os.path.join(store.images_folder, name), 'rb') as f:
+                images[name] = f.read()
+        return images
+
+    def test_differing_images_keep_newer_and_conflict_copy(self):
+        desk = self.open_store("desk")
+        laptop = self.open_store("laptop")
+        self.write_image(desk, "photo.png", b"old", 1_700_000_000)
+        self.write_image(laptop, "photo.png", b"new", 1_700_000_100)
+
+        result = sync_folders(desk, laptop)
+
+        self.assertEqual(result["image_conflicts"], ["photo.png"])
+        copy_name = result["image_conflict_copies"][0]
+        self.assertTrue(copy_name.startswith("photo-conflict-") and copy_name.endswith(".png"))
+        for store in (desk, laptop):
+            self.assertEqual(self.read_images(store), {"photo.png": b"new", copy_name: b"old"})
+
+        result = sync_folders(laptop, desk)
+        self.assertEqual(result["image_conflicts"], [])
+        self.assertEqual(result["images_to_local"] + result["images_to_remote"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()